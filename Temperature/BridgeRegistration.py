@@ -0,0 +1,94 @@
+import os
+import numpy as np
+import cv2
+import pandas as pd
+
+"""
+Registration of the thermal image to the video for the temperature bridge (see TemperatureBridge.py).
+The homography and the arena masks drawn for a session are saved in the session folder, so a session can be
+re-analysed without the GUI. Temperatures for whole tracks are sampled in one call, with bilinear interpolation.
+"""
+
+REGISTRATION_FILE = "Registration.npz"
+FRAMES_PER_MINUTE = 6
+
+
+def save_registration(folder, homography, masks):
+    """
+    :param homography: 3x3 matrix mapping FLIR image coordinates onto video coordinates
+    :param masks: dictionary of mouse number -> arena mask
+    """
+    mouse_numbers = list(masks.keys())
+    np.savez_compressed(os.path.join(folder, REGISTRATION_FILE), homography=homography,
+                        mouse_numbers=np.array(mouse_numbers, dtype=str),
+                        masks=np.array([masks[mouse_number] for mouse_number in mouse_numbers], dtype=np.uint8))
+
+
+def load_registration(folder):
+    """
+    :return: homography, dictionary of mouse number -> arena mask. None if the session hasn't been registered
+    """
+    file_path = os.path.join(folder, REGISTRATION_FILE)
+    if not os.path.exists(file_path):
+        return None
+    return load_registration_file(file_path)
+
+
+def load_registration_file(file_path):
+    with np.load(file_path) as registration:
+        masks = {str(mouse_number): mask for mouse_number, mask in zip(registration["mouse_numbers"], registration["masks"])}
+        return registration["homography"], masks
+
+
+def warp_flir(flir, homography, shape):
+    """FLIR image in video coordinates. shape is the video frame's (height, width)"""
+    return cv2.warpPerspective(flir, homography, (shape[1], shape[0]), borderMode=cv2.BORDER_REPLICATE)
+
+
+def bilinear_sample(image, xs, ys):
+    """
+    :param image: 2D array
+    :param xs: array of (sub-pixel) column coordinates
+    :param ys: array of (sub-pixel) row coordinates
+    :return: bilinearly interpolated values, with coordinates clamped to the image
+    """
+    xs = np.clip(np.asarray(xs, dtype=float), 0, image.shape[1] - 1)
+    ys = np.clip(np.asarray(ys, dtype=float), 0, image.shape[0] - 1)
+    x0 = np.clip(np.floor(xs).astype(int), 0, max(image.shape[1] - 2, 0))
+    y0 = np.clip(np.floor(ys).astype(int), 0, max(image.shape[0] - 2, 0))
+    x1 = np.minimum(x0 + 1, image.shape[1] - 1)
+    y1 = np.minimum(y0 + 1, image.shape[0] - 1)
+    dx, dy = xs - x0, ys - y0
+    top = image[y0, x0] * (1 - dx) + image[y0, x1] * dx
+    bottom = image[y1, x0] * (1 - dx) + image[y1, x1] * dx
+    return top * (1 - dy) + bottom * dy
+
+
+def track_temperatures(warped_flir, positions):
+    """
+    :param warped_flir: FLIR image in video coordinates (see warp_flir)
+    :param positions: dictionary of mouse number -> (N, 2) array of (x, y) positions
+    :return: dictionary of mouse number -> array of the temperature under the mouse at each position
+    """
+    mouse_numbers = list(positions.keys())
+    if len(mouse_numbers) == 0:
+        return {}
+    all_positions = np.concatenate([np.asarray(positions[m], dtype=float).reshape(-1, 2) for m in mouse_numbers])
+    temperatures = bilinear_sample(warped_flir, all_positions[:, 0], all_positions[:, 1])
+    splits = np.cumsum([len(positions[m]) for m in mouse_numbers])[:-1]
+    return dict(zip(mouse_numbers, np.split(temperatures, splits)))
+
+
+def save_temperature_tables(folder, mouse_temperatures, parquet=False):
+    """
+    Writes "<mouse number>.tsv" of minutes and temperature for each mouse, as read by TemperatureBridgeCompare.
+    With parquet=True a "Temperatures.parquet" with every mouse is written as well (requires pyarrow)
+    """
+    tables = []
+    for mouse_number, temperatures in mouse_temperatures.items():
+        minutes = np.arange(len(temperatures)) / FRAMES_PER_MINUTE
+        np.savetxt(os.path.join(folder, "%s.tsv" % mouse_number), np.column_stack((minutes, temperatures)),
+                   fmt="%.2f", delimiter="\t")
+        tables.append(pd.DataFrame({"Mouse": mouse_number, "Minutes": minutes, "Temperature": temperatures}))
+    if parquet and tables:
+        pd.concat(tables).to_parquet(os.path.join(folder, "Temperatures.parquet"), index=False)
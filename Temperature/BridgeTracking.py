@@ -0,0 +1,311 @@
+import os
+import time
+import multiprocessing
+import numpy as np
+import cv2
+
+"""
+Headless mouse tracking for the temperature bridge timelapses (see TemperatureBridge.py).
+Every arena is cropped to the bounding box of its mask once, so each frame only touches the pixels inside the arenas.
+The mouse is the largest dark blob that differs from the empty-arena background, and its position is the centroid
+(first-order moments) of that blob's pixels, from connected components. The tracking in TemperatureBridge.py used to
+take the moments of the largest contour's outline instead, which counts holes as part of the mouse and can pick a
+different blob when two are about the same size, so positions only approximately match the old ones: the same for
+solid blobs, within a pixel for ragged ones. Debug snapshots are written to disk instead of opening windows.
+The video is split into frame ranges that are decoded and tracked in a process pool, then merged in order.
+
+The background starts as the per-pixel maximum of the first frames, then follows lighting drift as an exponential
+moving average of every UPDATE_INTERVAL-th frame. Pixels that look like a mouse are left out of the update, so a
+resting mouse doesn't fade into the background.
+The video is cut into blocks of BACKGROUND_BLOCK frames, and the background of every block starts again from the first
+frames' maximum, brought up to date over the BACKGROUND_WARMUP frames before the block. Frame ranges are split on
+block boundaries, so the background of every frame, and the positions, are the same however many processes are used.
+"""
+
+BACKGROUND_FRAMES = 100
+DIFFERENCE_THRESHOLD = 75  # Minimum difference from the background
+DARK_THRESHOLD = 60  # Maximum intensity of the mouse
+SNAPSHOT_INTERVAL = 500
+LEARNING_RATE = 0.05
+UPDATE_INTERVAL = 10
+BACKGROUND_BLOCK = 2000  # Frames sharing one running background
+BACKGROUND_WARMUP = 600  # Frames before a block used to bring its background up to date
+JUMP_DISTANCE = 100  # Pixels between consecutive positions counted as a jump
+MINIMUM_FOUND_FRACTION = 0.9
+
+
+class BackgroundModel:
+    def __init__(self, initial, learning_rate=LEARNING_RATE, update_interval=UPDATE_INTERVAL):
+        """
+        :param initial: grayscale image of the empty arenas
+        """
+        self.initial = initial
+        self.image = initial.copy()
+        self.average = initial.astype(np.float32)
+        self.learning_rate = learning_rate
+        self.update_interval = update_interval
+
+    def update(self, frame, frame_index):
+        """
+        :param frame_index: index of the frame in the video. Only every update_interval-th frame of the video is used
+        """
+        if frame_index % self.update_interval != 0:
+            return
+        mouse = (cv2.absdiff(frame, self.image) > DIFFERENCE_THRESHOLD) & (frame <= DARK_THRESHOLD)
+        cv2.accumulateWeighted(frame, self.average, self.learning_rate, mask=(~mouse).view(np.uint8))
+        self.image = cv2.convertScaleAbs(self.average)
+
+    def drift(self):
+        """Mean absolute change (intensity) of the background since the start"""
+        return float(np.mean(cv2.absdiff(self.image, self.initial)))
+
+
+class ArenaCrop:
+    def __init__(self, mouse_number, mask):
+        self.mouse_number = mouse_number
+        rows, columns = np.nonzero(mask)
+        self.top, self.left = rows.min(), columns.min()
+        self.rows = slice(self.top, rows.max() + 1)
+        self.columns = slice(self.left, columns.max() + 1)
+        self.mask = mask[self.rows, self.columns] > 0
+
+    def locate(self, frame, background):
+        """
+        :param frame: full grayscale frame
+        :param background: full grayscale empty arena
+        :return: sub-pixel (x, y) of the mouse in full-frame coordinates, its area and the number of blobs,
+            or None if it wasn't found
+        """
+        frame = frame[self.rows, self.columns]
+        difference = cv2.absdiff(frame, background[self.rows, self.columns])
+        mouse = (difference > DIFFERENCE_THRESHOLD) & (frame <= DARK_THRESHOLD) & self.mask
+        count, _, stats, centroids = cv2.connectedComponentsWithStats(mouse.view(np.uint8), connectivity=8)
+        if count < 2:
+            return None
+        largest = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])
+        cX, cY = centroids[largest]
+        return (cX + self.left, cY + self.top), int(stats[largest, cv2.CC_STAT_AREA]), count - 1
+
+
+class Tracker:
+    def __init__(self, masks, background, snapshot_folder=None, adaptive=True):
+        """
+        :param masks: dictionary of mouse number -> full-frame mask of its arena
+        :param background: grayscale image of the empty arenas
+        :param snapshot_folder: every SNAPSHOT_INTERVAL frames a jpg of the frame and positions is saved here
+        :param adaptive: update the background as the video goes, otherwise it's held fixed
+        """
+        self.arenas = [ArenaCrop(mouse_number, mask) for mouse_number, mask in masks.items()]
+        self.background = BackgroundModel(background)
+        self.next_background = None  # Warming up for the next block
+        self.largest_drift = 0.0
+        self.adaptive = adaptive
+        self.snapshot_folder = snapshot_folder
+        if snapshot_folder is not None:
+            os.makedirs(snapshot_folder, exist_ok=True)
+        self.positions = {arena.mouse_number: [] for arena in self.arenas}
+        self.frame_numbers = {arena.mouse_number: [] for arena in self.arenas}
+        # Per mouse: frames tracked, frames with more than one blob, total area of the mouse
+        self.statistics = {arena.mouse_number: np.zeros(3) for arena in self.arenas}
+
+    def warm_up(self, frame, frame_index):
+        """
+        Brings the background up to date with a frame from before the first block tracked
+        """
+        self.background.update(frame, frame_index)
+
+    def update_background(self, frame, frame_index):
+        """
+        Updates the background with a tracked frame, and starts the next block's background (see above)
+        """
+        self.background.update(frame, frame_index)
+        if frame_index % BACKGROUND_BLOCK == BACKGROUND_BLOCK - BACKGROUND_WARMUP:
+            self.next_background = BackgroundModel(self.background.initial)
+        if self.next_background is not None:
+            self.next_background.update(frame, frame_index)
+        if (frame_index + 1) % BACKGROUND_BLOCK == 0:
+            self.largest_drift = max(self.largest_drift, self.background.drift())
+            if self.next_background is None:
+                self.next_background = BackgroundModel(self.background.initial)
+            self.background, self.next_background = self.next_background, None
+
+    def drift(self):
+        """:return: largest drift of the background of any block tracked"""
+        return max(self.largest_drift, self.background.drift())
+
+    def track(self, frame, frame_number):
+        """
+        :param frame: grayscale frame
+        :param frame_number: 1 for the first frame of the video
+        :return: dictionary of mouse number -> (x, y) for the mice found in this frame
+        """
+        found = {}
+        for arena in self.arenas:
+            statistics = self.statistics[arena.mouse_number]
+            statistics[0] += 1
+            located = arena.locate(frame, self.background.image)
+            if located is not None:
+                position, area, blobs = located
+                statistics[1] += blobs > 1
+                statistics[2] += area
+                found[arena.mouse_number] = position
+                self.positions[arena.mouse_number].append(position)
+                self.frame_numbers[arena.mouse_number].append(frame_number)
+        if self.adaptive:
+            self.update_background(frame, frame_number - 1)
+        if self.snapshot_folder is not None and frame_number % SNAPSHOT_INTERVAL == 0:
+            save_snapshot(os.path.join(self.snapshot_folder, "%06i.jpg" % frame_number), frame, found.values())
+        return found
+
+
+def tracking_quality(positions, frame_numbers, statistics, drift):
+    """
+    :param positions: mouse number -> list of (x, y)
+    :param frame_numbers: mouse number -> frame number of each position
+    :param statistics: mouse number -> Tracker.statistics
+    :param drift: largest background drift of any block of the video
+    :return: mouse number -> dictionary of quality metrics
+    """
+    quality = {}
+    for mouse_number, position in positions.items():
+        frames, multiple_blobs, total_area = statistics[mouse_number]
+        position = np.array(position, dtype=float).reshape(-1, 2)
+        steps = np.linalg.norm(np.diff(position, axis=0), axis=1)
+        gaps = np.diff(frame_numbers[mouse_number])
+        quality[mouse_number] = {"Frames": int(frames),
+                                 "Found fraction": len(position) / max(frames, 1),
+                                 "Multiple blob fraction": multiple_blobs / max(len(position), 1),
+                                 "Mean area": total_area / max(len(position), 1),
+                                 "Jumps": int(np.sum(steps > JUMP_DISTANCE)),
+                                 "Longest gap": int(np.max(gaps, initial=0)),
+                                 "Background drift": drift}
+    return quality
+
+
+def save_tracking_quality(file_path, quality):
+    with open(file_path, "w") as f:
+        columns = list(next(iter(quality.values())).keys()) if quality else []
+        f.write(",".join(["Mouse"] + columns) + "\n")
+        for mouse_number, metrics in quality.items():
+            f.write(",".join([mouse_number] + ["%.4g" % metrics[column] for column in columns]) + "\n")
+            if metrics["Found fraction"] < MINIMUM_FOUND_FRACTION:
+                print("Warning: %s was only found in %.0f%% of frames" % (mouse_number, 100 * metrics["Found fraction"]))
+
+
+def save_snapshot(file_path, frame, positions):
+    snapshot = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    for cX, cY in positions:
+        cv2.circle(snapshot, (int(cX), int(cY)), 4, (0, 0, 255), -1)
+    cv2.imwrite(file_path, snapshot)
+
+
+def read_background(video_file_path, number_of_frames=BACKGROUND_FRAMES):
+    """Per-pixel maximum of the first frames, when the mice are (mostly) somewhere else"""
+    vs = cv2.VideoCapture(video_file_path)
+    background = None
+    for _ in range(number_of_frames):
+        frame = vs.read()[1]
+        if frame is None:
+            break
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        background = frame if background is None else np.maximum(background, frame)
+    vs.release()
+    return background
+
+
+def track_frame_range(video_file_path, masks, background, start, stop, snapshot_folder, adaptive=True):
+    """
+    Tracks frames [start, stop) of the video (stop=None reads to the end). Run in a worker process
+    :param start: first frame of a block (a multiple of BACKGROUND_BLOCK), see above
+    :return: start, positions, frame numbers and statistics per mouse, largest background drift,
+        number of frames read, seconds taken
+    """
+    start_time = time.time()
+    tracker = Tracker(masks, background, snapshot_folder, adaptive)
+    vs = cv2.VideoCapture(video_file_path)
+    frame_index = max(start - BACKGROUND_WARMUP, 0) if adaptive else start
+    if frame_index > 0:
+        vs.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+    while frame_index < start:
+        frame = vs.read()[1]
+        if frame is None:
+            break
+        tracker.warm_up(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), frame_index)
+        frame_index += 1
+    while stop is None or frame_index < stop:
+        frame = vs.read()[1]
+        if frame is None:
+            break
+        frame_index += 1
+        tracker.track(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), frame_index)
+    vs.release()
+    return (start, tracker.positions, tracker.frame_numbers, tracker.statistics, tracker.drift(),
+            frame_index - start, time.time() - start_time)
+
+
+def split_frames(video_file_path, number_of_chunks):
+    """
+    :return: list of (start, stop) frame ranges, split on background blocks. The last range is open-ended, since the
+        container's frame count isn't always exact
+    """
+    vs = cv2.VideoCapture(video_file_path)
+    frame_count = int(vs.get(cv2.CAP_PROP_FRAME_COUNT))
+    vs.release()
+    if frame_count <= 0:
+        return [(0, None)]
+    boundaries = np.linspace(0, frame_count, number_of_chunks + 1)
+    boundaries = (np.round(boundaries / BACKGROUND_BLOCK) * BACKGROUND_BLOCK).astype(int)
+    boundaries = np.unique(boundaries)
+    if len(boundaries) < 2:
+        return [(0, None)]
+    ranges = [(int(a), int(b)) for a, b in zip(boundaries[:-1], boundaries[1:])]
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+
+def find_mouse_position(video_file_path, masks, snapshot_folder=None, processes=None, adaptive=True):
+    """
+    :param masks: dictionary of mouse number -> full-frame mask of its arena
+    :param snapshot_folder: defaults to a "Tracking" folder next to the video.
+        The background, periodic snapshots and "Tracking Quality.csv" are saved here
+    :param processes: number of worker processes, defaults to the number of CPUs
+    :param adaptive: follow lighting drift with a running background
+    :return: dictionary of mouse number -> (N, 2) array of positions, for the frames the mouse was found in
+    """
+    if len(masks.items()) == 0:
+        return None
+    if snapshot_folder is None:
+        snapshot_folder = os.path.join(os.path.dirname(video_file_path), "Tracking")
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    background = read_background(video_file_path)
+    os.makedirs(snapshot_folder, exist_ok=True)
+    cv2.imwrite(os.path.join(snapshot_folder, "Background.jpg"), background)
+
+    start_time = time.time()
+    jobs = [(video_file_path, masks, background, start, stop, snapshot_folder, adaptive)
+            for start, stop in split_frames(video_file_path, processes)]
+    if processes == 1:
+        # Also lets sessions be tracked inside another process pool (see TemperatureBridgeBatch.py)
+        results = [track_frame_range(*job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(track_frame_range, jobs)
+    results = sorted(results, key=lambda x: x[0])
+
+    positions = {mouse_number: [] for mouse_number in masks}
+    frame_numbers = {mouse_number: [] for mouse_number in masks}
+    statistics = {mouse_number: np.zeros(3) for mouse_number in masks}
+    total_frames = 0
+    for start, chunk_positions, chunk_frame_numbers, chunk_statistics, _, number_of_frames, elapsed in results:
+        print("Frames %i-%i: %.1f frames/s" % (start + 1, start + number_of_frames, number_of_frames / max(elapsed, 1e-9)))
+        total_frames += number_of_frames
+        for mouse_number in masks:
+            positions[mouse_number].extend(chunk_positions[mouse_number])
+            frame_numbers[mouse_number].extend(chunk_frame_numbers[mouse_number])
+            statistics[mouse_number] += chunk_statistics[mouse_number]
+    print("%s: %i frames in %.1f s (%.1f frames/s)" % (os.path.basename(video_file_path), total_frames, time.time() - start_time,
+                                                    total_frames / max(time.time() - start_time, 1e-9)))
+    quality = tracking_quality(positions, frame_numbers, statistics, drift=max(result[4] for result in results))
+    save_tracking_quality(os.path.join(snapshot_folder, "Tracking Quality.csv"), quality)
+    return {mouse_number: np.array(position, dtype=float).reshape(-1, 2) for mouse_number, position in positions.items()}
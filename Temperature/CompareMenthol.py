@@ -1,4 +1,4 @@
-import StressTest, DisplayLoggedTemperature
+import StressTest, DisplayLoggedTemperature, TemperatureArrays
 import numpy as np
 import matplotlib.pyplot as plt
 import glob
@@ -105,29 +105,6 @@ def read_keyfile(key_file):
     return all_mouse_numbers
 
 
-def create_relative_temperatures(temperatures, start, relative_temp=False):
-    import math
-    delta_temperature_at_start = 0
-    for dt, temp in temperatures:
-        delta_temperature_at_start = temp
-        if dt > start:
-            break
-    relative_times = []
-    relative_temperatures = []
-    for dt, temp in temperatures:
-        if math.isnan(temp):
-            continue
-        if dt < start:
-            relative_times.append(-1 * (start - dt).seconds / 3600)
-        else:
-            relative_times.append((dt - start).seconds / 3600)
-        if relative_temp:
-            relative_temperatures.append(temp - delta_temperature_at_start)
-        else:
-            relative_temperatures.append(temp)
-    return relative_times, relative_temperatures, delta_temperature_at_start
-
-
 def wobble_plot(dict):
     """
     :param dict: Ex: dict['Vglut2 Cas3'] = [(18, _), (19, _), (18.5, _)], dict['Vglut2 mCh'] = [(17, _)]
@@ -245,7 +222,7 @@ def plot(mouse_data):
         if not received_drug and not received_control:
             print("Mouse %s has no tests on %s" % (mouse_datum.number, date))
             continue
-        core_times, core_temperatures, baseline_temp = create_relative_temperatures(core_temperatures, mouse_datum.drug_start if received_drug else mouse_datum.control_start, relative_temp=False)
+        core_times, core_temperatures, baseline_temp = TemperatureArrays.create_relative_temperatures(*TemperatureArrays.to_arrays(core_temperatures), mouse_datum.drug_start if received_drug else mouse_datum.control_start, relative_temp=False)
         if received_drug not in temperatures:
             temperatures[received_drug] = {}
         if mouse_datum.vector not in temperatures[received_drug]:
@@ -1,4 +1,4 @@
-import StressTest, DisplayLoggedTemperature
+import DisplayLoggedTemperature, TemperatureArrays, ElitechNormalize
 import numpy as np
 import matplotlib.pyplot as plt
 import glob
@@ -149,29 +149,6 @@ def read_keyfile(key_file):
     return all_mouse_numbers
 
 
-def create_relative_temperatures(temperatures, start, relative_temp=False):
-    import math
-    delta_temperature_at_start = 0
-    for dt, temp in temperatures:
-        delta_temperature_at_start = temp
-        if dt > start:
-            break
-    relative_times = []
-    relative_temperatures = []
-    for dt, temp in temperatures:
-        if math.isnan(temp):
-            continue
-        if dt < start:
-            relative_times.append(-1 * (start - dt).seconds / 3600)
-        else:
-            relative_times.append((dt - start).seconds / 3600)
-        if relative_temp:
-            relative_temperatures.append(temp - delta_temperature_at_start)
-        else:
-            relative_temperatures.append(temp)
-    return relative_times, relative_temperatures, delta_temperature_at_start
-
-
 def wobble_plot(dict, ax, func):
     """
     :param dict: Ex: dict['Vglut2] = {'Cas3': Mouse1, Mouse2, Mouse3}, {'mCh': Mouse4}
@@ -296,6 +273,7 @@ def scatter_plot(dict, time, str_time):
 def plot_condition(mouse_data, trial_type):
     temperatures = {}
     f = open(r"R:\Fillan\Parabrachial Ablations\Temperature\Temperature at Times.csv", 'w')
+    mouse_datums, start_times, core_records, env_records = [], [], [], []
     for core_file in glob.glob(os.path.join(root_folder, "*", "%s *" % TrialType.get_str(trial_type), "Core *.csv")):
         folder = os.path.dirname(core_file)
         mouse_number = os.path.basename(core_file).split(" ")[1][:-4]
@@ -306,25 +284,32 @@ def plot_condition(mouse_data, trial_type):
         if not os.path.exists(env_file):
             print("Couldn't find environmental file for %s" % core_file)
             continue
-        env_temperatures = StressTest.read_elitech_file(env_file)
+        env_times, env_temperatures = ElitechNormalize.load(env_file)
         if trial_type == TrialType.Hot:
-            for dt, temp in env_temperatures:
-                if temp > 34:
-                    break
-            else:
+            if not np.any(env_temperatures > 34):
                 print("%s didn't get hot enough" % mouse_number)
                 #continue
         temps = DisplayLoggedTemperature.temperatures_from_file(core_file)
         core_temperatures = DisplayLoggedTemperature.average_temperatures(temps)
         date = core_temperatures[0][0].date()
         start_time = datetime.datetime.combine(date, mouse_datum.start[trial_type].time())
-        core_times, core_temperatures, baseline_temp = create_relative_temperatures(core_temperatures, start_time, relative_temp=True)
-        env_times, env_temperatures, _ = create_relative_temperatures(env_temperatures, start_time, relative_temp=False)
+        mouse_datums.append(mouse_datum)
+        start_times.append(start_time)
+        core_records.append(TemperatureArrays.to_arrays(core_temperatures))
+        env_records.append((env_times, env_temperatures))
+
+    # The whole condition is converted to relative temperatures at once
+    core_times, core_temperatures, baseline_temps = TemperatureArrays.create_relative_temperatures(
+        *TemperatureArrays.stack_records(core_records), start_times, relative_temp=True)
+    env_times, env_temperatures, _ = TemperatureArrays.create_relative_temperatures(
+        *TemperatureArrays.stack_records(env_records), start_times, relative_temp=False)
+    for i, mouse_datum in enumerate(mouse_datums):
         if mouse_datum.genotype not in temperatures:
             temperatures[mouse_datum.genotype] = {}
         if mouse_datum.vector not in temperatures[mouse_datum.genotype]:
             temperatures[mouse_datum.genotype][mouse_datum.vector] = []
-        temperatures[mouse_datum.genotype][mouse_datum.vector].append(Mouse(env_times, env_temperatures, core_times, core_temperatures, baseline_temp))
+        temperatures[mouse_datum.genotype][mouse_datum.vector].append(
+            Mouse(env_times[i], env_temperatures[i], core_times[i], core_temperatures[i], baseline_temps[i]))
 
     slopes = []
     intercepts = []
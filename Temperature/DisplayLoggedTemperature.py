@@ -5,6 +5,8 @@ import matplotlib.dates as mdates
 import glob
 import os
 import collections
+import TemperatureArrays
+import TemperatureViewer
 
 
 def normal(x, o):
@@ -67,10 +69,13 @@ def average_temperatures(temperatures):
 
 if __name__ == "__main__":
     file_directory = r"R:\Fillan\Parabrachial Ablations\Temperature\5864 5865\3 mg kg 6 27 22"
-    temperatures = []
+    fig, ax = plt.subplots()
+    ax.xaxis_date()
+    # Long records are plotted at the resolution of the current zoom, see TemperatureViewer
+    line_hover = TemperatureViewer.LineHover(fig)
     for file in glob.glob(os.path.join(file_directory, "*.csv")):
-        core_temperatures = np.array(average_temperatures(temperatures_from_file(file)))
-        plt.plot(core_temperatures[:, 0], core_temperatures[:, 1], label=file)
-    plt.plot([datetime.datetime(year=2022, month=6, day=27, hour=13, minute=52), datetime.datetime(year=2022, month=6, day=27, hour=13, minute=52)], [20, 40], 'k', label="CNO 3mg/kg")
-    plt.legend()
+        times, values = TemperatureArrays.to_arrays(average_temperatures(temperatures_from_file(file)))
+        line_hover.add_line(TemperatureViewer.PyramidLine(ax, times, values, label=file))
+    ax.plot([datetime.datetime(year=2022, month=6, day=27, hour=13, minute=52), datetime.datetime(year=2022, month=6, day=27, hour=13, minute=52)], [20, 40], 'k', label="CNO 3mg/kg")
+    ax.legend()
     plt.show()
\ No newline at end of file
@@ -0,0 +1,207 @@
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import re
+import warnings
+import numpy as np
+from EnvironmentalStore import DTYPE
+
+"""
+Normalizes the environmental temperatures exported from the Elitech RC-4 units.
+Sometimes a unit gets the wrong time, so every reading in its export is off by a constant amount, and units can need
+a calibration (corrected = scale * reading + offset). Each export "<name>.txt" is parsed in one pass, corrected, and
+saved next to it as "<name>.npy" in the EnvironmentalStore format, which the analyses load with load().
+Corrections are kept in "Elitech Corrections.csv" in the root directory, which is read on every run:
+    File,Elitech Time,Correct Time,Scale,Offset
+    Control 11 1 22/Elitech 6317.txt,11/01/22 10:02,11/01/22 10:00,,
+where File can be a glob relative to the root, times are "%m/%d/%y %H:%M" and empty fields mean no correction.
+Running with -i, -e and -t adds the clock correction of that one file to it, as UpdateTimes.py used to correct one
+file. Another csv can be given with -c, and takes precedence for the files it lists.
+A manifest in the root directory records the source and corrections behind every output, so files are only
+re-normalized when their export or their correction changes. A file that no csv lists keeps the correction in the
+manifest, so a run without the corrections never undoes them. To drop a correction, list the file with empty fields.
+"""
+
+MANIFEST_FILE = "Elitech Manifest.json"
+CORRECTIONS_FILE = "Elitech Corrections.csv"
+CORRECTIONS_HEADER = "File,Elitech Time,Correct Time,Scale,Offset\n"
+TIME_FORMAT = "%m/%d/%y %H:%M"
+LINE_PATTERN = re.compile(r"^\s*\d+\s+(\d{1,2})/(\d{1,2})/(\d{4}) (\d{1,2}):(\d{2}):(\d{2}) ([AP])M\s+(-?\d+(?:\.\d+)?)\s*$")
+
+
+class Correction:
+    def __init__(self, clock_offset=datetime.timedelta(0), scale=1.0, offset=0.0):
+        """
+        :param clock_offset: correct time - Elitech time
+        """
+        self.clock_offset = clock_offset
+        self.scale = scale
+        self.offset = offset
+
+    def key(self):
+        """JSON-friendly description, stored in the manifest"""
+        return [self.clock_offset.total_seconds(), self.scale, self.offset]
+
+
+def correction_from_key(key):
+    """:return: the Correction described by Correction.key()"""
+    return Correction(datetime.timedelta(seconds=key[0]), key[1], key[2])
+
+
+def clock_offset(elitech_time, correct_time):
+    return datetime.datetime.strptime(correct_time, TIME_FORMAT) - datetime.datetime.strptime(elitech_time, TIME_FORMAT)
+
+
+def read_elitech_records(file_path, correction=None):
+    """
+    Parses an Elitech export line by line. Lines that aren't readings (the header, blank lines) are skipped
+    :return: structured array with EnvironmentalStore.DTYPE, sorted by time
+    """
+    fields = []
+    with open(file_path) as f:
+        for line in f:
+            match = LINE_PATTERN.match(line)
+            if match is not None:
+                fields.append(match.groups())
+    records = np.empty(len(fields), dtype=DTYPE)
+    if len(fields) == 0:
+        return records
+    fields = np.array(fields)
+    month, day, year, hour, minute, second = (fields[:, i].astype(int) for i in range(6))
+    hour = hour % 12 + np.where(fields[:, 6] == "P", 12, 0)
+    dates = (year - 1970).astype("datetime64[Y]") + (month - 1).astype("timedelta64[M]")
+    records["time"] = (dates.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]")
+                       + (hour * 3600 + minute * 60 + second).astype("timedelta64[s]"))
+    records["temperature"] = fields[:, 7].astype(float)
+    if correction is not None:
+        records["time"] += np.timedelta64(correction.clock_offset, "us")
+        records["temperature"] = correction.scale * records["temperature"] + correction.offset
+    return np.sort(records, order="time")
+
+
+def output_path(file_path):
+    return os.path.splitext(file_path)[0] + ".npy"
+
+
+def normalize_file(file_path, correction):
+    np.save(output_path(file_path), read_elitech_records(file_path, correction))
+    return file_path
+
+
+def read_corrections(corrections_file, root_directory):
+    """:return: dictionary of Elitech file path -> Correction"""
+    corrections = {}
+    with open(corrections_file) as f:
+        for line in f:
+            words = [word.strip() for word in line.strip().split(",")]
+            if len(words) < 3 or words[0] == "File":
+                continue
+            elitech_time, correct_time = words[1:3]
+            scale = float(words[3]) if len(words) > 3 and words[3] else 1.0
+            offset = float(words[4]) if len(words) > 4 and words[4] else 0.0
+            delta = clock_offset(elitech_time, correct_time) if elitech_time and correct_time else datetime.timedelta(0)
+            for file_path in glob.glob(os.path.join(root_directory, words[0])):
+                corrections[os.path.normpath(file_path)] = Correction(delta, scale, offset)
+    return corrections
+
+
+def save_clock_correction(root_directory, file_path, elitech_time, correct_time):
+    """
+    Adds the clock correction of one file to the root directory's corrections, replacing any it had
+    """
+    corrections_file = os.path.join(root_directory, CORRECTIONS_FILE)
+    name = os.path.relpath(file_path, root_directory)
+    lines = []
+    if os.path.exists(corrections_file):
+        with open(corrections_file) as f:
+            lines = [line for line in f if line.strip() and line.split(",")[0].strip() not in ("File", name)]
+    lines.append("%s,%s,%s,,\n" % (name, elitech_time, correct_time))
+    with open(corrections_file, "w") as f:
+        f.write(CORRECTIONS_HEADER)
+        f.writelines(lines)
+
+
+def read_manifest(root_directory):
+    manifest_file = os.path.join(root_directory, MANIFEST_FILE)
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def manifest_entry(file_path, correction):
+    return {"mtime": os.path.getmtime(file_path), "size": os.path.getsize(file_path), "correction": correction.key()}
+
+
+def normalize_directory(root_directory, corrections=None, processes=None, force=False):
+    """
+    Normalizes every "Elitech *.txt" under root_directory whose export or correction changed since the manifest
+    was written
+    :param corrections: dictionary of file path -> Correction, over the root directory's corrections. Files in neither
+        keep the correction they had in the manifest, and are only parsed if they never had one
+    :return: list of the files that were (re-)normalized
+    """
+    corrections_file = os.path.join(root_directory, CORRECTIONS_FILE)
+    saved_corrections = read_corrections(corrections_file, root_directory) if os.path.exists(corrections_file) else {}
+    saved_corrections.update(corrections or {})
+    manifest = read_manifest(root_directory)
+    jobs, entries = [], {}
+    for file_path in sorted(glob.glob(os.path.join(root_directory, "**", "Elitech *.txt"), recursive=True)):
+        file_path = os.path.normpath(file_path)
+        name = os.path.relpath(file_path, root_directory)
+        if file_path in saved_corrections:
+            correction = saved_corrections[file_path]
+        elif name in manifest:
+            correction = correction_from_key(manifest[name]["correction"])
+        else:
+            correction = Correction()
+        entries[name] = manifest_entry(file_path, correction)
+        if force or manifest.get(name) != entries[name] or not os.path.exists(output_path(file_path)):
+            jobs.append((file_path, correction))
+    if jobs:
+        with multiprocessing.Pool(processes) as pool:
+            for file_path in pool.starmap(normalize_file, jobs):
+                print(file_path)
+    with open(os.path.join(root_directory, MANIFEST_FILE), "w") as f:
+        json.dump(entries, f, indent=1)
+    return [file_path for file_path, _ in jobs]
+
+
+def load(file_path):
+    """
+    :return: datetime64 array of times and float array of temperatures from an Elitech export, using its normalized
+        .npy if it's up to date. Otherwise the export is parsed without any corrections, with a warning
+    """
+    normalized = output_path(file_path)
+    if os.path.exists(normalized) and os.path.getmtime(normalized) >= os.path.getmtime(file_path):
+        records = np.load(normalized, mmap_mode="r")
+    else:
+        warnings.warn("%s has not been normalized since it changed, so it's read without its corrections. Run "
+                      "ElitechNormalize.py on its directory" % file_path)
+        records = read_elitech_records(file_path)
+    return records["time"], records["temperature"]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-d", "--directory", required=True, help="Root directory, searched recursively for Elitech *.txt exports")
+    ap.add_argument("-c", "--corrections", default=None, help="csv of corrections (see above)")
+    ap.add_argument("-i", "--input_file_path", default=None, help="Elitech export that -e and -t correct")
+    ap.add_argument("-e", "--elitech_time", default=None, help="Time from the Elitech device")
+    ap.add_argument("-t", "--correct_time", default=None, help="Correct time")
+    ap.add_argument("-p", "--processes", type=int, default=None, help="Files normalized at once")
+    ap.add_argument("-f", "--force", action="store_true", help="Re-normalize every file")
+    args = vars(ap.parse_args())
+
+    if args["elitech_time"] or args["correct_time"]:
+        if not (args["elitech_time"] and args["correct_time"] and args["input_file_path"]):
+            ap.error("-e and -t are both needed, with -i for the file they correct")
+        save_clock_correction(args["directory"], args["input_file_path"], args["elitech_time"], args["correct_time"])
+    corrections = {}
+    if args["corrections"]:
+        corrections.update(read_corrections(args["corrections"], args["directory"]))
+    normalized = normalize_directory(args["directory"], corrections, args["processes"], args["force"])
+    print("%i files normalized" % len(normalized))
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+
+"""
+Time-indexed store for the environmental temperature log downloaded from the SensorPush app.
+The log covers months of recordings, while each trial only needs a few hours of it, so it is parsed once,
+saved next to the csv as a .npy file and memory-mapped on later runs. Trials take their window as a slice (view)
+"""
+
+_stores = {}
+
+DTYPE = np.dtype([("time", "datetime64[us]"), ("temperature", "f8")])
+
+
+class EnvironmentalStore:
+    def __init__(self, records):
+        """
+        :param records: structured array with DTYPE, sorted by time
+        """
+        self.records = records
+        self.times = records["time"]
+        self.temperatures = records["temperature"]
+
+    def between(self, start, end):
+        """
+        :param start: datetime
+        :param end: datetime
+        :return: times and temperatures strictly between start and end, as views into the store
+        """
+        start_index = np.searchsorted(self.times, np.datetime64(start, "us"), side="right")
+        end_index = np.searchsorted(self.times, np.datetime64(end, "us"), side="left")
+        return self.times[start_index:end_index], self.temperatures[start_index:end_index]
+
+
+def read_sensorpush_file(file_path):
+    times, temperatures = [], []
+    with open(file_path) as f:
+        reading_header = True
+        for line in f:
+            if reading_header:
+                reading_header = False
+                continue
+            time, temperature, humidity = line.split(",")
+            times.append(time[1:-1])
+            temperatures.append(float(temperature[1:-1]))
+    records = np.empty(len(times), dtype=DTYPE)
+    records["time"] = np.array(times, dtype="datetime64[us]")
+    records["temperature"] = temperatures
+    return np.sort(records, order="time")
+
+
+def load(file_path):
+    """
+    Returns the store for file_path, parsing the csv only if it's newer than its .npy cache
+    """
+    if file_path in _stores:
+        return _stores[file_path]
+    cache_file = os.path.splitext(file_path)[0] + ".npy"
+    if not os.path.exists(cache_file) or os.path.getmtime(cache_file) < os.path.getmtime(file_path):
+        np.save(cache_file, read_sensorpush_file(file_path))
+    _stores[file_path] = EnvironmentalStore(np.load(cache_file, mmap_mode="r"))
+    return _stores[file_path]
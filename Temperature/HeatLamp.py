@@ -25,69 +25,45 @@ These files should be saved together in a folder, with the mouse's number first,
 6001 2 28 22 12 00.txt
 """
 TOTAL_DAYS = 7
+SESSION_MINUTES = 120  # Pokes are only counted if they end within this many minutes of the start
+CORRECT_CHANNELS = ("1", "3")
+CORRECT, INCORRECT = 0, 1
+HOT_DAYS = [0]
+COLD_DAYS = [4]
+CACHE_FILE = "Pokes.npz"
 
 
-class OneDayData:
-    def __init__(self):
-        self.null = False
-        self.pokes = [0, 0]
-        self.time_on = [0, 0]
+class PokeCube:
+    """
+    Every poke file of a cohort, parsed once. Values are indexed by (mouse, day, channel), where channel is CORRECT
+    or INCORRECT, so summaries are array reductions over mice and days
+    """
+    def __init__(self, mice, vectors, pokes, time_on, null):
+        self.mice = mice  # Mouse numbers
+        self.vectors = vectors
+        self.pokes = pokes  # Number of pokes
+        self.time_on = time_on  # Minutes the lamp was on
+        self.null = null  # (mouse, day), True for days logged as NULL
 
-    def __iadd__(self, other):
-        assert type(other) == OneDayData
-        self.pokes[0] += other.pokes[0]
-        self.pokes[1] += other.pokes[1]
-        self.time_on[0] += other.time_on[0]
-        self.time_on[1] += other.time_on[1]
-        return self
+    def valid(self, values):
+        """:return: values (indexed by mouse and day first) with NULL days set to NaN"""
+        values = np.asarray(values, dtype=float)
+        null = self.null.reshape(self.null.shape + (1,) * (values.ndim - 2))
+        return np.where(null, np.nan, values)
 
-    def __truediv__(self, other):
-        self.pokes[0] /= other
-        self.pokes[1] /= other
-        self.time_on[0] /= other
-        self.time_on[1] /= other
-        return self
+    def average_over_days(self, days):
+        """
+        :return: pokes and time on, indexed by (mouse, channel), averaged over the non-NULL days in days.
+            NaN for mice with only NULL days
+        """
+        counts = np.sum(~self.null[:, days], axis=1)[:, np.newaxis]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (np.nansum(self.valid(self.pokes)[:, days], axis=1) / counts,
+                    np.nansum(self.valid(self.time_on)[:, days], axis=1) / counts)
 
-
-class MouseData:
-    def __init__(self, mouse, vector):
-        self.mouse = mouse
-        self.vector = vector
-        self.values = []
-        self.average_cold_pokes = None
-        self.average_hot_pokes = None
-        for _ in range(TOTAL_DAYS):
-            self.values.append(OneDayData())
-
-    def input(self, day_number, channel, total_pokes, total_time_on):
-        if total_pokes is None or total_time_on is None:
-            self.values[day_number].null = True
-            return
-        if channel == "1" or channel == "3":
-            self.values[day_number].pokes[0] += total_pokes
-            self.values[day_number].time_on[0] += total_time_on
-        else:
-            self.values[day_number].pokes[1] += total_pokes
-            self.values[day_number].time_on[1] += total_time_on
-
-    def calculate_average_pokes(self):
-        self.average_cold_pokes = OneDayData()
-        number_cold_days = 0
-        for value in [self.values[4]]:#self.values[1:-1]:
-            if not value.null:
-                self.average_cold_pokes += value
-                number_cold_days += 1
-        if number_cold_days >= 1:
-            self.average_cold_pokes = self.average_cold_pokes / number_cold_days
-
-        self.average_hot_pokes = OneDayData()
-        number_hot_days = 0
-        for value in [self.values[0]]:#, self.values[-1]]:
-            if not value.null:
-                self.average_hot_pokes += value
-                number_hot_days += 1
-        if number_hot_days:
-            self.average_hot_pokes = self.average_hot_pokes / number_hot_days
+    def save(self, file_path):
+        np.savez(file_path, mice=np.array(self.mice, dtype=str), vectors=np.array(self.vectors, dtype=str),
+                 pokes=self.pokes, time_on=self.time_on, null=self.null)
 
 
 def file_name_key(a):
@@ -97,6 +73,69 @@ def file_name_key(a):
     return datetime_a
 
 
+def read_poke_file(file_path):
+    """
+    :return: number of pokes and minutes on within SESSION_MINUTES, or None if the file is NULL
+    """
+    with open(file_path) as f:
+        text = f.read()
+    if "NULL" in text:
+        return None
+    bouts = np.array(text.replace(" - ", " ").split(), dtype=float).reshape(-1, 2) / 60
+    counted = bouts[:, 1] < SESSION_MINUTES
+    return np.sum(counted), np.sum(bouts[counted, 1] - bouts[counted, 0])
+
+
+def read_keyfile(keyfile):
+    mice, vectors = [], []
+    with open(keyfile) as f:
+        for line in f:
+            mouse_number, vector = line.strip().split(":")
+            mice.append(mouse_number)
+            vectors.append(vector)
+    return mice, vectors
+
+
+def read_poke_cube(keyfile):
+    """
+    Parses every mouse's poke files. A mouse's files are sorted by their start time and taken two (one per channel)
+    to a day
+    """
+    folder = os.path.dirname(keyfile)
+    mice, vectors = read_keyfile(keyfile)
+    pokes = np.zeros((len(mice), TOTAL_DAYS, 2))
+    time_on = np.zeros((len(mice), TOTAL_DAYS, 2))
+    null = np.zeros((len(mice), TOTAL_DAYS), dtype=bool)
+    for m, mouse_number in enumerate(mice):
+        files = sorted(glob.glob(os.path.join(folder, "%s *.txt" % mouse_number)), key=file_name_key)
+        for i, file in enumerate(files[:2 * TOTAL_DAYS]):
+            print(file)
+            day_number = i // 2
+            channel = CORRECT if os.path.basename(file)[:-4].split(" ")[-1] in CORRECT_CHANNELS else INCORRECT
+            totals = read_poke_file(file)
+            if totals is None:
+                print("NULL")
+                null[m, day_number] = True
+                continue
+            pokes[m, day_number, channel] += totals[0]
+            time_on[m, day_number, channel] += totals[1]
+    return PokeCube(mice, vectors, pokes, time_on, null)
+
+
+def load_poke_cube(keyfile):
+    """
+    Returns the cube for the keyfile's folder, parsing the poke files only if the keyfile, a poke file or the folder
+    is newer than the cached cube
+    """
+    folder = os.path.dirname(keyfile)
+    cache_file = os.path.join(folder, CACHE_FILE)
+    newest = max([os.path.getmtime(folder)] + [os.path.getmtime(f) for f in glob.glob(os.path.join(folder, "*.txt"))])
+    if not os.path.exists(cache_file) or os.path.getmtime(cache_file) < newest:
+        read_poke_cube(keyfile).save(cache_file)
+    with np.load(cache_file) as cube:
+        return PokeCube(list(cube["mice"]), list(cube["vectors"]), cube["pokes"], cube["time_on"], cube["null"])
+
+
 def error_bar(ax, x, y, yerr, color, label=None):
     ax.plot(x, y, color, label=label)
     lower = [i - j for i, j in zip(y, yerr)]
@@ -111,21 +150,21 @@ def get_color(genotype):
         return "lightgrey"
 
 
-def dot_plot(mice, func, ylabel):
+def dot_plot(cube, func, ylabel):
+    """
+    :param func: function of pokes and time on (indexed by channel last), e.g. lambda pokes, time_on: pokes[..., 0]
+    """
+    hot_values = func(*cube.average_over_days(HOT_DAYS))
+    cold_values = func(*cube.average_over_days(COLD_DAYS))
     genotypes = {}
-    for mouse in mice:
-        if mouse.vector == "WT":
+    for mouse, vector, hot_value, cold_value in zip(cube.mice, cube.vectors, hot_values, cold_values):
+        if vector == "WT":
             continue
-        hot_string = "%s+Hot" % mouse.vector
-        cold_string = "%s+Cold" % mouse.vector
-        if hot_string not in genotypes:
-            genotypes[hot_string] = {}
-        if mouse.mouse not in genotypes[hot_string]:
-            genotypes[hot_string][mouse.mouse] = func(mouse.average_hot_pokes)
-        if cold_string not in genotypes:
-            genotypes[cold_string] = {}
-        if mouse.mouse not in genotypes[cold_string]:
-            genotypes[cold_string][mouse.mouse] = func(mouse.average_cold_pokes)
+        for genotype, value in (("%s+Hot" % vector, hot_value), ("%s+Cold" % vector, cold_value)):
+            if genotype not in genotypes:
+                genotypes[genotype] = {}
+            if not np.isnan(value) and mouse not in genotypes[genotype]:
+                genotypes[genotype][mouse] = value
     labels = []
     last_genotype = None
     fig, ax = plt.subplots(nrows=2, gridspec_kw={"height_ratios": [1, 6]})
@@ -160,7 +199,8 @@ def dot_plot(mice, func, ylabel):
                 ax[1].scatter(x=x_values[i], y=value, color=get_color(genotype), s=50, zorder=3, **kwargs)
                 total += value
                 count += 1
-        ax[1].hlines(total / count, x_values[i] - 2, x_values[i] + 2, zorder=1)
+        if count:
+            ax[1].hlines(total / count, x_values[i] - 2, x_values[i] + 2, zorder=1)
         last_genotype = genotype
         for j in range(i + 1, len(genotype_list)):
             first_arr = list(genotypes[genotype].values())
@@ -202,48 +242,14 @@ if __name__ == "__main__":
     HEIGHT = 1
     HEIGHT_BUFFER = 0.2
     keyfile = r"R:\Fillan\Parabrachial Ablations\Nose Poke\Keyfile.txt"
-    folder = os.path.dirname(keyfile)
-    mice = []
-    with open(keyfile) as f:
-        for line in f:
-            mouse_number, vector = line.strip().split(":")
-            mice.append(MouseData(mouse_number, vector))
-    for mouse in mice:
-        files = glob.glob(os.path.join(folder, "%s*.txt" % mouse.mouse))
-        files = sorted(files, key=file_name_key)
-        for i, file in enumerate(files):
-            print(file)
-            day_number = i // 2
-            title = os.path.basename(file)[:-4]
-            words = title.split(" ")
-            dt = " ".join(words[1:-2])
-            date = datetime.datetime.strptime(dt, "%b %d %Y %H %M").date()
-            channel = words[-1]
-            trial_start = None
-            total_time_on = 0
-            total_pokes = 0
-            null = False
-            with open(file) as f:
-                for line in f:
-                    if "NULL" in line:
-                        print("NULL")
-                        null = True
-                        mouse.input(day_number, channel, None, None)
-                        break
-                    bout_start, bout_end = line.split(" - ")
-                    bout_start = float(bout_start) / 60
-                    bout_end = float(bout_end) / 60
-                    if bout_end < 120:
-                        total_time_on += (bout_end - bout_start)
-                        total_pokes += 1
-            if not null:
-                mouse.input(day_number, channel, total_pokes, total_time_on)
-        mouse.calculate_average_pokes()
+    cube = load_poke_cube(keyfile)
+    vectors = np.array(cube.vectors)
     trial_labels = ["Total Pokes (Correct - Incorrect)", "Total Time On (Correct - Incorrect)"]
-    trial_functions = [lambda x: x.pokes, lambda x: x.time_on]
+    trial_values = [cube.pokes, cube.time_on]
 
     graph_titles = ["Cas3", "mCh", "WT"]
-    for trial_label, trial_function in zip(trial_labels, trial_functions):
+    for trial_label, values in zip(trial_labels, trial_values):
+        differences = cube.valid(values[..., CORRECT] - values[..., INCORRECT])
         fig, axs = plt.subplots(nrows=len(graph_titles), sharey=True)
         ymin, ymax = 0, 0
         for graph_title, ax in zip(graph_titles, axs):
@@ -252,20 +258,16 @@ if __name__ == "__main__":
             ax.set_title(graph_title)
             ax.plot([-1, TOTAL_DAYS+1], [0, 0], "k-", linewidth=3)
             ax.set_xlim([-0.5, TOTAL_DAYS - 0.5])
+            group = differences[vectors == graph_title]
             for day_number in range(TOTAL_DAYS):
-                active_values = []
-                inactive_values = []
-                for mouse in mice:
-                    if mouse.vector == graph_title:
-                        if not mouse.values[day_number].null:
-                            active_values.append(trial_function(mouse.values[day_number])[0]-trial_function(mouse.values[day_number])[1])
-                            inactive_values.append(0)
+                active_values = group[~np.isnan(group[:, day_number]), day_number]
+                inactive_values = np.zeros(len(active_values))
                 ax.scatter([day_number] * len(active_values), active_values, facecolor='k', edgecolor='k')
                 if len(active_values) > 0:
-                    ax.bar([day_number], [sum(active_values) / len(active_values)], facecolor='none', edgecolor='k', width=1)
+                    ax.bar([day_number], [np.mean(active_values)], facecolor='none', edgecolor='k', width=1)
                 ax.scatter([day_number] * len(inactive_values), inactive_values, facecolor='none', edgecolor='k')
                 if len(inactive_values) > 0:
-                    ax.bar([day_number], [sum(inactive_values) / len(inactive_values)], facecolor='none', edgecolor='k', width=1)
+                    ax.bar([day_number], [np.mean(inactive_values)], facecolor='none', edgecolor='k', width=1)
                 this_y_min, this_y_max = ax.get_ylim()
                 ymin = min(this_y_min, ymin)
                 ymax = max(this_y_max, ymax)
@@ -280,27 +282,18 @@ if __name__ == "__main__":
         plt.show()
 
     colors = ['orangered', 'lightgrey']
+    differences = cube.valid(cube.pokes[..., CORRECT] - cube.pokes[..., INCORRECT])
     fig, ax = plt.subplots()
     for graph_title, color in zip(graph_titles, colors):
-        days, means, stds = [], [], []
-        for day_number in range(TOTAL_DAYS - 2):
-            active_values = []
-            for mouse in mice:
-                if mouse.vector == graph_title:
-                    if not mouse.values[day_number].null:
-                        active_values.append(mouse.values[day_number].pokes[0] - mouse.values[day_number].pokes[1])
-            active_values = np.array(active_values)
-            days.append(day_number)
-            means.append(np.mean(active_values))
-            stds.append(np.std(active_values))
-        error_bar(ax, days, means, stds, color, graph_title)
+        group = differences[vectors == graph_title, :TOTAL_DAYS - 2]
+        days = np.arange(TOTAL_DAYS - 2)
+        error_bar(ax, days, np.nanmean(group, axis=0), np.nanstd(group, axis=0), color, graph_title)
     plt.xlabel("Day")
     plt.ylabel("Correct pokes - incorrect pokes")
     plt.legend()
     plt.show()
 
-    dot_plot(mice, lambda x: x.pokes[0] - x.pokes[1], "Correct - incorrect pokes")
-    dot_plot(mice, lambda x: x.pokes[0], "Correct pokes")
-    dot_plot(mice, lambda x: x.time_on[0] - x.time_on[1], "Correct - incorrect time on")
-    dot_plot(mice, lambda x: x.time_on[0], "Correct time on")
-
+    dot_plot(cube, lambda pokes, time_on: pokes[..., CORRECT] - pokes[..., INCORRECT], "Correct - incorrect pokes")
+    dot_plot(cube, lambda pokes, time_on: pokes[..., CORRECT], "Correct pokes")
+    dot_plot(cube, lambda pokes, time_on: time_on[..., CORRECT] - time_on[..., INCORRECT], "Correct - incorrect time on")
+    dot_plot(cube, lambda pokes, time_on: time_on[..., CORRECT], "Correct time on")
\ No newline at end of file
@@ -1,4 +1,4 @@
-import StressTest, DisplayLoggedTemperature
+import DisplayLoggedTemperature, TemperatureArrays, ElitechNormalize, TemperatureViewer
 import numpy as np
 import matplotlib.pyplot as plt
 import glob
@@ -9,37 +9,6 @@ import time
 from matplotlib import font_manager
 
 
-class Line_Event_Handler:
-    def __init__(self, fig, ax):
-        self.lines = []
-        self.names = []
-        self.ax = ax
-        self.fig = fig
-        self.annot = self.ax.annotate("", xy=(0, 0), xytext=(-20, 20), textcoords="offset points",
-                            bbox=dict(boxstyle="round", fc="w"),
-                            arrowprops=dict(arrowstyle="->"))
-        self.annot.set_visible(False)
-
-    def add_line(self, line):
-        self.lines.append(line)
-
-    def hover(self, event):
-        vis = self.annot.get_visible()
-        if event.inaxes == self.ax:
-            for line in self.lines:
-                cont, ind = line.contains(event)
-                if cont:
-                    self.annot.xy = event.xdata, event.ydata
-                    self.annot.set_text(line.get_label())
-                    self.annot.get_bbox_patch().set_alpha(0.4)
-                    self.annot.set_visible(True)
-                    self.fig.canvas.draw_idle()
-                else:
-                    if vis:
-                        self.annot.set_visible(False)
-                        self.fig.canvas.draw_idle()
-
-
 class Timer:
     def __init__(self):
         self.start_time = None
@@ -151,29 +120,6 @@ def read_keyfile(key_file):
     return all_mouse_numbers
 
 
-def create_relative_temperatures(temperatures, start, relative_temp=False):
-    import math
-    delta_temperature_at_start = 0
-    for dt, temp in temperatures:
-        delta_temperature_at_start = temp
-        if dt > start:
-            break
-    relative_times = []
-    relative_temperatures = []
-    for dt, temp in temperatures:
-        if math.isnan(temp):
-            continue
-        if dt < start:
-            relative_times.append(-1 * (start - dt).seconds / 3600)
-        else:
-            relative_times.append((dt - start).seconds / 3600)
-        if relative_temp:
-            relative_temperatures.append(temp - delta_temperature_at_start)
-        else:
-            relative_temperatures.append(temp)
-    return relative_times, relative_temperatures, delta_temperature_at_start
-
-
 def wobble_plot(dict, ax, func):
     """
     :param dict: Ex: dict['Vglut2 Cas3'] = [(18, _), (19, _), (18.5, _)], dict['Vglut2 mCh'] = [(17, _)]
@@ -251,9 +197,7 @@ def dot_plot(dict, ax):
 def plot_condition(mouse_data, trial_type):
     fig, ax = plt.subplots(nrows=2, sharex=True, gridspec_kw={'height_ratios': [1, 2]})
     plt.subplots_adjust(wspace=0, hspace=0)
-    line_event_handlers = np.empty(ax.shape, dtype=object)
-    for i in range(2):
-        line_event_handlers[i] = Line_Event_Handler(fig, ax[i])
+    line_hover = TemperatureViewer.LineHover(fig)
     baseline_temps = {}
     f = open(r"R:\Fillan\Parabrachial Ablations\Temperature\Temperature at Times.csv", 'w')
     for core_file in glob.glob(os.path.join(root_folder, "*", "%s *" % TrialType.get_str(trial_type), "Core *.csv")):
@@ -269,19 +213,16 @@ def plot_condition(mouse_data, trial_type):
             print("Couldn't find environmental file for %s" % core_file)
             continue
 
-        env_temperatures = StressTest.read_elitech_file(env_file)
+        env_times, env_temperatures = ElitechNormalize.load(env_file)
         if trial_type == TrialType.Hot:
-            for dt, temp in env_temperatures:
-                if temp > 34:
-                    break
-            else:
+            if not np.any(env_temperatures > 34):
                 print("%s didn't get hot enough" % mouse_number)
                 continue
         temps = DisplayLoggedTemperature.temperatures_from_file(core_file)
         core_temperatures = DisplayLoggedTemperature.average_temperatures(temps)
         date = core_temperatures[0][0].date()
         start_time = datetime.datetime.combine(date, mouse_datum.start[trial_type].time())
-        times, temperatures, baseline_temp = create_relative_temperatures(core_temperatures, start_time, relative_temp=True)
+        times, temperatures, baseline_temp = TemperatureArrays.create_relative_temperatures(*TemperatureArrays.to_arrays(core_temperatures), start_time, relative_temp=True)
         delta_temperature_at = {0: 0}
         average_temperature = None
         for i, time in enumerate(times):
@@ -306,13 +247,10 @@ def plot_condition(mouse_data, trial_type):
         if mouse_type not in baseline_temps.keys():
             baseline_temps[mouse_type] = []
         baseline_temps[mouse_type].append((average_temperature, delta_temperature_at[0.75], delta_temperature_at[4]))
-        line, = ax[1].plot(times, temperatures, c=mouse_datum.get_color(), linestyle=mouse_datum.get_linestyle(), label=mouse_datum.number)
-        line_event_handlers[1].add_line(line)
-        fig.canvas.mpl_connect("motion_notify_event", line_event_handlers[1].hover)
-        times, temperatures, _ = create_relative_temperatures(env_temperatures, start_time, relative_temp=False)
-        line, = ax[0].plot(times, temperatures, c=mouse_datum.get_color(), linestyle=mouse_datum.get_linestyle(), label=mouse_datum.number)
-        line_event_handlers[0].add_line(line)
-        fig.canvas.mpl_connect("motion_notify_event", line_event_handlers[0].hover)
+        line_hover.add_line(TemperatureViewer.PyramidLine(ax[1], times, temperatures, c=mouse_datum.get_color(), linestyle=mouse_datum.get_linestyle(), label=mouse_datum.number))
+        times, temperatures, _ = TemperatureArrays.create_relative_temperatures(env_times, env_temperatures, start_time, relative_temp=False)
+        if len(times) > 0:
+            line_hover.add_line(TemperatureViewer.PyramidLine(ax[0], times, temperatures, c=mouse_datum.get_color(), linestyle=mouse_datum.get_linestyle(), label=mouse_datum.number))
     f.close()
     ax[1].set_xlim([-1, 5])
     ax[1].set_ylim([-20, 5])
@@ -6,7 +6,7 @@ from CompareStressTests import read_keyfile, TrialType
 import glob
 import datetime
 import scipy.stats
-import random
+import MovementEpochs
 """
 This program attempts to correlate mouse movement with the temperature change. If the mouse is moving, it's likely
 to have a lot of transitions between valid and invalid temperature readings. We divide the record into epochs,
@@ -29,146 +29,37 @@ if __name__ == "__main__":
 
     control_mice = ["4803", "5089", "5090", "5093", "4978", "5175", "5176"]
     """
-    Plot all cold mice as blue
+    Plot all cold mice as blue, control mice as green and hot mice as red
+    (open markers for control mice, filled markers for ablated mice)
     """
-    control_epochs = []
-    ablation_epochs = []
-    for core_file in glob.glob(os.path.join(root_folder, "*", "Cold *", "Core *.csv")):
-        mouse_number = os.path.basename(core_file).split(" ")[1][:-4]
-        print(mouse_number)
-        start_time = mouse_numbers[mouse_number].start[TrialType.Cold].time()
-        epoch_end = None
-        transitions = 0
-        start_temperature = 0
-        last_temperature = 0
-
-        for line in open(core_file, 'r'):
-            dt, temperature = line.strip().split(",")
-            try:
-                dt = datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M:%S.%f")
-            except ValueError:
-                continue
-            temperature = float(temperature)
-            if dt.time() < start_time:
-                continue
-            if epoch_end is None:
-                epoch_end = dt + epoch_length
-                transitions = 0
-                start_temperature = temperature
-                continue
-            if dt > epoch_end:
-                if temperature < 1e-6:
-                    continue
-                if mouse_number in control_mice:
-                    control_epochs.append((transitions + random.random(), temperature))
-                else:
-                    ablation_epochs.append((transitions + random.random(), temperature))
-                epoch_end = epoch_end + epoch_length
-                transitions = 0
-                start_temperature = temperature
+    colors = {TrialType.Cold: ('#547df0', '#1546cf'),
+              TrialType.Control: ('#41f076', '#04d142'),
+              TrialType.Hot: ('#eb6a3f', '#de3700')}
+    records, starts, mouse_types = [], [], []
+    for trial_type in colors:
+        for core_file in glob.glob(os.path.join(root_folder, "*", "%s *" % TrialType.get_str(trial_type), "Core *.csv")):
+            mouse_number = os.path.basename(core_file).split(" ")[1][:-4]
+            print(mouse_number)
+            times, temperatures = MovementEpochs.read_core_record(core_file)
+            if len(times) == 0:
                 continue
-            if (last_temperature < 1e-6) != (temperature < 1e-6):
-                transitions += 1
-            if start_temperature < 1e-6:
-                start_temperature = temperature
-            last_temperature = temperature
-    control_epochs = np.array(control_epochs)
-    ablation_epochs = np.array(ablation_epochs)
-    plt.scatter(control_epochs[:, 0], control_epochs[:, 1], facecolor='none', edgecolors='#547df0', s=4, alpha=0.3)
-    plt.scatter(ablation_epochs[:, 0], ablation_epochs[:, 1], facecolor='#1546cf', edgecolors='#1546cf', s=4, alpha=0.8)
+            date = times[0].astype(datetime.datetime).date()
+            records.append((times, temperatures))
+            starts.append(datetime.datetime.combine(date, mouse_numbers[mouse_number].start[trial_type].time()))
+            mouse_types.append((trial_type, mouse_number in control_mice))
 
-    "Plot all control mice as green"
-    control_epochs = []
-    ablation_epochs = []
-    for core_file in glob.glob(os.path.join(root_folder, "*", "Control *", "Core *.csv")):
-        mouse_number = os.path.basename(core_file).split(" ")[1][:-4]
-        print(mouse_number)
-        start_time = mouse_numbers[mouse_number].start[TrialType.Cold].time()
-        epoch_end = None
-        transitions = 0
-        start_temperature = 0
-        last_temperature = 0
-
-        for line in open(core_file, 'r'):
-            dt, temperature = line.strip().split(",")
-            try:
-                dt = datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M:%S.%f")
-            except ValueError:
-                continue
-            temperature = float(temperature)
-            if dt.time() < start_time:
-                continue
-            if epoch_end is None:
-                epoch_end = dt + epoch_length
-                transitions = 0
-                start_temperature = temperature
-                continue
-            if dt > epoch_end:
-                if temperature < 1e-6:
-                    continue
-                if mouse_number in control_mice:
-                    control_epochs.append((transitions + random.random(), temperature))
-                else:
-                    ablation_epochs.append((transitions + random.random(), temperature))
-                epoch_end = epoch_end + epoch_length
-                transitions = 0
-                start_temperature = temperature
-                continue
-            if (last_temperature < 1e-6) != (temperature < 1e-6):
-                transitions += 1
-            if start_temperature < 1e-6:
-                start_temperature = temperature
-            last_temperature = temperature
-    control_epochs = np.array(control_epochs)
-    ablation_epochs = np.array(ablation_epochs)
-    plt.scatter(control_epochs[:, 0], control_epochs[:, 1], facecolor='none', edgecolors='#41f076', s=4, alpha=0.3)
-    plt.scatter(ablation_epochs[:, 0], ablation_epochs[:, 1], facecolor='#04d142', edgecolors='#04d142', s=4, alpha=0.8)
-
-    control_epochs = []
-    ablation_epochs = []
-    for core_file in glob.glob(os.path.join(root_folder, "*", "Hot *", "Core *.csv")):
-        mouse_number = os.path.basename(core_file).split(" ")[1][:-4]
-        print(mouse_number)
-        start_time = mouse_numbers[mouse_number].start[TrialType.Cold].time()
-        epoch_end = None
-        transitions = 0
-        start_temperature = 0
-        last_temperature = 0
-
-        for line in open(core_file, 'r'):
-            dt, temperature = line.strip().split(",")
-            try:
-                dt = datetime.datetime.strptime(dt, "%Y-%m-%d %H:%M:%S.%f")
-            except ValueError:
-                continue
-            temperature = float(temperature)
-            if dt.time() < start_time:
-                continue
-            if epoch_end is None:
-                epoch_end = dt + epoch_length
-                transitions = 0
-                start_temperature = temperature
-                continue
-            if dt > epoch_end:
-                if temperature < 1e-6:
-                    continue
-                if mouse_number in control_mice:
-                    control_epochs.append((transitions + random.random(), temperature))
-                else:
-                    ablation_epochs.append((transitions + random.random(), temperature))
-                epoch_end = epoch_end + epoch_length
-                transitions = 0
-                start_temperature = temperature
-                continue
-            if (last_temperature < 1e-6) != (temperature < 1e-6):
-                transitions += 1
-            if start_temperature < 1e-6:
-                start_temperature = temperature
-            last_temperature = temperature
-    control_epochs = np.array(control_epochs)
-    ablation_epochs = np.array(ablation_epochs)
-    plt.scatter(control_epochs[:, 0], control_epochs[:, 1], facecolor='none', edgecolors='#eb6a3f', s=4, alpha=0.3)
-    plt.scatter(ablation_epochs[:, 0], ablation_epochs[:, 1], facecolor='#de3700', edgecolors='#de3700', s=4, alpha=0.8)
+    # Every mouse and trial type in one call, so changing epoch_length is cheap
+    epochs = MovementEpochs.epoch_features(records, starts, epoch_length)
+    epochs = epochs.select(~np.isnan(epochs.end_temperature))
+    epoch_trial_types = np.array([mouse_types[r][0].value for r in epochs.record])
+    epoch_control = np.array([mouse_types[r][1] for r in epochs.record])
+    for trial_type, (control_color, ablation_color) in colors.items():
+        control_epochs = epochs.select((epoch_trial_types == trial_type.value) & epoch_control)
+        ablation_epochs = epochs.select((epoch_trial_types == trial_type.value) & ~epoch_control)
+        plt.scatter(control_epochs.transitions + np.random.random(len(control_epochs)), control_epochs.end_temperature,
+                    facecolor='none', edgecolors=control_color, s=4, alpha=0.3)
+        plt.scatter(ablation_epochs.transitions + np.random.random(len(ablation_epochs)), ablation_epochs.end_temperature,
+                    facecolor=ablation_color, edgecolors=ablation_color, s=4, alpha=0.8)
 
     plt.xlabel("Number of transitions")
     plt.ylabel("Core Temperature (°C)")
@@ -0,0 +1,98 @@
+import numpy as np
+
+"""
+Epoch features of core temperature records. The E-mitter reads 0 when the mouse is out of range of the receiver,
+so a moving mouse has many transitions between valid and invalid readings.
+Records are kept as arrays so any epoch length can be recomputed across every mouse in one call.
+"""
+
+INVALID_TEMPERATURE = 1e-6
+
+
+class EpochFeatures:
+    def __init__(self, record, epoch, transitions, temperature_change, end_temperature, valid_fraction):
+        self.record = record  # Index of the record each epoch came from
+        self.epoch = epoch  # Index of the epoch within its record
+        self.transitions = transitions
+        self.temperature_change = temperature_change  # Last valid temperature - first valid temperature
+        self.end_temperature = end_temperature  # Last valid temperature
+        self.valid_fraction = valid_fraction
+
+    def __len__(self):
+        return len(self.epoch)
+
+    def select(self, mask):
+        return EpochFeatures(self.record[mask], self.epoch[mask], self.transitions[mask],
+                             self.temperature_change[mask], self.end_temperature[mask], self.valid_fraction[mask])
+
+
+def read_core_record(core_file):
+    """
+    Unlike DisplayLoggedTemperature.temperatures_from_file, this keeps the invalid (0) readings.
+    Lines that can't be parsed (the header, or lines cut short when the logger stopped) are skipped
+    :return: datetime64 array of times, float array of temperatures
+    """
+    times, temperatures = [], []
+    with open(core_file) as f:
+        for line in f:
+            try:
+                dt, temperature = line.strip().split(",")
+                dt = np.datetime64(dt, "us")
+                temperature = float(temperature)
+            except ValueError:
+                continue
+            if np.isnat(dt):
+                continue
+            times.append(dt)
+            temperatures.append(temperature)
+    return np.array(times, dtype="datetime64[us]"), np.array(temperatures, dtype=float)
+
+
+def epoch_features(records, starts, epoch_length):
+    """
+    :param records: list of (times, temperatures) array pairs, as returned by read_core_record
+    :param starts: trial start (datetime) of each record. Readings before the start are ignored
+    :param epoch_length: timedelta
+    :return: EpochFeatures for every non-empty epoch of every record
+    """
+    epoch_length = np.timedelta64(epoch_length, "us")
+    all_temperatures, all_valid, epoch_starts, epoch_records, epoch_numbers = [], [], [], [], []
+    offset = 0
+    for i, ((times, temperatures), start) in enumerate(zip(records, starts)):
+        start = np.datetime64(start, "us")
+        keep = times >= start
+        times, temperatures = times[keep], temperatures[keep]
+        if len(times) == 0:
+            continue
+        epochs = (times - start) // epoch_length
+        boundaries = np.flatnonzero(np.diff(epochs)) + 1
+        all_temperatures.append(temperatures)
+        all_valid.append(temperatures > INVALID_TEMPERATURE)
+        epoch_starts.append(np.concatenate(([0], boundaries)) + offset)
+        epoch_numbers.append(epochs[np.concatenate(([0], boundaries))])
+        epoch_records.append(np.full(len(boundaries) + 1, i))
+        offset += len(times)
+    if offset == 0:
+        empty = np.array([], dtype=float)
+        return EpochFeatures(np.array([], dtype=int), np.array([], dtype=int), empty, empty, empty, empty)
+
+    temperatures = np.concatenate(all_temperatures)
+    valid = np.concatenate(all_valid)
+    epoch_starts = np.concatenate(epoch_starts)
+    record_starts = np.cumsum([0] + [len(t) for t in all_temperatures[:-1]])
+
+    changes = np.diff(valid.astype(np.int8), prepend=valid[:1].astype(np.int8)) != 0
+    changes[record_starts] = False  # Transitions aren't counted across records
+    transitions = np.add.reduceat(changes, epoch_starts)
+    counts = np.diff(np.append(epoch_starts, len(temperatures)))
+    valid_fraction = np.add.reduceat(valid, epoch_starts) / counts
+
+    indices = np.arange(len(temperatures))
+    first_valid = np.minimum.reduceat(np.where(valid, indices, len(temperatures)), epoch_starts)
+    last_valid = np.maximum.reduceat(np.where(valid, indices, -1), epoch_starts)
+    has_valid = last_valid >= 0
+    end_temperature = np.where(has_valid, temperatures[last_valid], np.nan)
+    start_temperature = np.where(has_valid, temperatures[np.minimum(first_valid, len(temperatures) - 1)], np.nan)
+
+    return EpochFeatures(np.concatenate(epoch_records), np.concatenate(epoch_numbers), transitions,
+                         end_temperature - start_temperature, end_temperature, valid_fraction)
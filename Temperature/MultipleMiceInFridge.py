@@ -3,11 +3,14 @@ import matplotlib.pyplot as plt
 import numpy as np
 import datetime
 import DisplayLoggedTemperature
-import statistics
+import SignalFilters
+import EnvironmentalStore
+import StreamFusion
 from matplotlib import font_manager
 import scipy.stats
 
 PLUNGE_TEMPERATURES = range(30, 20, -1)
+ENVIRONMENTAL_FILE = r"R:\Fillan\Parabrachial Ablations\Temperature in Fridge\Fridge Temperature.csv"  # Downloaded from SensorPush app
 
 
 def find_cold_start(movement_file):
@@ -87,44 +90,6 @@ class Mouse:
             self.axs[3].plot(trial.tail_times, trial.tail_temperatures, color=color)
             self.axs[4].plot(trial.environment_times, trial.environment_temperatures, color=color)
 
-    @staticmethod
-    def get_average_between_times(times, values, start_time, end_time, carry_last_point=False):
-        # start_time and end_time should be expressed as hours (float), not datetimes
-        start_index = None
-        end_index = None
-        if len(values) == 0:
-            return None
-        assert len(times) == len(values)
-        for i, time in enumerate(times):
-            if time > start_time and start_index is None:
-                start_index = i
-            if time > end_time:
-                end_index = i
-                break
-        if start_index is None and end_index is None:
-            if carry_last_point:
-                return values[-1]
-            else:
-                return None
-        included_values = values[start_index: end_index]
-        if len(included_values) > 0:
-            return sum(included_values) / len(included_values)
-        else:
-            assert start_index == end_index
-            start_index -= 1
-            middle_time = (start_time + end_time) / 2
-            return values[start_index] + (values[end_index] - values[start_index])/(times[end_index] - times[start_index]) * (middle_time - times[start_index])
-
-    @staticmethod
-    def get_value_at_time(times, values, time):
-        if time < times[0]:
-            return values[0]
-        for i in range(len(times)):
-            if times[i] > time:
-                return values[i-1] + (values[i] - values[i-1]) / (times[i] - times[i-1]) * (time - times[i-1])
-        else:
-            return values[-1]
-
 
 class Trial:
     def __init__(self, fed, folder, fridge_time, mouse_number):
@@ -144,7 +109,7 @@ class Trial:
         if not os.path.exists(self.rump_file):
             pass
             #raise AssertionError("%s does not exist" % self.rump_file)
-        self.environmental_file = r"R:\Fillan\Parabrachial Ablations\Temperature in Fridge\Fridge Temperature.csv"  # Downloaded from SensorPush app
+        self.environmental_file = ENVIRONMENTAL_FILE
 
         self.movements = []
         self.movement_times = []
@@ -160,7 +125,6 @@ class Trial:
         self.rump_times = []
         self.core_file_begin_time = None
         self.core_file_end_time = None
-        self.time_till_cold = {}
 
         self.read_movement_file()
         self.read_core_file()
@@ -187,58 +151,57 @@ class Trial:
         for time, temperature in core_temperatures:
             self.core_times.append((time - self.fridge_time).total_seconds() / 3600)
             self.core_temperatures.append(temperature)
-            if len(self.time_till_cold) < len(PLUNGE_TEMPERATURES):
-                next_plunge_temperature = PLUNGE_TEMPERATURES[(len(self.time_till_cold))]
-                if temperature < next_plunge_temperature:
-                    self.time_till_cold[next_plunge_temperature] = min((time - self.fridge_time).total_seconds() / 3600, 24)
-        for i in range(len(self.time_till_cold), len(PLUNGE_TEMPERATURES)):
-            self.time_till_cold[PLUNGE_TEMPERATURES[i]] = 24
         self.core_file_begin_time = self.fridge_time + datetime.timedelta(hours=self.core_times[0])
         self.core_file_end_time = self.fridge_time + datetime.timedelta(hours=self.core_times[-1])
 
     def read_environmental_file(self):
-        with open(self.environmental_file) as f:
-            reading_header = True
-            for line in f:
-                if reading_header:
-                    reading_header = False
-                    continue
-                time, temperature, humidity = line.split(",")
-                time = datetime.datetime.strptime(time[1:-1], "%Y-%m-%d %H:%M")
-                if not self.core_file_begin_time < time < self.core_file_end_time:
-                    continue
-                self.environment_times.append((time - self.fridge_time).total_seconds() / 3600)
-                if time < self.fridge_time:
-                    self.environment_temperatures.append(22)
-                else:
-                    self.environment_temperatures.append(float(temperature[1:-1]))
+        # The environmental file is shared by every trial, so it's only parsed once
+        store = EnvironmentalStore.load(self.environmental_file)
+        times, temperatures = store.between(self.core_file_begin_time, self.core_file_end_time)
+        fridge_time = np.datetime64(self.fridge_time, "us")
+        self.environment_times = (times - fridge_time) / np.timedelta64(1, "h")
+        self.environment_temperatures = np.where(times < fridge_time, 22, temperatures)
 
     def read_flir_file(self):
         continuously_excluded = 0
+        history = SignalFilters.RollingStatistics(window=10)
+        rump_times = np.array(self.rump_times)
+        rump_temperatures = np.array(self.rump_temperatures)
         with open(self.flir_file) as f:
             for line in f:
                 words = line.strip().split(",")
                 time = " ".join(words[0].split(" ")[1:])
                 time = (datetime.datetime.strptime(time, "%m %d %Y %H %M %S") - self.fridge_time).total_seconds() / 3600
                 bat_temperature = float(words[1])
+                relative_bat_temperature = bat_temperature - SignalFilters.values_at_times(rump_times, rump_temperatures, time)
                 if len(self.bat_temperatures) > 10:
-                    historical = np.array(self.bat_temperatures[-10:])
-                    Z_score = abs((bat_temperature - np.mean(historical)) / np.std(historical))
+                    Z_score = history.z_score(bat_temperature)
                     if (Z_score < 6 or continuously_excluded > 3) and bat_temperature < 45:
                         continuously_excluded = 0
                         self.bat_times.append(time)
-                        self.bat_temperatures.append(bat_temperature - Mouse.get_value_at_time(self.rump_times, self.rump_temperatures, time))
+                        self.bat_temperatures.append(relative_bat_temperature)
+                        history.push(relative_bat_temperature)
                     else:
                         continuously_excluded += 1
                 else:
                     self.bat_times.append(time)
-                    self.bat_temperatures.append(bat_temperature - Mouse.get_value_at_time(self.rump_times, self.rump_temperatures, time))
+                    self.bat_temperatures.append(relative_bat_temperature)
+                    history.push(relative_bat_temperature)
                 if len(words) > 2:
                     if len(words[2]) > 1:
                         tail_temperature = float(words[2])
                         self.tail_times.append(time)
                         self.tail_temperatures.append(tail_temperature)
-        self.bat_temperatures = Trial.median_filter(self.bat_temperatures, kernel=5)
+        self.bat_temperatures = SignalFilters.median_filter(self.bat_temperatures, kernel=5)
+
+    def streams(self):
+        """:return: dictionary of stream name -> (hours from fridge_time, values), as read by StreamFusion"""
+        return {"core": (self.core_times, self.core_temperatures),
+                "movement": (self.movement_times, self.movements),
+                "bat": (self.bat_times, self.bat_temperatures),
+                "tail": (self.tail_times, self.tail_temperatures),
+                "rump": (self.rump_times, self.rump_temperatures),
+                "environment": (self.environment_times, self.environment_temperatures)}
 
     def read_rump_file(self):
         with open(self.rump_file) as f:
@@ -255,14 +218,6 @@ class Trial:
                     except ValueError as ve:
                         print("%s has an invalid line" % self.rump_file)
 
-    @staticmethod
-    def median_filter(list, kernel):
-        step = int((kernel - 1) / 2)
-        new_list = []
-        for i in range(len(list)):
-            new_list.append(statistics.median(list[max(0, i - step): min(len(list), i + step + 1)]))
-        return new_list
-
 
 def error_bar(ax, x, y, yerr, color, label=None):
     ax.plot(x, y, c=color, label=label)
@@ -273,29 +228,18 @@ def error_bar(ax, x, y, yerr, color, label=None):
     #ax.plot(x, upper, c=color, alpha=0.3)
 
 
-def graph_average(mice, ax, ylabel, func_time, func_value, time_delta):
-    times = list(np.arange(-24, 24, time_delta))
-    values = {}
+def graph_average(fused, groups, ax, ylabel, name, time_delta):
     """
-    values holds all the values (temperatures, movements, ....) for all the mice
-    It's organized so that values[(Cas3, fed)] = [[values at first timepoint...], [values at second timepoint...]...]
+    :param fused: StreamFusion.FusedTrials of every trial
+    :param groups: (Cas3, fed) of each trial
     """
-    for mouse in mice:
-        for trial in mouse.trials:
-            if (mouse.Cas3, trial.fed) not in values:
-                values[(mouse.Cas3, trial.fed)] = [[] for _ in range(len(times))]
-            for i, time in enumerate(times):
-                start_time = time - time_delta / 2
-                end_time = time + time_delta / 2
-                average_value = Mouse.get_average_between_times(func_time(trial), func_value(trial), start_time, end_time, carry_last_point=(ylabel != "Environmental\nTemperature"))
-                if average_value is not None:
-                    values[(mouse.Cas3, trial.fed)][i].append(average_value)
-    for (Cas3, fed), value in values.items():
-        y, y_err = [], []
-        for value_at_timepoint in value:
-            value_at_timepoint = np.array(value_at_timepoint)
-            y.append(np.mean(value_at_timepoint))
-            y_err.append(np.std(value_at_timepoint))
+    times = np.arange(-24, 24, time_delta)
+    # values[trial, time], with NaN where a trial has no value at that timepoint
+    values = fused.resampled(name, time_base=times, bin_width=time_delta, carry_last_point=(name != "environment"))
+    for Cas3, fed in sorted(set(groups)):
+        value = values[[group == (Cas3, fed) for group in groups]]
+        y = np.nanmean(value, axis=0)
+        y_err = np.nanstd(value, axis=0)
         error_bar(ax, times, y, y_err, color=get_color(Cas3, fed))
         ax.set_ylabel(ylabel)
 
@@ -309,7 +253,7 @@ def plot_condition(conditions, func, ylabel):
     print(ylabel)
     for row_index, condition in enumerate(conditions_list):
         Cas3, food = condition.Cas3, condition.food
-        values = [x for x in func(condition) if x is not None]
+        values = [x for x in func(condition) if not np.isnan(x)]
         xs = [row_index] * len(values)
         plt.scatter(xs, values, c=get_color(Cas3, food))
         average = sum(values) / len(values)
@@ -318,7 +262,7 @@ def plot_condition(conditions, func, ylabel):
         plt.plot([row_index - .2, row_index + .2], [average, average], "k-")
         labels.append("%s\n%s" % ("Cas3" if Cas3 else "mCh", "Food" if food else "No Food"))
         for j in range(row_index + 1, len(conditions_list)):
-            new_values = func(conditions_list[j])
+            new_values = [x for x in func(conditions_list[j]) if not np.isnan(x)]
             _, p = scipy.stats.ttest_ind(values, new_values, equal_var=False)
             if p < 0.1:
                 axs[0].plot([row_index, row_index],
@@ -402,28 +346,25 @@ if __name__ == "__main__":
             axs[4].set_xlim([-1, 22])
         plt.show()
 
+    trial_mice = [mouse for mouse in all_mice for _ in mouse.trials]
+    trials = [trial for mouse in all_mice for trial in mouse.trials]
+    groups = [(mouse.Cas3, trial.fed) for mouse, trial in zip(trial_mice, trials)]
+    fused = StreamFusion.FusedTrials([trial.streams() for trial in trials])
+
     fig, axs = plt.subplots(nrows=5, sharex=True)
     for mouse in all_mice:
         mouse.axs = axs
-        for trial in mouse.trials:
-            if not trial.fed:
-                color = get_color(mouse.Cas3, trial.fed)
-                time_delta = 0.1
-                times = list(np.arange(-24, 24, time_delta))
-                smoothed_times = []
-                smoothed_values = []
-                for i, time in enumerate(times):
-                    start_time = time - time_delta / 2
-                    end_time = time + time_delta / 2
-                    smoothed_times.append(time)
-                    smoothed_values.append(Mouse.get_average_between_times(trial.core_times, trial.core_temperatures, start_time,
-                                                                    end_time, carry_last_point=False))
-                axs[0].plot(smoothed_times, smoothed_values, color=color, alpha=0.2, linewidth=1.5)
-    graph_average(all_mice, axs[0], "Core\nTemperature", lambda x: x.core_times, lambda x: x.core_temperatures, time_delta=.25)
-    graph_average(all_mice, axs[1], "Movement", lambda x: x.movement_times, lambda x: x.movements, time_delta=1)
-    graph_average(all_mice, axs[2], "Intrascapular - Rump\nTemperature", lambda x: x.bat_times, lambda x: x.bat_temperatures, time_delta=0.25)
-    graph_average(all_mice, axs[3], "Tail\nTemperature", lambda x: x.tail_times, lambda x: x.tail_temperatures, time_delta=.5)
-    graph_average(all_mice, axs[4], "Environmental\nTemperature", lambda x: x.environment_times, lambda x: x.environment_temperatures, time_delta=.25)
+    time_delta = 0.1
+    smoothed_times = np.arange(-24, 24, time_delta)
+    smoothed_values = fused.resampled("core", time_base=smoothed_times, bin_width=time_delta)
+    for mouse, trial, values in zip(trial_mice, trials, smoothed_values):
+        if not trial.fed:
+            axs[0].plot(smoothed_times, values, color=get_color(mouse.Cas3, trial.fed), alpha=0.2, linewidth=1.5)
+    graph_average(fused, groups, axs[0], "Core\nTemperature", "core", time_delta=.25)
+    graph_average(fused, groups, axs[1], "Movement", "movement", time_delta=1)
+    graph_average(fused, groups, axs[2], "Intrascapular - Rump\nTemperature", "bat", time_delta=0.25)
+    graph_average(fused, groups, axs[3], "Tail\nTemperature", "tail", time_delta=.5)
+    graph_average(fused, groups, axs[4], "Environmental\nTemperature", "environment", time_delta=.25)
 
     axs[0].set_ylim([15, 42])
     axs[1].set_ylim([0, 12000])
@@ -446,17 +387,21 @@ if __name__ == "__main__":
     for Cas3 in [False, True]:
         for fed in [True, False]:
             conditions[(Cas3, fed)] = Condition(Cas3, fed)
-    for mouse in all_mice:
-        for trial in mouse.trials:
-            condition = conditions[(mouse.Cas3, trial.fed)]
-            condition.movements.append(Mouse.get_average_between_times(trial.movement_times, trial.movements, 0, 3, carry_last_point=False))
-            condition.bats.append(Mouse.get_average_between_times(trial.bat_times, trial.bat_temperatures, 0, 1, carry_last_point=False))
-            condition.tails.append(Mouse.get_average_between_times(trial.tail_times, trial.tail_temperatures, 0, 3, carry_last_point=False))
-            condition.mean_temperature.append(Mouse.get_average_between_times(trial.core_times, trial.core_temperatures, 0, 24, carry_last_point=False))
-            for plunge_temperature, time_till_cold in trial.time_till_cold.items():
-                if plunge_temperature not in condition.cold_times:
-                    condition.cold_times[plunge_temperature] = []
-                condition.cold_times[plunge_temperature].append(time_till_cold)
+    movements = fused.window_average("movement", 0, 3)
+    bats = fused.window_average("bat", 0, 1)
+    tails = fused.window_average("tail", 0, 3)
+    mean_temperatures = fused.window_average("core", 0, 24)
+    cold_times = fused.time_to_threshold("core", PLUNGE_TEMPERATURES, cap=24)
+    for i, group in enumerate(groups):
+        condition = conditions[group]
+        condition.movements.append(movements[i])
+        condition.bats.append(bats[i])
+        condition.tails.append(tails[i])
+        condition.mean_temperature.append(mean_temperatures[i])
+        for plunge_temperature, time_till_cold in zip(PLUNGE_TEMPERATURES, cold_times[i]):
+            if plunge_temperature not in condition.cold_times:
+                condition.cold_times[plunge_temperature] = []
+            condition.cold_times[plunge_temperature].append(time_till_cold)
     for plunge_temperature in PLUNGE_TEMPERATURES:
         plot_condition(conditions, lambda x: x.cold_times[plunge_temperature], "Hours until core temperature = %i C" % plunge_temperature)
     plot_condition(conditions, lambda x: x.mean_temperature, "Mean temperature (Cold exposure)")
@@ -0,0 +1,98 @@
+import collections
+import math
+import numpy as np
+
+
+def median_filter(values, kernel):
+    """
+    Sliding-window median. Windows are truncated at the ends, as with statistics.median on a shortened slice
+    :param values: 1D sequence of numbers
+    :param kernel: odd window length
+    :return: numpy array the same length as values
+    """
+    values = np.asarray(values, dtype=float)
+    step = int((kernel - 1) / 2)
+    if len(values) == 0 or step < 1:
+        return values.copy()
+    padded = np.pad(values, step, constant_values=np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * step + 1)
+    return np.nanmedian(windows, axis=1)
+
+
+class RollingStatistics:
+    """
+    Mean and (population) standard deviation of the last `window` values pushed, updated in O(1) per value.
+    Used where the history depends on earlier decisions (e.g. outlier rejection) and so can't be computed up front
+    """
+    def __init__(self, window):
+        self.window = window
+        self.values = collections.deque()
+        self.total = 0
+        self.total_squared = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def push(self, value):
+        self.values.append(value)
+        self.total += value
+        self.total_squared += value * value
+        if len(self.values) > self.window:
+            old_value = self.values.popleft()
+            self.total -= old_value
+            self.total_squared -= old_value * old_value
+
+    def mean(self):
+        return self.total / len(self.values)
+
+    def std(self):
+        mean = self.mean()
+        return math.sqrt(max(self.total_squared / len(self.values) - mean * mean, 0))
+
+    def z_score(self, value):
+        std = self.std()
+        if std == 0:
+            return math.inf
+        return abs(value - self.mean()) / std
+
+
+def values_at_times(times, values, sample_times):
+    """
+    Linear interpolation of values at sample_times, holding the first/last value outside the recording
+    """
+    return np.interp(sample_times, np.asarray(times, dtype=float), np.asarray(values, dtype=float))
+
+
+def bin_averages(times, values, start_times, end_times, carry_last_point=False):
+    """
+    Average of the values recorded in each (start_time, end_time] bin, using cumulative sums and searchsorted
+    :param times: sorted sample times (hours)
+    :param values: values at those times
+    :param start_times: array of bin starts
+    :param end_times: array of bin ends
+    :param carry_last_point: bins after the end of the recording take the last value instead of NaN
+    :return: array of averages, NaN where there is no data.
+        Bins without samples inside the recording are interpolated at the middle of the bin
+    """
+    start_times = np.asarray(start_times, dtype=float)
+    end_times = np.asarray(end_times, dtype=float)
+    averages = np.full(start_times.shape, np.nan)
+    if len(values) == 0:
+        return averages
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    cumulative = np.concatenate(([0], np.cumsum(values)))
+    start_indices = np.searchsorted(times, start_times, side="right")
+    end_indices = np.searchsorted(times, end_times, side="right")
+    counts = end_indices - start_indices
+
+    filled = counts > 0
+    averages[filled] = (cumulative[end_indices[filled]] - cumulative[start_indices[filled]]) / counts[filled]
+
+    empty = (counts == 0) & (start_indices > 0) & (start_indices < len(times))
+    middle_times = (start_times[empty] + end_times[empty]) / 2
+    averages[empty] = values_at_times(times, values, middle_times)
+
+    if carry_last_point:
+        averages[start_indices == len(times)] = values[-1]
+    return averages
@@ -1,12 +1,12 @@
-import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import font_manager
 import pandas as pd
 import datetime
 import os
 import DisplayLoggedTemperature
-from CompareStressTests import create_relative_temperatures
+from TemperatureArrays import create_relative_temperatures, to_arrays
 from CompareStressTests import read_keyfile
+from StreamFusion import FusedTrials
 
 """
 This program analyzes simultaneous readings of the mouse's temperature during cold exposure
@@ -32,6 +32,7 @@ if __name__ == "__main__":
     fig, ax = plt.subplots(nrows=3, sharex=True)
 
     plt.subplots_adjust(wspace=0, hspace=0)
+    analyzed_mice, records = [], []
     for mouse_number in os.listdir(parent_directory):
         mouse_directory = os.path.join(parent_directory, mouse_number)
         if not os.path.isdir(mouse_directory):
@@ -46,33 +47,28 @@ if __name__ == "__main__":
         the second read of a core temperature as the start time of the test"""
         core_temperatures = core_temperatures[1:]
         start_time = core_temperatures[0][0]
-        times, core_temperatures, _ = create_relative_temperatures(core_temperatures, start_time, relative_temp=False)
-        i = 0
-        for i, time in enumerate(times):
-            if time > .33:
-                break
-        core_change = core_temperatures[i] - core_temperatures[0]
-        ax[0].plot(times, core_temperatures)
+        core_times, core_temperatures, _ = create_relative_temperatures(*to_arrays(core_temperatures), start_time, relative_temp=False)
+        ax[0].plot(core_times, core_temperatures)
         dfs = pd.read_excel(flir_file, sheet_name=None)
         df = dfs[list(dfs.keys())[0]]
-        times, tail_temperatures, _ = create_relative_temperatures(
-            [(datetime.datetime.combine(start_time.date(), a), b) for a, b in zip(df["Time"], df["Tail Temperature"])], start_time, relative_temp=False)
-        tail_AUC = 0
-        for i in range(1, len(times)):
-            tail_AUC += (times[i] - times[i - 1]) * (tail_temperatures[i] + tail_temperatures[i - 1]) / 2
-            if times[i] > .33:
-                break
-        ax[1].plot(times, tail_temperatures)
-        times, bat_temperatures, _ = create_relative_temperatures(
-            [(datetime.datetime.combine(start_time.date(), a), b) for a, b in zip(df["Time"], df["BAT Temperature"])], start_time, relative_temp=False)
-        bat_AUC = 0
-        for i in range(1, len(times)):
-            bat_AUC += (times[i] - times[i - 1]) * (bat_temperatures[i] + bat_temperatures[i - 1]) / 2
-            if times[i] > .33:
-                break
-        print(mouse_number, "%.2f" % tail_AUC, "%.2f" % bat_AUC, "%.2f" % core_change)
-        ax[2].plot(times, bat_temperatures, label=mouse_number)
+        tail_times, tail_temperatures, _ = create_relative_temperatures(
+            *to_arrays([(datetime.datetime.combine(start_time.date(), a), b) for a, b in zip(df["Time"], df["Tail Temperature"])]), start_time, relative_temp=False)
+        ax[1].plot(tail_times, tail_temperatures)
+        bat_times, bat_temperatures, _ = create_relative_temperatures(
+            *to_arrays([(datetime.datetime.combine(start_time.date(), a), b) for a, b in zip(df["Time"], df["BAT Temperature"])]), start_time, relative_temp=False)
+        ax[2].plot(bat_times, bat_temperatures, label=mouse_number)
         #ax[0, 1].legend()
+        analyzed_mice.append(mouse_number)
+        records.append({"core": (core_times, core_temperatures), "tail": (tail_times, tail_temperatures),
+                        "bat": (bat_times, bat_temperatures)})
+
+    # Areas under the curve and the core temperature change over the first 20 minutes, for every mouse at once
+    fused = FusedTrials(records)
+    tail_AUCs = fused.auc("tail", 0, .33)
+    bat_AUCs = fused.auc("bat", 0, .33)
+    core_changes = fused.values_at("core", .33) - fused.values_at("core", 0)
+    for mouse_number, tail_AUC, bat_AUC, core_change in zip(analyzed_mice, tail_AUCs, bat_AUCs, core_changes):
+        print(mouse_number, "%.2f" % tail_AUC, "%.2f" % bat_AUC, "%.2f" % core_change)
     ax[0].set_ylabel("Core (°C)")
     ax[1].set_ylabel("Tail (°C)")
     ax[2].set_ylabel("BAT (°C)")
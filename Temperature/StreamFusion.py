@@ -0,0 +1,121 @@
+import numpy as np
+import SignalFilters
+
+"""
+Time-aligned streams for trials with several recordings of the same mouse (core, movement, BAT, tail, rump,
+environment ...). Every stream of every trial is held as one (trials, samples) array padded with NaN, with times in
+hours from the trial's start, so cohort-wide metrics (AUCs, time to a threshold, window averages) and resampling onto a
+shared time base are array operations instead of per-trial loops.
+"""
+
+
+def pad_streams(streams):
+    """
+    :param streams: list of (times, values) pairs, one per trial. None for trials without the stream
+    :return: (trials, longest stream) arrays of times and values, padded with NaN
+    """
+    streams = [(np.asarray(stream[0], dtype=float), np.asarray(stream[1], dtype=float)) if stream is not None
+               else (np.zeros(0), np.zeros(0)) for stream in streams]
+    length = max([len(times) for times, _ in streams] + [0])
+    padded_times = np.full((len(streams), length), np.nan)
+    padded_values = np.full((len(streams), length), np.nan)
+    for i, (times, values) in enumerate(streams):
+        padded_times[i, :len(times)] = times
+        padded_values[i, :len(values)] = values
+    return padded_times, padded_values
+
+
+class FusedTrials:
+    def __init__(self, records, time_base=None, bin_width=None):
+        """
+        :param records: list of dictionaries, one per trial, of stream name -> (times in hours, values).
+            Times must be sorted
+        :param time_base: shared times (hours) that resampled() puts every stream on
+        :param bin_width: resample by averaging bins of this width around each time. Linear interpolation if None
+        """
+        self.time_base = time_base
+        self.bin_width = bin_width
+        names = []
+        for record in records:
+            names.extend(name for name in record if name not in names)
+        self.times, self.values = {}, {}
+        for name in names:
+            self.times[name], self.values[name] = pad_streams([record.get(name) for record in records])
+        self.trial_count = len(records)
+
+    def stream(self, name, trial):
+        """:return: times and values of one trial's stream, without padding"""
+        valid = ~np.isnan(self.times[name][trial])
+        return self.times[name][trial][valid], self.values[name][trial][valid]
+
+    def resampled(self, name, time_base=None, bin_width=None, carry_last_point=False):
+        """
+        :return: (trials, time base) array of the stream on the time base, NaN where a trial has no data
+        """
+        time_base = self.time_base if time_base is None else np.asarray(time_base, dtype=float)
+        bin_width = self.bin_width if bin_width is None else bin_width
+        resampled = np.full((self.trial_count, len(time_base)), np.nan)
+        for trial in range(self.trial_count):
+            times, values = self.stream(name, trial)
+            if len(times) == 0:
+                continue
+            if bin_width:
+                resampled[trial] = SignalFilters.bin_averages(times, values, time_base - bin_width / 2,
+                                                              time_base + bin_width / 2, carry_last_point)
+            else:
+                resampled[trial] = np.interp(time_base, times, values, left=np.nan,
+                                             right=values[-1] if carry_last_point else np.nan)
+        return resampled
+
+    def values_at(self, name, time):
+        """:return: the stream linearly interpolated at time, for every trial (NaN outside the recording)"""
+        return self.resampled(name, time_base=np.array([time], dtype=float), bin_width=0)[:, 0]
+
+    def auc(self, name, start, end):
+        """
+        :return: area under the linearly interpolated stream between start and end (hours), for every trial.
+            Only the part of the window covered by the recording counts. NaN for trials without the stream
+        """
+        times, values = self.times[name], self.values[name]
+        t0, t1, v0, v1 = times[:, :-1], times[:, 1:], values[:, :-1], values[:, 1:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            a = np.clip(t0, start, end)
+            b = np.clip(t1, start, end)
+            slope = np.where(t1 > t0, (v1 - v0) / (t1 - t0), 0)
+            areas = (b - a) * (v0 + slope * (a - t0) + v0 + slope * (b - t0)) / 2
+        areas = np.where(np.isnan(areas) | (b <= a), 0, areas)
+        return np.where(np.isnan(times).all(axis=1), np.nan, areas.sum(axis=1))
+
+    def time_to_threshold(self, name, thresholds, cap=np.inf, after=-np.inf):
+        """
+        :param thresholds: values the stream has to fall below
+        :param cap: returned (and the limit) for trials that never fall below a threshold
+        :param after: ignore samples at or before this time
+        :return: (trials, thresholds) array of the first time the stream is below each threshold.
+            NaN for trials without the stream
+        """
+        thresholds = np.atleast_1d(np.asarray(thresholds, dtype=float))
+        times, values = self.times[name], self.values[name]
+        if times.shape[1] == 0:
+            return np.full((self.trial_count, len(thresholds)), np.nan)
+        with np.errstate(invalid="ignore"):
+            below = (values[:, np.newaxis, :] < thresholds[np.newaxis, :, np.newaxis]) & (times[:, np.newaxis, :] > after)
+        crossing_times = np.take_along_axis(times, np.argmax(below, axis=2), axis=1)
+        crossing_times = np.where(below.any(axis=2), np.minimum(crossing_times, cap), cap)
+        return np.where(np.isnan(times).all(axis=1)[:, np.newaxis], np.nan, crossing_times)
+
+    def window_average(self, name, start, end):
+        """
+        :return: average of each trial's samples in (start, end], as SignalFilters.bin_averages: windows without
+            samples inside the recording are interpolated at their middle, and NaN outside the recording
+        """
+        times, values = self.times[name], self.values[name]
+        with np.errstate(invalid="ignore"):
+            inside = (times > start) & (times <= end)
+        counts = inside.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages = np.where(inside, values, 0).sum(axis=1) / counts
+        for trial in np.flatnonzero(counts == 0):
+            stream_times, stream_values = self.stream(name, trial)
+            averages[trial] = SignalFilters.bin_averages(stream_times, stream_values, [start], [end])[0]
+        return averages
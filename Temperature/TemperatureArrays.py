@@ -0,0 +1,65 @@
+import numpy as np
+
+
+def to_arrays(temperatures):
+    """
+    :param temperatures: list of (datetime, temperature) tuples, as returned by
+        DisplayLoggedTemperature.temperatures_from_file or StressTest.read_elitech_file
+    :return: datetime64 array of times, float array of temperatures
+    """
+    if len(temperatures) == 0:
+        return np.array([], dtype="datetime64[us]"), np.array([], dtype=float)
+    times, values = zip(*temperatures)
+    return np.array(times, dtype="datetime64[us]"), np.array(values, dtype=float)
+
+
+def stack_records(records):
+    """
+    :param records: list of (times, temperatures) array pairs, one per mouse
+    :return: (number of mice, longest record) arrays of times and temperatures, padded with NaT and NaN
+    """
+    length = max([len(times) for times, _ in records] + [0])
+    stacked_times = np.full((len(records), length), np.datetime64("NaT"), dtype="datetime64[us]")
+    stacked_temperatures = np.full((len(records), length), np.nan)
+    for i, (times, temperatures) in enumerate(records):
+        stacked_times[i, :len(times)] = times
+        stacked_temperatures[i, :len(temperatures)] = temperatures
+    return stacked_times, stacked_temperatures
+
+
+def create_relative_temperatures(times, temperatures, start, relative_temp=False):
+    """
+    :param times: datetime64 array, either one record or a stack of records (see stack_records)
+    :param temperatures: float array with the same shape as times
+    :param start: trial start, either one datetime or one per record
+    :param relative_temp: subtract the first temperature after the start from every temperature
+    :return: hours from start, temperatures and the temperature at the start.
+        NaN temperatures (and padding) are dropped. For a stack the first two are lists with one array per record
+    """
+    times = np.asarray(times, dtype="datetime64[us]")
+    temperatures = np.asarray(temperatures, dtype=float)
+    batched = times.ndim == 2
+    times = np.atleast_2d(times)
+    temperatures = np.atleast_2d(temperatures)
+    start = np.asarray(start, dtype="datetime64[us]").reshape(-1, 1)
+    if times.size == 0:
+        # Nothing to find a start temperature in, as when the logger recorded nothing
+        if not batched:
+            return np.array([], dtype=float), np.array([], dtype=float), 0
+        empty = [np.array([], dtype=float) for _ in range(len(times))]
+        return empty, list(empty), np.zeros(len(times))
+
+    hours = (times - start) / np.timedelta64(1, "h")
+    valid = ~np.isnan(temperatures) & ~np.isnat(times)
+    after_start = valid & (times > start)
+    last_valid = valid.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    start_index = np.where(after_start.any(axis=1), np.argmax(after_start, axis=1), last_valid)
+    temperatures_at_start = temperatures[np.arange(len(temperatures)), start_index]
+    temperatures_at_start = np.where(valid.any(axis=1), temperatures_at_start, 0)
+    if relative_temp:
+        temperatures = temperatures - temperatures_at_start[:, np.newaxis]
+
+    if not batched:
+        return hours[0][valid[0]], temperatures[0][valid[0]], temperatures_at_start[0]
+    splits = np.cumsum(valid.sum(axis=1))[:-1]
+    return np.split(hours[valid], splits), np.split(temperatures[valid], splits), temperatures_at_start
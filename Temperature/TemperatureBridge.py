@@ -3,7 +3,6 @@ import math
 import os.path
 
 import matplotlib.pyplot as plt
-import matplotlib.patches
 import numpy as np
 import cv2
 from PIL import Image
@@ -14,6 +13,8 @@ import scipy.ndimage.filters
 from matplotlib.widgets import TextBox
 import tkinter
 from tkinter import filedialog
+import BridgeTracking
+import BridgeRegistration
 
 """
 This program is used to analyze the data from the "temperature bridge" thermal gradient experiment. This temperature
@@ -21,9 +22,9 @@ bridge is constructed by putting a sheet of copper between a Peltier cooler and
 is at approximately 15 C, and the hot end is at 60 C. Mice are placed in lanes on this sheet, and are recorded with
 a timelapse from a visual camera. A thermal image of the temperature bridge is taken, preferably at the beginning and end.
 
-This program then finds the mouses' position using an intensity-based search, then
+This program then finds the mouses' position using an intensity-based search (see BridgeTracking.py), then
 converts the mouse's position into the temperature on which they were sitting. Doing this requires the user's help
-registering the two images together. Click on one image, then click on the corresponding point on the second image.
+registering the two images together (once per session, see BridgeRegistration.py). Click on one image, then click on the corresponding point on the second image.
 Registration will require at least four pairs of points for homographic (8D, location, size, rotation, skew).
 Double click on the last point to initiate the transformation.
 """
@@ -42,6 +43,7 @@ class Click:
         self.bottom_coordinate_pairs = []
         self.finished = False
         self.warped_flir = None
+        self.homography = None
 
     def onclick(self, event):
         if event.inaxes == self.ax[0]:
@@ -71,6 +73,7 @@ class Click:
         plt.draw()
         if event.dblclick:
             H, _ = cv2.findHomography(np.array(self.top_coordinate_pairs), np.array(self.bottom_coordinate_pairs))
+            self.homography = H
             self.warped_flir = cv2.warpPerspective(self.flir, H, (self.still.shape[1], self.still.shape[0]), borderMode=cv2.BORDER_REPLICATE)
             ax[0].imshow(self.warped_flir)
             still_overlay = cv2.adaptiveThreshold(cv2.cvtColor(still, cv2.COLOR_BGR2GRAY), 5, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
@@ -89,37 +92,63 @@ def get_still_from_video(video_file_path):
     return np.array(first_frame)
 
 
-def get_flir_image(flir_file_path, barrel_distortion=-2.6e-4):
-    if os.path.isdir(flir_file_path):
-        return np.mean([get_flir_image(x) for x in glob.glob(os.path.join(flir_file_path, "*.csv"))], axis=0)
-    flir = np.genfromtxt(flir_file_path, delimiter=",", skip_header=6)
-    flir = cv2.copyMakeBorder(src=flir, top=15, bottom=15, left=15, right=15,
-                                          borderType=cv2.BORDER_REPLICATE)
-    width = flir.shape[1]
-    height = flir.shape[0]
+_undistortion_maps = {}  # (height, width, barrel_distortion) -> maps for cv2.remap
+_flir_images = {}  # (file path, modification time, barrel_distortion) -> undistorted image
+
+
+def read_flir_csv(flir_file_path):
+    return pd.read_csv(flir_file_path, skiprows=6, header=None, dtype=float, engine="c").to_numpy()
+
 
-    distCoeff = np.zeros((4, 1), np.float64)
+def get_undistortion_maps(shape, barrel_distortion):
+    key = (shape[0], shape[1], barrel_distortion)
+    if key not in _undistortion_maps:
+        height, width = shape
 
-    k1 = barrel_distortion
-    k2 = 0.0
-    p1 = 0.0
-    p2 = 0.0
+        distCoeff = np.zeros((4, 1), np.float64)
 
-    distCoeff[0, 0] = k1
-    distCoeff[1, 0] = k2
-    distCoeff[2, 0] = p1
-    distCoeff[3, 0] = p2
+        k1 = barrel_distortion
+        k2 = 0.0
+        p1 = 0.0
+        p2 = 0.0
 
-    # assume unit matrix for camera
-    cam = np.eye(3, dtype=np.float32)
+        distCoeff[0, 0] = k1
+        distCoeff[1, 0] = k2
+        distCoeff[2, 0] = p1
+        distCoeff[3, 0] = p2
 
-    cam[0, 2] = width / 2.0  # define center x
-    cam[1, 2] = height / 2.0  # define center y
-    cam[0, 0] = 10.  # define focal length x
-    cam[1, 1] = 10.  # define focal length y
+        # assume unit matrix for camera
+        cam = np.eye(3, dtype=np.float32)
 
-    # here the undistortion will be computed
-    return cv2.undistort(flir, cam, distCoeff)
+        cam[0, 2] = width / 2.0  # define center x
+        cam[1, 2] = height / 2.0  # define center y
+        cam[0, 0] = 10.  # define focal length x
+        cam[1, 1] = 10.  # define focal length y
+
+        # Built once per image shape and distortion instead of on every cv2.undistort call. The result is close to
+        # cv2.undistort's but not guaranteed identical: the fixed-point remap can differ by a few tenths of a degree
+        # on noisy frames (thousandths on smooth ones), depending on how the OpenCV build undistorts internally
+        _undistortion_maps[key] = cv2.initUndistortRectifyMap(cam, distCoeff, None, cam, (width, height), cv2.CV_16SC2)
+    return _undistortion_maps[key]
+
+
+def get_flir_image(flir_file_path, barrel_distortion=-2.6e-4):
+    """
+    Undistorted FLIR image from a csv export, or the average of every csv in a directory.
+    Each file is only parsed once; the returned array is shared, so don't modify it in place
+    """
+    if os.path.isdir(flir_file_path):
+        return np.mean([get_flir_image(x, barrel_distortion) for x in glob.glob(os.path.join(flir_file_path, "*.csv"))], axis=0)
+    key = (os.path.abspath(flir_file_path), os.path.getmtime(flir_file_path), barrel_distortion)
+    if key not in _flir_images:
+        flir = read_flir_csv(flir_file_path)
+        flir = cv2.copyMakeBorder(src=flir, top=15, bottom=15, left=15, right=15,
+                                  borderType=cv2.BORDER_REPLICATE)
+        map1, map2 = get_undistortion_maps(flir.shape, barrel_distortion)
+        flir = cv2.remap(flir, map1, map2, cv2.INTER_LINEAR)
+        flir.flags.writeable = False
+        _flir_images[key] = flir
+    return _flir_images[key]
 
 
 def load_ethovision_tracks(ethovision_file_path):
@@ -189,67 +218,6 @@ def draw_arenas(still):
     return arena.masks
 
 
-def find_mouse_position(video_file_path, masks):
-    if len(masks.items()) == 0:
-        return None
-    positions = {mouse_number: [] for mouse_number, mask in masks.items()}
-    shape = list(masks.values())[0].shape
-    array = np.zeros(shape=shape, dtype=np.uint8)
-    vs = cv2.VideoCapture(video_file_path)
-    for _ in range(100):
-        frame = vs.read()[1]
-        if frame is None:
-            break
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        array = np.maximum(array, frame)
-    plt.imshow(array, cmap="gray")
-    plt.xticks([])
-    plt.yticks([])
-    plt.title("Acceptable empty arena?")
-    plt.show()
-    vs = cv2.VideoCapture(video_file_path)
-    frame_number = 0
-    while True:
-        frame_number += 1
-        frame = vs.read()[1]
-        if frame is None:
-            break
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        difference = cv2.absdiff(frame, array)
-        thresh = cv2.threshold(difference, 75, 1, cv2.THRESH_BINARY)[1]
-        minimum = cv2.bitwise_not(cv2.threshold(frame, 60, 255, cv2.THRESH_BINARY)[1])
-        thresh = cv2.multiply(thresh, minimum)
-        cXs, cYs = [], []
-        for mouse_number, mask in masks.items():
-            masked = cv2.multiply(thresh, mask)
-            contours, hierarchy = cv2.findContours(masked, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-            if len(contours) > 0:
-                c = max(contours, key=cv2.contourArea)
-                M = cv2.moments(c)
-                if M["m00"] == 0:
-                    fig, ax = plt.subplots(3)
-                    ax[0].imshow(frame, cmap="gray")
-                    ax[1].imshow(difference, cmap="gray")
-                    ax[2].imshow(thresh, cmap="gray")
-                    plt.show()
-                cX = int(M["m10"] / M["m00"])
-                cY = int(M["m01"] / M["m00"])
-                cXs.append(cX)
-                cYs.append(cY)
-                positions[mouse_number].append([cX, cY])
-        if frame_number % 500 == 0:
-            fig, ax = plt.subplots()
-            ax.imshow(frame, cmap="gray")
-            for cX, cY in zip(cXs, cYs):
-                circ = matplotlib.patches.Circle((cX, cY), 4, facecolor='r')
-                ax.add_patch(circ)
-            ax.set_xticks([])
-            ax.set_yticks([])
-            plt.title(frame_number)
-            plt.show()
-    return {mouse_number: np.array(position) for mouse_number, position in positions.items()}
-
-
 if __name__ == "__main__":
     font_path = r"C:\Users\Fillan\Documents\Fonts\Myriad Pro Regular.ttf"
     font_manager.fontManager.addfont(font_path)
@@ -274,34 +242,37 @@ if __name__ == "__main__":
         ax.set_yticks([])
     plt.show()
     still = get_still_from_video(video_file_path)
-    arenas = draw_arenas(still)
-    positions = find_mouse_position(video_file_path, arenas)
-    fig, ax = plt.subplots(nrows=2)
+    registration = BridgeRegistration.load_registration(folder)
+    if registration is None:
+        homography, arenas = None, draw_arenas(still)
+    else:
+        homography, arenas = registration
+    positions = BridgeTracking.find_mouse_position(video_file_path, arenas)
     im = Image.fromarray(flir)
     im = im.convert("L")
     im.save(os.path.join(folder, "Flir.jpg"))
-    ax[0].imshow(display_flir)
-    ax[1].imshow(still)
-    ax[0].set_title("Click fiducial on top image, then corresponding fiducial on bottom. Double click to finish")
-    click = Click(ax, flir, still)
-    for axis in ax:
-        axis.set_xticks([])
-        axis.set_yticks([])
-    cid = fig.canvas.mpl_connect("button_press_event", click.onclick)
-    plt.tight_layout()
-    plt.show()
-    if click.finished:
-        mouse_temperatures = {}
-        for mouse_number, track in positions.items():
+    if homography is None:
+        fig, ax = plt.subplots(nrows=2)
+        ax[0].imshow(display_flir)
+        ax[1].imshow(still)
+        ax[0].set_title("Click fiducial on top image, then corresponding fiducial on bottom. Double click to finish")
+        click = Click(ax, flir, still)
+        for axis in ax:
+            axis.set_xticks([])
+            axis.set_yticks([])
+        cid = fig.canvas.mpl_connect("button_press_event", click.onclick)
+        plt.tight_layout()
+        plt.show()
+        if click.finished:
+            homography = click.homography
+            BridgeRegistration.save_registration(folder, homography, arenas)
+    if homography is not None:
+        warped_flir = BridgeRegistration.warp_flir(flir, homography, still.shape)
+        mouse_temperatures = BridgeRegistration.track_temperatures(warped_flir, positions)
+        BridgeRegistration.save_temperature_tables(os.path.dirname(video_file_path), mouse_temperatures)
+        for mouse_number, temperatures in mouse_temperatures.items():
             print(mouse_number)
-            temperatures = []
-            with open(os.path.join(os.path.dirname(video_file_path), "%s.tsv" % mouse_number), "w+") as f:
-                for i in range(track.shape[0]):
-                    temperature = click.warped_flir[track[i][1], track[i][0]]
-                    temperatures.append(temperature)
-                    f.write("%.2f\t%.2f\n" % (i / 6, temperature))
-            plt.plot([i / 6 for i in range(len(temperatures))], temperatures, label=mouse_number)
-            mouse_temperatures[mouse_number] = temperatures
+            plt.plot(np.arange(len(temperatures)) / BridgeRegistration.FRAMES_PER_MINUTE, temperatures, label=mouse_number)
         plt.ylabel("Temperature")
         plt.xlabel("Minutes")
         plt.legend()
@@ -0,0 +1,104 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import numpy as np
+import BridgeRegistration
+import BridgeTracking
+import TemperatureBridge
+
+"""
+Re-analyses every temperature bridge session under a root directory without any GUI.
+A session is a folder holding the timelapse (.AVI) and the FLIR exports (.csv), like the ones TemperatureBridge.py
+is run on. The folder's own Registration.npz (saved by TemperatureBridge.py) is used if it has one. Otherwise the
+rig template given with --template is used, which is the Registration.npz of another session on the same rig,
+and the session needs an "Arenas.txt" with one line per mouse:
+    <arena name in the template>:<mouse number>
+Each session gets a "<mouse number>.tsv" per mouse, as read by TemperatureBridgeCompare.py, and the root directory
+gets a "Preferences.csv" summarizing every mouse. With --parquet each session also gets a "Temperatures.parquet" of
+every mouse, for loading many sessions at once (requires pyarrow).
+"""
+
+
+def read_arenas_file(arenas_file):
+    arenas = {}
+    with open(arenas_file) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line[0] == "#":
+                continue
+            arena_name, mouse_number = line.split(":")
+            arenas[arena_name] = mouse_number
+    return arenas
+
+
+def get_registration(folder, template):
+    """
+    :param template: (homography, masks) of the rig, or None
+    :return: homography, dictionary of mouse number -> arena mask
+    """
+    registration = BridgeRegistration.load_registration(folder)
+    if registration is not None:
+        return registration
+    arenas_file = os.path.join(folder, "Arenas.txt")
+    if template is None or not os.path.exists(arenas_file):
+        raise IOError("%s has no Registration.npz, and no template and Arenas.txt to use instead" % folder)
+    homography, template_masks = template
+    masks = {mouse_number: template_masks[arena_name] for arena_name, mouse_number in read_arenas_file(arenas_file).items()}
+    return homography, masks
+
+
+def analyze_session(folder, template_file, parquet=False):
+    """
+    :param template_file: Registration.npz to fall back on, or None
+    :param parquet: also write the session's temperatures to a Parquet file (see save_temperature_tables)
+    :return: folder, dictionary of mouse number -> temperatures
+    """
+    template = BridgeRegistration.load_registration_file(template_file) if template_file else None
+    try:
+        homography, masks = get_registration(folder, template)
+    except IOError as e:
+        print("Skipping %s" % e)
+        return folder, {}
+    video_file_path = glob.glob(os.path.join(folder, "*.AVI"))[0]
+    still = TemperatureBridge.get_still_from_video(video_file_path)
+    flir = TemperatureBridge.get_flir_image(folder)
+    positions = BridgeTracking.find_mouse_position(video_file_path, masks, processes=1)
+    warped_flir = BridgeRegistration.warp_flir(flir, homography, still.shape)
+    mouse_temperatures = BridgeRegistration.track_temperatures(warped_flir, positions)
+    BridgeRegistration.save_temperature_tables(folder, mouse_temperatures, parquet=parquet)
+    return folder, mouse_temperatures
+
+
+def find_sessions(root_directory):
+    return sorted(os.path.dirname(video) for video in glob.glob(os.path.join(root_directory, "*", "*.AVI")))
+
+
+def save_preferences(file_path, results):
+    with open(file_path, "w") as f:
+        f.write("Session,Mouse,Minutes,Mean,Stdev,Median\n")
+        for folder, mouse_temperatures in results:
+            for mouse_number, temperatures in mouse_temperatures.items():
+                if len(temperatures) == 0:
+                    continue
+                f.write("%s,%s,%.2f,%.2f,%.2f,%.2f\n" % (os.path.basename(folder), mouse_number,
+                                                         len(temperatures) / BridgeRegistration.FRAMES_PER_MINUTE,
+                                                         np.mean(temperatures), np.std(temperatures), np.median(temperatures)))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-d", "--directory", required=True, help="Root directory holding one folder per session")
+    ap.add_argument("-t", "--template", default=None, help="Registration.npz of a session on the same rig")
+    ap.add_argument("-p", "--processes", type=int, default=multiprocessing.cpu_count(), help="Sessions analyzed at once")
+    ap.add_argument("--parquet", action="store_true", help="Also write a Temperatures.parquet per session")
+    args = vars(ap.parse_args())
+
+    sessions = find_sessions(args["directory"])
+    print("%i sessions" % len(sessions))
+    with multiprocessing.Pool(args["processes"]) as pool:
+        results = pool.starmap(analyze_session, [(session, args["template"], args["parquet"]) for session in sessions])
+    for folder, mouse_temperatures in results:
+        for mouse_number, temperatures in mouse_temperatures.items():
+            print("%s %s: Mean: %.2f Stdev: %.2f" % (os.path.basename(folder), mouse_number, np.mean(temperatures), np.std(temperatures)))
+    save_preferences(os.path.join(args["directory"], "Preferences.csv"), results)
@@ -5,6 +5,11 @@ import glob
 import scipy.stats
 import numpy as np
 
+BIN_EDGES = np.arange(0, 51)  # 1 °C bins from 0 to 50 °C
+BIN_CENTERS = (BIN_EDGES[:-1] + BIN_EDGES[1:]) / 2
+FRAMES_PER_MINUTE = 6  # Timelapse frames per minute (see BridgeRegistration.py)
+BOOTSTRAP_RESAMPLES = 10000
+
 
 class Mouse:
     def __init__(self, mouse_number):
@@ -13,15 +18,14 @@ class Mouse:
         self.temperatures, self.hist, self.bin_edges, self.mean, self.bin_centers = None, None, None, None, None
 
     def calculate_mean_preferences(self):
+        """Needs the trials' histograms (see Trials)"""
         self.temperatures = np.concatenate([trial.temperatures for trial in self.trials])
-        self.hist, self.bin_edges = np.histogram(self.temperatures, bins=50, range=(0, 50))
+        self.hist = np.sum([trial.hist for trial in self.trials], axis=0)
+        self.bin_edges, self.bin_centers = BIN_EDGES, BIN_CENTERS
         self.mean = np.mean(self.temperatures)
-        self.bin_centers = np.zeros(shape=(self.bin_edges.size - 1,))
-        for i in range(self.bin_centers.size):
-            self.bin_centers[i] = (self.bin_edges[i] + self.bin_edges[i + 1]) / 2
 
     def plot(self, ax, x, facecolor, edgecolor):
-        x1 = np.array([x] * self.bin_centers.size)
+        x1 = np.full(self.bin_centers.size, x)
         x2 = x1 + (self.hist / (0.3 * np.sum(self.hist)))
         ax.fill_betweenx(self.bin_centers, x1, x2, color=facecolor)
         ax.plot(x2, self.bin_centers, color=edgecolor)
@@ -29,23 +33,83 @@ class Mouse:
 
 
 class Trial:
-    def __init__(self, temperatures):
+    def __init__(self, temperatures, mouse_number):
         self.temperatures = temperatures
-        self.hist, self.bin_edges = np.histogram(temperatures, bins=50, range=(0, 50))
-        self.mean = np.mean(temperatures)
         self.mouse_number = mouse_number
-        self.bin_centers = np.zeros(shape=(self.bin_edges.size - 1,))
-        for i in range(self.bin_centers.size):
-            self.bin_centers[i] = (self.bin_edges[i] + self.bin_edges[i + 1]) / 2
+        self.hist, self.mean = None, None  # Filled in by Trials
+        self.bin_edges, self.bin_centers = BIN_EDGES, BIN_CENTERS
 
     def plot(self, ax, x, facecolor, edgecolor):
-        x1 = np.array([x] * self.bin_centers.size)
+        x1 = np.full(self.bin_centers.size, x)
         x2 = x1 + (self.hist / 300)
         ax.fill_betweenx(self.bin_centers, x1, x2, color=facecolor)
         ax.plot(x2, self.bin_centers, color=edgecolor)
         ax.text(x, self.bin_centers[-1] - x % 2, self.mouse_number)
 
 
+class Trials:
+    """
+    Every trial of a group of mice as flat arrays, so statistics are computed for all trials at once.
+    Per-trial results are arrays with one row per trial, in the order of the mice and then their trials
+    """
+    def __init__(self, mice):
+        self.mice = mice
+        self.trials = [trial for mouse in mice for trial in mouse.trials]
+        lengths = np.array([len(trial.temperatures) for trial in self.trials], dtype=int)
+        self.mouse_index = np.repeat(np.arange(len(mice)), [len(mouse.trials) for mouse in mice])
+        self.trial_index = np.repeat(np.arange(len(self.trials)), lengths)
+        self.temperatures = np.concatenate([trial.temperatures for trial in self.trials] + [np.zeros(0)])
+        self.starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(int)
+        self.lengths = lengths
+
+        self.hist = self.histograms()
+        self.mean = np.bincount(self.trial_index, weights=self.temperatures, minlength=len(self.trials)) / self.lengths
+        for trial, hist, mean in zip(self.trials, self.hist, self.mean):
+            trial.hist, trial.mean = hist, mean
+
+        # Temperatures sorted within each trial, for counting samples above or below any threshold
+        self.span = np.ptp(self.temperatures) + 1 if len(self.temperatures) else 1
+        self.offset = np.min(self.temperatures) if len(self.temperatures) else 0
+        self.sorted_keys = np.sort(self._keys(self.trial_index, self.temperatures))
+
+    def _keys(self, trial_index, temperatures):
+        return trial_index * self.span + (temperatures - self.offset)
+
+    def histograms(self):
+        """Same bins as np.histogram(temperatures, bins=50, range=(0, 50)) for each trial"""
+        in_range = (self.temperatures >= BIN_EDGES[0]) & (self.temperatures <= BIN_EDGES[-1])
+        bins = np.minimum(np.floor(self.temperatures[in_range] - BIN_EDGES[0]).astype(int), BIN_CENTERS.size - 1)
+        counts = np.bincount(self.trial_index[in_range] * BIN_CENTERS.size + bins,
+                             minlength=len(self.trials) * BIN_CENTERS.size)
+        return counts.reshape(len(self.trials), BIN_CENTERS.size)
+
+    def count_below(self, thresholds, inclusive=False):
+        """:return: (trials, thresholds) array of the number of samples below (or at, if inclusive) each threshold"""
+        # Out-of-range thresholds are clipped so their keys can't reach into a neighbouring trial's
+        thresholds = np.clip(np.atleast_1d(np.asarray(thresholds, dtype=float)),
+                             self.offset - 0.5, self.offset + self.span - 0.5)
+        keys = self._keys(np.arange(len(self.trials))[:, np.newaxis], thresholds[np.newaxis, :])
+        side = "right" if inclusive else "left"
+        return np.searchsorted(self.sorted_keys, keys, side=side) - self.starts[:, np.newaxis]
+
+    def minutes_below(self, thresholds):
+        return self.count_below(thresholds) / FRAMES_PER_MINUTE
+
+    def minutes_above(self, thresholds):
+        return (self.lengths[:, np.newaxis] - self.count_below(thresholds, inclusive=True)) / FRAMES_PER_MINUTE
+
+    def mouse_averages(self, trial_values):
+        """
+        :param trial_values: array with one row per trial (and optionally a column per statistic)
+        :return: the average over each mouse's trials, with one row per mouse
+        """
+        trial_values = np.asarray(trial_values, dtype=float)
+        sums = np.zeros((len(self.mice),) + trial_values.shape[1:])
+        np.add.at(sums, self.mouse_index, trial_values)
+        counts = np.bincount(self.mouse_index, minlength=len(self.mice)).reshape((-1,) + (1,) * (trial_values.ndim - 1))
+        return sums / counts
+
+
 def read_keyfile(keyfile_path):
     mice = []
     with open(keyfile_path) as f:
@@ -54,26 +118,41 @@ def read_keyfile(keyfile_path):
     return mice
 
 
-def bar_graph(mCh_mice, Cas3_mice, func, ylabel=None):
-    mCh_values = []
-    for mouse in mCh_mice:
-        values = []
-        for trial in mouse.trials:
-            values.append(func(trial))
-        mCh_values.append(sum(values) / len(values))
-    average = sum(mCh_values) / len(mCh_values)
-    plt.bar([1], [average], color="lightgray")
-    plt.scatter([1] * len(mCh_values), mCh_values, facecolor='#b0b0b0', edgecolor='k')
+def read_trial(tsv_file, time_range):
+    """:return: temperatures recorded strictly between time_range minutes"""
+    table = np.loadtxt(tsv_file, delimiter="\t", ndmin=2)
+    if table.size == 0:
+        return np.zeros(0)
+    times, temperatures = table[:, 0], table[:, 1]
+    return temperatures[(time_range[0] < times) & (times < time_range[1])]
 
-    Cas3_values = []
-    for mouse in Cas3_mice:
-        values = []
-        for trial in mouse.trials:
-            values.append(func(trial))
-        Cas3_values.append(sum(values) / len(values))
-    average = sum(Cas3_values) / len(Cas3_values)
-    plt.bar([2], [average], color="#ffc7b3")
-    plt.scatter([2] * len(Cas3_values), Cas3_values, facecolor='orangered', edgecolor='k')
+
+def bootstrap_means(values, resamples=BOOTSTRAP_RESAMPLES, rng=None):
+    """:return: the mean of each of resamples resamplings (with replacement) of values"""
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(rng)
+    return values[rng.integers(0, len(values), size=(resamples, len(values)))].mean(axis=1)
+
+
+def confidence_interval(samples, confidence=0.95):
+    return np.percentile(samples, [50 * (1 - confidence), 50 * (1 + confidence)])
+
+
+def bar_graph(mCh_values, Cas3_values, ylabel=None, confidence=0.95, rng=None):
+    """
+    :param mCh_values: one value per mCh mouse (see Trials.mouse_averages)
+    :param Cas3_values: one value per Cas3 mouse
+    Bars show the group means with bootstrapped confidence intervals. The title holds the t-test p value and the
+    bootstrapped confidence interval of the difference (Cas3 - mCh)
+    """
+    rng = np.random.default_rng(rng)
+    mCh_means, Cas3_means = bootstrap_means(mCh_values, rng=rng), bootstrap_means(Cas3_values, rng=rng)
+    for x, values, means, color, facecolor in ((1, mCh_values, mCh_means, "lightgray", "#b0b0b0"),
+                                              (2, Cas3_values, Cas3_means, "#ffc7b3", "orangered")):
+        average = np.mean(values)
+        low, high = confidence_interval(means, confidence)
+        plt.bar([x], [average], color=color, yerr=[[average - low], [high - average]], capsize=8)
+        plt.scatter([x] * len(values), values, facecolor=facecolor, edgecolor='k')
 
     plt.xlim([0.5, 2.5])
     plt.xticks([1, 2], ["mCh", "Cas3"])
@@ -81,7 +160,9 @@ def bar_graph(mCh_mice, Cas3_mice, func, ylabel=None):
         plt.ylabel(ylabel)
 
     _, p = scipy.stats.ttest_ind(mCh_values, Cas3_values)
-    plt.title("p=%.3f" % p)
+    low, high = confidence_interval(Cas3_means - mCh_means, confidence)
+    plt.title("p=%.3f, difference %.2f (%i%% CI %.2f to %.2f)" % (p, np.mean(Cas3_values) - np.mean(mCh_values),
+                                                                  confidence * 100, low, high))
     plt.show()
 
 
@@ -104,15 +185,7 @@ if __name__ == "__main__":
         tsv_files = glob.glob(os.path.join(folder, "*", "%s.tsv" % mouse_number))
         mouse = Mouse(mouse_number)
         for tsv_file in tsv_files:
-            temperatures = []
-            with open(tsv_file) as f:
-                for line in f:
-                    time, temperature = line.strip().split("\t")
-                    time, temperature = float(time), float(temperature)
-                    if time_range[0] < time < time_range[1]:
-                        temperatures.append(temperature)
-            temperatures = np.array(temperatures)
-            mouse.trials.append(Trial(temperatures))
+            mouse.trials.append(Trial(read_trial(tsv_file, time_range), mouse_number))
         if vector == "Cas3":
             Cas3_mice.append(mouse)
         if vector == "mCh":
@@ -120,6 +193,7 @@ if __name__ == "__main__":
 
     Cas3_mice = sorted(Cas3_mice, key=lambda x: x.mouse_number)
     mCh_mice = sorted(mCh_mice, key=lambda x: x.mouse_number)
+    Cas3_trials, mCh_trials = Trials(Cas3_mice), Trials(mCh_mice)
     x_position = 5
     fig, ax = plt.subplots()
     for mouse in Cas3_mice:
@@ -177,9 +251,13 @@ if __name__ == "__main__":
     plt.xticks([2.5, 3.5], ["Cas3", "mCh"])
     plt.show()
 
-    bar_graph(mCh_mice, Cas3_mice, lambda x: x.mean, "Mean Temperature")
+    bar_graph(mCh_trials.mouse_averages(mCh_trials.mean), Cas3_trials.mouse_averages(Cas3_trials.mean), "Mean Temperature")
     min_temperature = 25
-    bar_graph(mCh_mice, Cas3_mice, lambda x: np.sum(x.temperatures < min_temperature) / 6, "Minutes below %i °C" % min_temperature)
-    max_temperature = 45
-    for max_temperature in range(35, 45):
-        bar_graph(mCh_mice, Cas3_mice, lambda x: np.sum(x.temperatures > max_temperature) / 6, "Minutes above %i °C" % max_temperature)
\ No newline at end of file
+    bar_graph(mCh_trials.mouse_averages(mCh_trials.minutes_below(min_temperature))[:, 0],
+              Cas3_trials.mouse_averages(Cas3_trials.minutes_below(min_temperature))[:, 0],
+              "Minutes below %i °C" % min_temperature)
+    max_temperatures = np.arange(35, 45)
+    mCh_minutes = mCh_trials.mouse_averages(mCh_trials.minutes_above(max_temperatures))
+    Cas3_minutes = Cas3_trials.mouse_averages(Cas3_trials.minutes_above(max_temperatures))
+    for i, max_temperature in enumerate(max_temperatures):
+        bar_graph(mCh_minutes[:, i], Cas3_minutes[:, i], "Minutes above %i °C" % max_temperature)
\ No newline at end of file
@@ -0,0 +1,134 @@
+import numpy as np
+import matplotlib.dates as mdates
+
+"""
+Multi-resolution plotting for long temperature records.
+A week at 1 Hz is ~600,000 points per record, far more than the axes have pixels. Each record gets a pyramid of
+min/max/mean levels (every level is DECIMATION times coarser than the one below it), and the line only ever holds
+the level that matches the current zoom. Hovering looks up the value by index instead of hit-testing the line data.
+"""
+
+DECIMATION = 4
+POINTS_PER_PIXEL = 2
+
+
+class Pyramid:
+    def __init__(self, times, values):
+        """
+        :param times: sorted floats (e.g. hours, or matplotlib date numbers), or datetime64
+        :param values: values at those times
+        """
+        times = np.asarray(times)
+        if np.issubdtype(times.dtype, np.datetime64):
+            times = mdates.date2num(times)
+        self.times = np.asarray(times, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        # Each level is (bucket start times, bucket end times, minimums, maximums, means)
+        self.levels = [(self.times, self.times, self.values, self.values, self.values)]
+        while len(self.levels[-1][0]) > DECIMATION:
+            starts, ends, minimums, maximums, means = self.levels[-1]
+            indices = np.arange(0, len(starts), DECIMATION)
+            # Means are weighted by the number of raw samples in each bucket (the last bucket can be short)
+            sizes = np.full(len(starts), DECIMATION ** (len(self.levels) - 1))
+            sizes[-1] = len(self.times) - sizes[0] * (len(starts) - 1)
+            self.levels.append((starts[indices],
+                                ends[np.append(indices[1:], len(ends)) - 1],
+                                np.minimum.reduceat(minimums, indices),
+                                np.maximum.reduceat(maximums, indices),
+                                np.add.reduceat(means * sizes, indices) / np.add.reduceat(sizes, indices)))
+
+    def view(self, x_min, x_max, pixels, envelope=True):
+        """
+        :return: x and y arrays covering [x_min, x_max] with at most about POINTS_PER_PIXEL * pixels points.
+            With envelope=True every bucket contributes its minimum and maximum, otherwise its mean
+        """
+        max_points = max(int(pixels * POINTS_PER_PIXEL), 1)
+        for starts, ends, minimums, maximums, means in self.levels:
+            first = max(np.searchsorted(ends, x_min, side="left") - 1, 0)
+            last = min(np.searchsorted(starts, x_max, side="right") + 1, len(starts))
+            if last - first <= max_points:
+                break
+        visible = slice(first, last)
+        if not envelope or starts is self.times:
+            middles = (starts[visible] + ends[visible]) / 2
+            return middles, means[visible]
+        x = np.column_stack((starts[visible], ends[visible])).ravel()
+        y = np.column_stack((minimums[visible], maximums[visible])).ravel()
+        return x, y
+
+    def value_at(self, x):
+        """Raw value at the sample nearest to x"""
+        index = np.searchsorted(self.times, x)
+        if index == len(self.times) or (index > 0 and x - self.times[index - 1] < self.times[index] - x):
+            index -= 1
+        return self.times[index], self.values[index]
+
+
+class PyramidLine:
+    def __init__(self, ax, times, values, envelope=True, **kwargs):
+        """
+        Plots values on ax and re-samples them from the pyramid whenever the x limits change
+        :param kwargs: passed to ax.plot (color, label, ...)
+        """
+        self.ax = ax
+        self.pyramid = Pyramid(times, values)
+        self.envelope = envelope
+        self.line, = ax.plot(self.pyramid.times[:1], self.pyramid.values[:1], **kwargs)
+        ax.update_datalim(np.column_stack((self.pyramid.times[[0, -1]],
+                                           [np.nanmin(self.pyramid.values), np.nanmax(self.pyramid.values)])))
+        ax.autoscale_view()
+        self.update()
+        ax.callbacks.connect("xlim_changed", self.update)
+
+    def update(self, ax=None):
+        x_min, x_max = self.ax.get_xlim()
+        pixels = self.ax.get_window_extent().width
+        self.line.set_data(*self.pyramid.view(x_min, x_max, pixels, self.envelope))
+
+
+class LineHover:
+    def __init__(self, fig, pick_radius=5):
+        """
+        Shows the label of the line under the cursor, for lines added with add_line
+        :param pick_radius: distance in pixels
+        """
+        self.fig = fig
+        self.pick_radius = pick_radius
+        self.lines = {}  # ax -> [PyramidLine...]
+        self.annotations = {}
+        fig.canvas.mpl_connect("motion_notify_event", self.hover)
+
+    def add_line(self, pyramid_line):
+        ax = pyramid_line.ax
+        if ax not in self.lines:
+            self.lines[ax] = []
+            annot = ax.annotate("", xy=(0, 0), xytext=(-20, 20), textcoords="offset points",
+                                bbox=dict(boxstyle="round", fc="w"),
+                                arrowprops=dict(arrowstyle="->"))
+            annot.set_visible(False)
+            self.annotations[ax] = annot
+        self.lines[ax].append(pyramid_line)
+
+    def hover(self, event):
+        for ax, annot in self.annotations.items():
+            was_visible = annot.get_visible()
+            closest = None
+            if event.inaxes == ax:
+                for pyramid_line in self.lines[ax]:
+                    x, y = pyramid_line.pyramid.value_at(event.xdata)
+                    if np.isnan(y):
+                        continue
+                    _, y_pixel = ax.transData.transform((x, y))
+                    distance = abs(y_pixel - event.y)
+                    if distance < self.pick_radius and (closest is None or distance < closest[0]):
+                        closest = (distance, x, y, pyramid_line)
+            if closest is not None:
+                _, x, y, pyramid_line = closest
+                annot.xy = x, y
+                annot.set_text("%s: %.2f" % (pyramid_line.line.get_label(), y))
+                annot.get_bbox_patch().set_alpha(0.4)
+                annot.set_visible(True)
+                self.fig.canvas.draw_idle()
+            elif was_visible:
+                annot.set_visible(False)
+                self.fig.canvas.draw_idle()
@@ -0,0 +1,271 @@
+import abc
+import glob
+import os
+import shutil
+import subprocess
+import time
+import cv2
+import numpy as np
+
+"""
+Sources of small grayscale frames for movement scoring.
+Every source has grab(), which moves to the next frame, and retrieve(), which returns it, so a live source can skip
+frames without decoding them, and read(), which does both.
+OpenCVFrames decodes full-resolution BGR frames and shrinks them in Python, as VideoScoring always has.
+FFmpegFrames has a piped ffmpeg scale and convert to gray while decoding, and reads each frame straight into a reused
+buffer, so only a fraction of the bytes cross into Python. ffmpeg's scaler and gray conversion differ slightly from
+OpenCV's, so movement counts are close to, but not identical with, the OpenCV source (MovementBenchmark.py compares
+them).
+CameraFrames reads a camera, as vLMA.py does, ImageSequenceFrames a folder of images, and SyntheticFrames renders a
+scene in memory, which can be replayed exactly (see MovementBenchmark.py).
+"""
+
+FRAME_WIDTH = 500
+OPEN_ATTEMPTS = 10
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def scaled_shape(video_file_path, width=FRAME_WIDTH):
+    """:return: (height, width) of the frames after resizing to width, as imutils.resize does, and the frame rate"""
+    vs = cv2.VideoCapture(video_file_path)
+    if vs is None or not vs.isOpened():
+        raise IOError("%s does not exist" % video_file_path)
+    source_width = vs.get(cv2.CAP_PROP_FRAME_WIDTH)
+    source_height = vs.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    fps = vs.get(cv2.CAP_PROP_FPS)
+    vs.release()
+    return (int(source_height * width / float(source_width)), width), fps
+
+
+def count_frames(video_file_path, ffprobe="ffprobe"):
+    """
+    :return: number of frames in the video. ffprobe counts the packets of the video stream, which is exact and fast
+        since nothing is decoded. Without ffprobe, the container's frame count is used, which isn't always exact
+    """
+    if shutil.which(ffprobe) is not None:
+        command = [ffprobe, "-v", "error", "-select_streams", "v:0", "-count_packets",
+                   "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", video_file_path]
+        try:
+            output = subprocess.run(command, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+            return int(output.strip().split(",")[0])
+        except (subprocess.CalledProcessError, ValueError):
+            pass
+    vs = cv2.VideoCapture(video_file_path)
+    frame_count = int(vs.get(cv2.CAP_PROP_FRAME_COUNT))
+    vs.release()
+    return frame_count
+
+
+def resize(frame, width):
+    """:return: the frame resized to width, keeping its aspect ratio as imutils.resize does. Unchanged if width is None"""
+    if width is None:
+        return frame
+    height = int(frame.shape[0] * width / float(frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class FrameSource(abc.ABC):
+    @abc.abstractmethod
+    def grab(self):
+        """:return: False at the end of the frames"""
+
+    @abc.abstractmethod
+    def retrieve(self):
+        """:return: the grabbed frame, in grayscale, or None if it couldn't be decoded"""
+
+    def read(self):
+        """:return: the next grayscale frame, or None at the end of the frames"""
+        if not self.grab():
+            return None
+        return self.retrieve()
+
+    def release(self):
+        pass
+
+
+class OpenCVFrames(FrameSource):
+    def __init__(self, video_file_path, width=FRAME_WIDTH, start=0):
+        """
+        :param start: index of the first frame to read
+        """
+        self.width = width
+        self.vs = cv2.VideoCapture(video_file_path)
+        if start > 0:
+            self.vs.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    def grab(self):
+        return self.vs.grab()
+
+    def retrieve(self):
+        frame = self.vs.retrieve()[1]
+        if frame is None:
+            return None
+        return cv2.cvtColor(resize(frame, self.width), cv2.COLOR_BGR2GRAY)
+
+    def release(self):
+        self.vs.release()
+
+
+class CameraFrames(OpenCVFrames):
+    def __init__(self, camera_index, width=None, capture_size=(320, 180), attempts=OPEN_ATTEMPTS):
+        """
+        :param width: frames are left at the capture size if None
+        :param capture_size: (width, height) asked of the camera
+        :param attempts: tries at opening the camera, alternating with DirectShow, which some cameras need on Windows
+        """
+        self.width = width
+        self.vs = cv2.VideoCapture(camera_index)
+        tries = 1
+        while not self.vs.isOpened():
+            print("%s not opened" % camera_index)
+            self.vs.release()
+            if tries == attempts:
+                raise IOError("Camera %s could not be opened" % camera_index)
+            self.vs = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
+            tries += 1
+        self.vs.set(cv2.CAP_PROP_FRAME_WIDTH, capture_size[0])
+        self.vs.set(cv2.CAP_PROP_FRAME_HEIGHT, capture_size[1])
+
+
+class FFmpegFrames(FrameSource):
+    def __init__(self, video_file_path, width=FRAME_WIDTH, start=0, ffmpeg="ffmpeg"):
+        """
+        :param start: index of the first frame to read. ffmpeg seeks by time, so this assumes a constant frame rate.
+            The seek is to halfway between the frame and the one before it, and ffmpeg drops the frames before the
+            seek time, so the rounding of the time (or of the frame rate) can't land on a neighbouring frame
+        :param ffmpeg: path to the ffmpeg executable
+        """
+        self.shape, fps = scaled_shape(video_file_path, width)
+        self.buffer = np.empty(self.shape, dtype=np.uint8)
+        self.view = memoryview(self.buffer).cast("B")
+        command = [ffmpeg, "-loglevel", "error", "-nostdin"]
+        if start > 0:
+            command += ["-ss", "%.6f" % ((start - 0.5) / fps)]
+        command += ["-i", video_file_path, "-an", "-sn", "-fps_mode", "passthrough",
+                    "-vf", "scale=%i:%i:flags=area,format=gray" % (self.shape[1], self.shape[0]),
+                    "-f", "rawvideo", "-pix_fmt", "gray", "-"]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=4 * self.buffer.size)
+
+    def grab(self):
+        """
+        :return: False at the end of the video
+        :raises IOError: if ffmpeg stopped with an error (an unknown option in an old ffmpeg, a bad filter, a decoding
+            error), rather than letting that look like the end of the video
+        """
+        filled = 0
+        while filled < self.buffer.size:
+            count = self.process.stdout.readinto(self.view[filled:])
+            if not count:
+                if self.process.wait() != 0:
+                    raise IOError("ffmpeg exited with status %i" % self.process.returncode)
+                return False
+            filled += count
+        return True
+
+    def retrieve(self):
+        """:return: the frame, in a buffer that the next grab overwrites, so copy it to keep it"""
+        return self.buffer
+
+    def release(self):
+        self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+
+
+class ImageSequenceFrames(FrameSource):
+    def __init__(self, folder, width=FRAME_WIDTH, start=0):
+        """
+        :param folder: folder of images, read in order of their names, or a glob pattern of the images
+        """
+        pattern = os.path.join(glob.escape(folder), "*") if os.path.isdir(folder) else folder
+        self.image_paths = sorted(path for path in glob.glob(pattern)
+                                  if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+        self.width = width
+        self.index = start - 1
+
+    def grab(self):
+        if self.index + 1 >= len(self.image_paths):
+            return False
+        self.index += 1
+        return True
+
+    def retrieve(self):
+        frame = cv2.imread(self.image_paths[self.index], cv2.IMREAD_GRAYSCALE)
+        if frame is None:
+            return None
+        return resize(frame, self.width)
+
+
+class SyntheticFrames(FrameSource):
+    """
+    A scene rendered in memory: bright blobs on a textured background, which move in bouts and rest in between, with
+    the lighting slowly drifting and sometimes switching (lights turned on or off in the room), and camera noise.
+    Frame k only depends on the seed and k, so a run can be replayed exactly, from any start
+    """
+    def __init__(self, width=FRAME_WIDTH, height=None, number_of_frames=1000, start=0, seed=0, blobs=2,
+                 lighting_switches=2, noise=12, fps=12, realtime=False):
+        """
+        :param noise: largest brightness of the camera noise. Below the movement threshold, so noise alone isn't
+            movement, but it adds up with the lighting changes
+        :param realtime: grab waits for each frame's time at fps, as a camera would
+        """
+        self.shape = (height or width * 3 // 4, width)
+        self.number_of_frames = number_of_frames
+        self.seed = seed
+        self.noise = noise
+        self.fps = fps
+        self.realtime = realtime
+        self.index = start - 1
+        self.start_time = None
+        rng = np.random.default_rng(seed)
+        texture = rng.integers(40, 120, self.shape, dtype=np.uint8)
+        self.background = cv2.GaussianBlur(texture, (0, 0), 3)
+        # Each blob: center, amplitude and frequency of its path, active and resting bout lengths, radius, brightness
+        self.blobs = []
+        for _ in range(blobs):
+            self.blobs.append({"center": rng.uniform(0.3, 0.7, 2) * self.shape[::-1],
+                               "amplitude": rng.uniform(0.1, 0.25, 2) * self.shape[::-1],
+                               "frequency": rng.uniform(0.05, 0.2, 2), "phase": rng.uniform(0, 2 * np.pi, 2),
+                               "active": rng.uniform(5, 30), "resting": rng.uniform(5, 60),
+                               "radius": int(rng.uniform(0.03, 0.06) * width), "brightness": int(rng.integers(180, 240))})
+        switch_times = np.sort(rng.uniform(0, number_of_frames / fps, lighting_switches))
+        self.switches = [(switch_time, rng.choice([-0.3, 0.3])) for switch_time in switch_times]
+
+    def active_time(self, blob, t):
+        """:return: seconds the blob has spent moving by time t"""
+        period = blob["active"] + blob["resting"]
+        return (t // period) * blob["active"] + min(t % period, blob["active"])
+
+    def render(self, index):
+        t = index / self.fps
+        frame = self.background.copy()
+        for blob in self.blobs:
+            moving = self.active_time(blob, t)
+            x, y = blob["center"] + blob["amplitude"] * np.sin(2 * np.pi * blob["frequency"] * moving + blob["phase"])
+            cv2.circle(frame, (int(x), int(y)), blob["radius"], blob["brightness"], -1, lineType=cv2.LINE_AA)
+        gain = 1 + 0.05 * np.sin(2 * np.pi * t / 600) + sum(step for switch_time, step in self.switches if switch_time <= t)
+        frame = cv2.convertScaleAbs(frame, alpha=gain)
+        if self.noise:
+            rng = np.random.default_rng((self.seed, index))
+            frame = cv2.add(frame, rng.integers(0, self.noise, self.shape, dtype=np.uint8))
+        return frame
+
+    def grab(self):
+        if self.index + 1 >= self.number_of_frames:
+            return False
+        self.index += 1
+        if self.realtime:
+            if self.start_time is None:
+                self.start_time = time.monotonic() - self.index / self.fps
+            time.sleep(max(self.start_time + self.index / self.fps - time.monotonic(), 0))
+        return True
+
+    def retrieve(self):
+        return self.render(self.index)
+
+
+BACKENDS = {"opencv": OpenCVFrames, "ffmpeg": FFmpegFrames}
+
+
+def open_frames(video_file_path, width=FRAME_WIDTH, start=0, backend="opencv"):
+    return BACKENDS[backend](video_file_path, width=width, start=start)
@@ -0,0 +1,187 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import cv2
+import numpy as np
+import FrameSources
+import VideoScoring
+
+"""
+Benchmarks the movement pipeline of VideoScoring.py (grab, decode to a small grayscale frame, difference) on frame
+sources that can be replayed, and reports the frames/s, the time spent in each stage and how well the moved pixels of
+every frame difference agree with a reference source.
+Without a video, a FrameSources.SyntheticFrames scene is the reference, and it's also saved as a video file and as an
+image sequence, to see what the codec and every backend change:
+    python MovementBenchmark.py -n 2000
+With a video, every backend reads it, compared to the OpenCV backend (what VideoScoring.py uses by default):
+    python MovementBenchmark.py -v 02550.mp4 -m "02550 Mask.jpg"
+A camera can be added with -c, without a comparison, since it can't be replayed.
+"""
+
+STAGES = ("grab", "retrieve", "difference")
+
+
+def write_video(source, video_file_path, fps=12):
+    """Saves every frame of the source as a video. :return: the number of frames"""
+    writer = None
+    count = 0
+    frame = source.read()
+    while frame is not None:
+        if writer is None:
+            writer = cv2.VideoWriter(video_file_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, frame.shape[::-1])
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+        count += 1
+        frame = source.read()
+    source.release()
+    if writer is not None:
+        writer.release()
+    return count
+
+
+def write_image_sequence(source, folder):
+    """Saves every frame of the source as a numbered png. :return: the number of frames"""
+    os.makedirs(folder, exist_ok=True)
+    count = 0
+    frame = source.read()
+    while frame is not None:
+        cv2.imwrite(os.path.join(folder, "%06i.png" % count), frame)
+        count += 1
+        frame = source.read()
+    source.release()
+    return count
+
+
+def run_pipeline(source, number_of_frames, mask=None):
+    """
+    Reads up to number_of_frames frames and counts the moved pixels between them, as VideoScoring.py does
+    :param mask: full-frame mask. Every pixel counts if None
+    :return: array of the moved pixels of every frame difference, dictionary of stage -> seconds
+    """
+    stage_times = dict.fromkeys(STAGES, 0.0)
+    moved_pixels = []
+    differencer = None
+    for _ in range(number_of_frames):
+        start = time.perf_counter()
+        if not source.grab():
+            break
+        grabbed = time.perf_counter()
+        frame = source.retrieve()
+        retrieved = time.perf_counter()
+        if frame is None:
+            break
+        if differencer is None:
+            differencer = VideoScoring.FrameDifferencer([mask if mask is not None else np.full_like(frame, 255)])
+            differencer.start(frame)
+        else:
+            moved_pixels.append(differencer.moved_pixels(frame)[0])
+        differenced = time.perf_counter()
+        stage_times["grab"] += grabbed - start
+        stage_times["retrieve"] += retrieved - grabbed
+        stage_times["difference"] += differenced - retrieved
+    source.release()
+    return np.array(moved_pixels, dtype=np.int64), stage_times
+
+
+def agreement(moved_pixels, reference):
+    """
+    :return: mean absolute difference in moved pixels per frame difference, that as a percent of the reference's total,
+        and the correlation with the reference
+    """
+    length = min(len(moved_pixels), len(reference))
+    if length == 0:
+        return np.nan, np.nan, np.nan
+    moved_pixels, reference = moved_pixels[:length], reference[:length]
+    difference = np.abs(moved_pixels - reference)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = np.corrcoef(moved_pixels, reference)[0, 1]
+    return np.mean(difference), 100 * np.sum(difference) / max(np.sum(reference), 1), correlation
+
+
+def benchmark(sources, number_of_frames, reference=None, mask=None):
+    """
+    :param sources: dictionary of name -> function opening the source, so every run starts from the first frame
+    :param reference: name of the source the others are compared to
+    :return: dictionary of name -> (frames/s, dictionary of stage -> ms per frame, moved pixels, agreement), with an
+        agreement of None for the reference and when there's no reference
+    """
+    runs = {}
+    for name, open_source in sources.items():
+        moved_pixels, stage_times = run_pipeline(open_source(), number_of_frames, mask)
+        runs[name] = (moved_pixels, stage_times)
+    results = {}
+    for name, (moved_pixels, stage_times) in runs.items():
+        frames = len(moved_pixels) + 1
+        elapsed = sum(stage_times.values())
+        stage_milliseconds = {stage: 1000 * seconds / frames for stage, seconds in stage_times.items()}
+        compared = agreement(moved_pixels, runs[reference][0]) if reference is not None and name != reference else None
+        results[name] = (frames / max(elapsed, 1e-9), stage_milliseconds, moved_pixels, compared)
+    return results
+
+
+def print_results(results, reference=None):
+    print("%-12s %9s %s %s" % ("Source", "Frames/s", " ".join("%10s" % ("%s ms" % stage) for stage in STAGES),
+                               "Agreement with %s" % reference if reference else ""))
+    for name, (frames_per_second, stage_milliseconds, moved_pixels, compared) in results.items():
+        line = "%-12s %9.1f %s" % (name, frames_per_second,
+                                   " ".join("%10.3f" % stage_milliseconds[stage] for stage in STAGES))
+        if compared is not None:
+            line += " off by %.1f pixels per difference (%.2f%% of the total), r = %.4f" % compared
+        elif name == reference:
+            line += " reference"
+        print(line)
+
+
+def synthetic_sources(folder, number_of_frames, width, seed, backends):
+    """
+    Renders the synthetic scene, and saves it as a video and an image sequence in folder
+    :return: dictionary of name -> function opening the source
+    """
+    def synthetic():
+        return FrameSources.SyntheticFrames(width=width, number_of_frames=number_of_frames, seed=seed)
+
+    video_file_path = os.path.join(folder, "Synthetic.mp4")
+    image_folder = os.path.join(folder, "Synthetic")
+    write_video(synthetic(), video_file_path)
+    write_image_sequence(synthetic(), image_folder)
+    sources = {"synthetic": synthetic}
+    for backend in backends:
+        sources[backend] = lambda backend=backend: FrameSources.open_frames(video_file_path, width=width,
+                                                                            backend=backend)
+    sources["images"] = lambda: FrameSources.ImageSequenceFrames(image_folder, width=width)
+    return sources
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-v", "--video", default=None, help="Video to benchmark. A synthetic scene if not given")
+    ap.add_argument("-m", "--mask", default=None, help="Mask of the video, as made for VideoScoring.py")
+    ap.add_argument("-n", "--frames", type=int, default=1000, help="Number of frames to read from each source")
+    ap.add_argument("-c", "--camera", type=int, default=None, help="Index of a camera to add")
+    ap.add_argument("-s", "--seed", type=int, default=0, help="Seed of the synthetic scene")
+    ap.add_argument("-k", "--keep", default=None, help="Folder to keep the synthetic video and images in")
+    args = vars(ap.parse_args())
+
+    backends = [backend for backend in FrameSources.BACKENDS if backend != "ffmpeg" or shutil.which("ffmpeg")]
+    width = FrameSources.FRAME_WIDTH
+    folder = None
+    if args["video"]:
+        sources = {backend: lambda backend=backend: FrameSources.open_frames(args["video"], width=width, backend=backend)
+                   for backend in backends}
+        reference = "opencv"
+    else:
+        folder = args["keep"] or tempfile.mkdtemp()
+        os.makedirs(folder, exist_ok=True)
+        sources = synthetic_sources(folder, args["frames"], width, args["seed"], backends)
+        reference = "synthetic"
+    if args["camera"] is not None:
+        sources["camera"] = lambda: FrameSources.CameraFrames(args["camera"], width=width)
+    mask = VideoScoring.load_mask(args["mask"]) if args["mask"] else None
+    results = benchmark(sources, args["frames"], reference, mask)
+    if "camera" in results:
+        # Frames from a camera aren't the same as the reference's, so comparing them means nothing
+        results["camera"] = results["camera"][:3] + (None,)
+    print_results(results, reference)
+    if folder is not None and args["keep"] is None:
+        shutil.rmtree(folder)
@@ -0,0 +1,190 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import numpy as np
+
+"""
+Exports epoch movement (from VideoScoring.py) as movement files and as score files that look like the ones exported by
+Sirenia, for whole arrays of epochs at once.
+The lines of a score file only differ between thresholds in their score, so a sweep of thresholds formats every epoch
+once, and each threshold's file is just a choice between the sleep and the wake version of every line. This makes it
+cheap to write a file per threshold for every mouse, to compare against the EEG scoring (see CompareVideoScoring.py):
+    python ScoreExport.py -m "Movement Files/*.tsv" -t 1000 2000 5000 -o "Score Files"
+"""
+
+SIRENIA_ORIGIN = np.datetime64("1899-12-30T19:00:00", "s")  # Sirenia's time stamps are days since this
+SECONDS_PER_DAY = 86400
+SLEEP_SCORE = "2"
+WAKE_SCORE = "1"
+# Where each strftime directive is in numpy's ISO times (YYYY-MM-DDTHH:MM:SS)
+ISO_POSITIONS = {"Y": range(0, 4), "m": range(5, 7), "d": range(8, 10), "H": range(11, 13), "M": range(14, 16),
+                 "S": range(17, 19)}
+
+
+def directive_columns(time_format):
+    """
+    :return: for every character of a time formatted with time_format, its position in numpy's ISO time, or its
+        literal byte for characters that aren't from a directive
+    """
+    columns = []
+    i = 0
+    while i < len(time_format):
+        if time_format[i] == "%":
+            columns.extend(ISO_POSITIONS[time_format[i + 1]])
+            i += 2
+        else:
+            columns.append(time_format[i].encode())
+            i += 1
+    return columns
+
+
+def format_times(times, time_format):
+    """
+    strftime for an array of times, done by rearranging the characters of numpy's ISO times
+    :param times: datetime64 array. Fractions of a second are dropped
+    :param time_format: strftime format using only %Y, %m, %d, %H, %M and %S
+    :return: byte string array of the formatted times
+    """
+    iso = np.datetime_as_string(np.asarray(times).astype("datetime64[s]"), unit="s").astype("S19")
+    iso = iso.view("S1").reshape(len(iso), 19)
+    columns = directive_columns(time_format)
+    formatted = np.empty((len(iso), len(columns)), dtype="S1")
+    for i, column in enumerate(columns):
+        formatted[:, i] = iso[:, column] if isinstance(column, int) else column
+    return formatted.view("S%i" % len(columns)).ravel()
+
+
+def parse_times(strings, time_format):
+    """
+    strptime for an array of fixed width strings, the reverse of format_times
+    :return: datetime64 array of the times
+    """
+    strings = np.asarray(strings).astype("S")
+    columns = directive_columns(time_format)
+    characters = strings.astype("S%i" % len(columns)).view("S1").reshape(len(strings), len(columns))
+    iso = np.tile(np.array(list(b"0000-01-01T00:00:00"), dtype=np.uint8).view("S1"), (len(strings), 1))
+    for i, column in enumerate(columns):
+        if isinstance(column, int):
+            iso[:, column] = characters[:, i]
+    return iso.view("S19").ravel().astype("datetime64[s]")
+
+
+def record_arrays(record):
+    """
+    :param record: list of tuples, of the form (epoch datetime.datetime, number of changed pixels in that epoch)
+    :return: datetime64 array of the epochs, int array of the changed pixels
+    """
+    times = np.array([r[0] for r in record], dtype="datetime64[us]")
+    pixels = np.array([r[1] for r in record], dtype=np.int64)
+    return times, pixels
+
+
+def read_movement_file(file_path):
+    """:return: datetime64 array of the epochs, int array of the changed pixels, from a movement file"""
+    with open(file_path) as f:
+        words = [line.rstrip("\n").split("\t") for line in f if line.strip()]
+    if len(words) == 0:
+        return np.zeros(0, dtype="datetime64[s]"), np.zeros(0, dtype=np.int64)
+    words = np.array(words)
+    return parse_times(words[:, 0], "%m/%d/%Y %H:%M:%S"), words[:, 1].astype(np.int64)
+
+
+def movement_text(times, pixels):
+    """:return: the contents of a movement file, as create_movement_file in VideoScoring.py writes it"""
+    lines = np.char.add(np.char.add(format_times(times, "%m/%d/%Y %H:%M:%S"), b"\t"),
+                        np.asarray(pixels, dtype=np.int64).astype("S"))
+    return b"".join(np.char.add(lines, b"\n")).decode()
+
+
+def write_movement_file(times, pixels, output_file):
+    # Written to a temporary file first, so an interrupted run never leaves a partial movement file behind
+    temporary_file = output_file + ".tmp"
+    with open(temporary_file, "w+") as f:
+        f.write(movement_text(times, pixels))
+    os.replace(temporary_file, output_file)
+
+
+def sirenia_time_stamps(times):
+    """:return: Sirenia's time stamp of every time, in days, ignoring fractions of a second"""
+    seconds = (np.asarray(times).astype("datetime64[s]") - SIRENIA_ORIGIN).astype(np.int64)
+    days, seconds = np.divmod(seconds, SECONDS_PER_DAY)
+    return days + seconds / SECONDS_PER_DAY
+
+
+def sirenia_header(times):
+    def date_line(name, time):
+        return "%s:\t%.8f\t%s\n" % (name, sirenia_time_stamps([time])[0],
+                                    time.astype("datetime64[s]").item().strftime("%m/%d/%Y %I:%M:%S %p"))
+    return ("Channels:\t1\n" + "Count:\t%d\n" % len(times) + date_line("Start", times[0]) +
+            date_line("End", times[-1]) + "Parameters\t4\n" + "NonRem\t2\n" + "REM\t3\n" + "Unscored\t255\n" +
+            "Wake\t1\n\n" + "Date\tTime\tTime Stamp\tTime from Start\tCompy_Numeric\n")
+
+
+class SireniaLines:
+    """
+    Every epoch's score file line, formatted once, with a sleep and a wake version
+    """
+    def __init__(self, times, pixels):
+        self.pixels = np.asarray(pixels)
+        self.header = sirenia_header(times) if len(times) else ""
+        lines = np.char.add(format_times(times, "%m/%d/%Y\t%H:%M:%S\t"),
+                            np.char.mod("%.8f", sirenia_time_stamps(times)).astype("S"))
+        lines = np.char.add(np.char.add(lines, b"\t"), (10 * np.arange(len(times))).astype("S"))
+        self.sleep_lines = np.char.add(lines, ("\t%s\n" % SLEEP_SCORE).encode())
+        self.wake_lines = np.char.add(lines, ("\t%s\n" % WAKE_SCORE).encode())
+
+    def text(self, threshold):
+        """
+        :param threshold: number of changed pixels per epoch; epochs with fewer will be scored as sleep
+        :return: the contents of the score file
+        """
+        return self.header + b"".join(np.where(self.pixels < threshold, self.sleep_lines, self.wake_lines)).decode()
+
+
+def write_sirenia_files(times, pixels, thresholds, output_files):
+    """
+    Writes one score file per threshold, formatting the epochs once
+    """
+    lines = SireniaLines(times, pixels)
+    for threshold, output_file in zip(thresholds, output_files):
+        with open(output_file, "w+") as f:
+            f.write(lines.text(threshold))
+    return output_files
+
+
+def threshold_file_path(output_directory, movement_file_path, threshold):
+    mouse_number = os.path.splitext(os.path.basename(movement_file_path))[0]
+    return os.path.join(output_directory, "%s Threshold %g.tsv" % (mouse_number, threshold))
+
+
+def export_sweep(movement_file_path, thresholds, output_directory):
+    """Run in a worker process. :return: the score files written"""
+    times, pixels = read_movement_file(movement_file_path)
+    output_files = [threshold_file_path(output_directory, movement_file_path, threshold) for threshold in thresholds]
+    return write_sirenia_files(times, pixels, thresholds, output_files)
+
+
+def export_mice(movement_file_paths, thresholds, output_directory, processes=None):
+    """
+    Writes a score file for every threshold of every mouse, several mice at once
+    :param thresholds: the same thresholds for every mouse, or a dictionary of movement file path -> thresholds
+    :return: list of the score files written
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    jobs = [(movement_file_path, thresholds[movement_file_path] if isinstance(thresholds, dict) else thresholds,
+             output_directory) for movement_file_path in movement_file_paths]
+    with multiprocessing.Pool(processes) as pool:
+        return [output_file for output_files in pool.starmap(export_sweep, jobs) for output_file in output_files]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-m", "--movement", nargs="+", help="Movement files from VideoScoring.py (globs are expanded)")
+    ap.add_argument("-t", "--thresholds", nargs="+", type=float, help="Changed pixels per epoch below which is sleep")
+    ap.add_argument("-o", "--output", default="Score Files", help="Directory to write the score files to")
+    ap.add_argument("-p", "--processes", type=int, default=multiprocessing.cpu_count(), help="Mice exported at once")
+    args = vars(ap.parse_args())
+    movement_file_paths = sorted(set(file_path for pattern in args["movement"] for file_path in glob.glob(pattern)))
+    output_files = export_mice(movement_file_paths, args["thresholds"], args["output"], args["processes"])
+    print("%i score files written for %i mice" % (len(output_files), len(movement_file_paths)))
@@ -1,14 +1,27 @@
 import argparse
+import glob
+import json
+import shutil
 import imutils
 import time
 from PIL import Image
 import cv2
 import numpy as np
 import datetime
+import copy
 import ctypes
-import matplotlib.pyplot as plt
+import multiprocessing
 import os
 import pandas as pd
+import FrameSources
+import ScoreExport
+
+
+EPOCH_LENGTH = datetime.timedelta(seconds=10)
+MOVEMENT_THRESHOLD = 25  # Change in brightness for a pixel to count as moved
+CHECKPOINT_INTERVAL = 6000  # Frame differences scored between checkpoints
+CHECKPOINT_FOLDER = os.path.join("Movement Files", "Checkpoints")
+SEGMENT_DIFFERENCES = 12 * 60 * 60  # Longest segment, so epochs are written to disk as the video is scored
 
 
 class VideoFile:
@@ -27,6 +40,27 @@ class VideoFile:
         self.end_time = datetime.datetime.strptime(self.end_time, "%m/%d/%Y %I:%M:%S %p")
         self.movement_file_path = os.path.join("Movement Files", mouse_number + ".tsv")
 
+    def arenas(self):
+        """
+        A camera covering several cages has one mask per cage, saved as Mouse number Mask Arena name.jpg
+        (Ex: 02550 Mask 02551.jpg), and each arena gets its own movement file, named after the arena.
+        Otherwise the whole video is one arena, masked by Mouse number Mask.jpg
+        :return: dictionary of arena name -> (mask file path, movement file path)
+        """
+        prefix = self.base_path + " Mask "
+        arena_masks = sorted(glob.glob(glob.escape(prefix) + "*.jpg"))
+        if len(arena_masks) == 0:
+            mouse_number = os.path.basename(self.base_path)
+            return {mouse_number: (self.mask_file_path, self.movement_file_path)}
+        arenas = {}
+        for mask_file_path in arena_masks:
+            name = mask_file_path[len(prefix):-len(".jpg")]
+            arenas[name] = (mask_file_path, os.path.join("Movement Files", name + ".tsv"))
+        return arenas
+
+    def is_scored(self):
+        return all(os.path.exists(movement_file_path) for _, movement_file_path in self.arenas().values())
+
 
 class FrameToTime:
     """
@@ -69,34 +103,7 @@ def create_sirenia_score_file(record, threshold, output_file):
     :param output_file: filepath to write to
     :return:
     """
-    with open(output_file, "w+") as f:
-        start_count = datetime.datetime(year=1899, month=12, day=30, hour=19, minute=0, second=0)
-        f.write("Channels:\t1\n")
-        f.write("Count:\t%d\n" % len(record))
-
-        time_since_start_count = record[0][0] - start_count
-        f.write("Start:\t%.8f\t%s\n" %
-                (time_since_start_count.days + time_since_start_count.seconds / 86400,
-                 record[0][0].strftime("%m/%d/%Y %I:%M:%S %p")))
-        time_since_start_count = record[-1][0] - start_count
-        f.write("End:\t%.8f\t%s\n" %
-                (time_since_start_count.days + time_since_start_count.seconds / 86400,
-                 record[-1][0].strftime("%m/%d/%Y %I:%M:%S %p")))
-        f.write("Parameters\t4\n")
-        f.write("NonRem\t2\n")
-        f.write("REM\t3\n")
-        f.write("Unscored\t255\n")
-        f.write("Wake\t1\n\n")
-        f.write("Date\tTime\tTime Stamp\tTime from Start\tCompy_Numeric\n")
-
-        for i, r in enumerate(record):
-            date = r[0].strftime("%m/%d/%Y")
-            time = r[0].strftime("%H:%M:%S")
-            time_since_start_count = r[0] - start_count
-            time_stamp = time_since_start_count.days + time_since_start_count.seconds / 86400
-            time_from_start = 10 * i
-            score = "2" if r[1] < threshold else "1"
-            f.write("%s\t%s\t%.8f\t%d\t%s\n" % (date, time, time_stamp, time_from_start, score))
+    ScoreExport.write_sirenia_files(*ScoreExport.record_arrays(record), [threshold], [output_file])
 
 
 def create_movement_file(record, output_file):
@@ -107,9 +114,7 @@ def create_movement_file(record, output_file):
     :param output_file: filepath to write to
     :return:
     """
-    with open(output_file, "w+") as f:
-        for r in record:
-            f.write("%s\t%i\n" % (r[0].strftime("%m/%d/%Y %H:%M:%S"), r[1]))
+    ScoreExport.write_movement_file(*ScoreExport.record_arrays(record), output_file)
 
 
 def generate_still(video_file_path):
@@ -132,95 +137,325 @@ def save_video_still(vf):
     cv2.imwrite(vf.still_path, frame)
 
 
-def analyze_video(vf):
-    ftm = FrameToTime(vf.start_time, vf.end_time, vf.framerate, vf.duration)
-    EPOCH_LENGTH = datetime.timedelta(seconds=10)
-    mouse_number = os.path.splitext(os.path.basename(vf.video_file_path))[0]
-    print(mouse_number)
-    vs = cv2.VideoCapture(vf.video_file_path)
-    last_frame = vs.read()[1]
-    last_frame = imutils.resize(last_frame, width=500)
-    last_frame = cv2.cvtColor(last_frame, cv2.COLOR_BGR2GRAY)
-    frame_number = 0
-    mask = load_mask(vf.mask_file_path)
+def split_frames(number_of_frames, number_of_segments):
+    """
+    :return: list of (start, stop) ranges of frame differences, where difference k compares frames k and k + 1.
+        The last range is open-ended, in case the frame count isn't exact
+    """
+    if number_of_frames <= 1:
+        return [(0, None)]
+    boundaries = np.unique(np.linspace(0, number_of_frames - 1, number_of_segments + 1).astype(int))
+    ranges = [(int(a), int(b)) for a, b in zip(boundaries[:-1], boundaries[1:])]
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
 
+class MaskCrop:
     """
-    This section of code throws away video frames until we get to one that is lined up with
-    the start of an EEG epoch
-    if args["epoch"] is not None:
-        epoch_start = datetime.datetime.strptime(args["epoch"], "%m/%d/%Y %I:%M:%S %p")
-        while (ftm.frame_to_time(frame_number) - epoch_start).seconds % 10 != 0:
-            frame = vs.read()[1]
-            frame_number += 1
+    The bounding box of a mask, and the mask within it, so only the pixels that can count are differenced
     """
+    def __init__(self, mask):
+        ys, xs = np.nonzero(mask)
+        if len(ys) == 0:
+            ys, xs = np.array([0]), np.array([0])
+        self.rows = slice(ys.min(), ys.max() + 1)
+        self.columns = slice(xs.min(), xs.max() + 1)
+        self.mask = np.where(mask[self.rows, self.columns] > 0, 255, 0).astype(np.uint8)
 
-    last_frame = np.multiply(last_frame, mask)
-    record = []
-    reached_end = False
-    start = time.time()
-    predicted_number_frames = ftm.framerate * ftm.duration.seconds
-    start_record_time = ftm.frame_to_time(frame_number)
-    epochs_from_start = 0
-    while not reached_end:
-        movement_pixels = 0
-        epochs_from_start += 1
-        frames = []
-        b = np.repeat(mask[:, :, np.newaxis], 3, axis=2)
-        while ftm.frame_to_time(frame_number) < start_record_time + EPOCH_LENGTH * epochs_from_start:
-            text = "No movement"
-
-            frame = vs.read()[1]
-            if frame_number % 1000 == 0:
-                number_done = int(30 * frame_number / predicted_number_frames)
-                print("[%s%s] %s/%s" % ("#" * number_done, "-" * (30-number_done), frame_number, predicted_number_frames))
-            if frame is None:
-                reached_end = True
-                break
-            frame = imutils.resize(frame, width=500)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    def crop(self, frame):
+        return frame[self.rows, self.columns]
+
+
+class FrameDifferencer:
+    """
+    Counts the moved pixels between consecutive frames within each of several masks (arenas). Frames are differenced
+    once, over the bounding box of all the masks, reusing the same buffers for every frame
+    """
+    def __init__(self, masks):
+        """
+        :param masks: list of full-frame masks, one per arena
+        """
+        self.bounds = MaskCrop(np.bitwise_or.reduce(np.array(masks), axis=0))
+        shape = self.bounds.mask.shape
+        self.last_frame = np.empty(shape, dtype=np.uint8)
+        self.frame = np.empty(shape, dtype=np.uint8)
+        self.delta = np.empty(shape, dtype=np.uint8)
+        self.thresh = np.empty(shape, dtype=np.uint8)
+        # Each arena's crop, relative to the bounding box, and a buffer for its masked pixels
+        self.arenas = []
+        for mask in masks:
+            crop = MaskCrop(mask)
+            rows = slice(crop.rows.start - self.bounds.rows.start, crop.rows.stop - self.bounds.rows.start)
+            columns = slice(crop.columns.start - self.bounds.columns.start,
+                            crop.columns.stop - self.bounds.columns.start)
+            self.arenas.append((rows, columns, crop.mask, np.empty_like(crop.mask)))
+        self.counts = np.zeros(len(masks), dtype=np.int64)
+
+    def start(self, frame):
+        np.copyto(self.last_frame, self.bounds.crop(frame))
+
+    def moved_pixels(self, frame):
+        """
+        :return: number of pixels in each mask that changed by more than MOVEMENT_THRESHOLD since the last frame.
+            The array is reused by the next call
+        """
+        np.copyto(self.frame, self.bounds.crop(frame))
+        cv2.absdiff(self.last_frame, self.frame, dst=self.delta)
+        cv2.threshold(self.delta, MOVEMENT_THRESHOLD, 255, cv2.THRESH_BINARY, dst=self.thresh)
+        for i, (rows, columns, mask, masked) in enumerate(self.arenas):
+            cv2.bitwise_and(self.thresh[rows, columns], mask, dst=masked)
+            self.counts[i] = cv2.countNonZero(masked)
+        self.last_frame, self.frame = self.frame, self.last_frame
+        return self.counts
 
-            #This code displays each frame individually to allow for frame-by-frame analysis
 
+def save_checkpoint(checkpoint_file, moved_pixels, finished):
+    temporary_file = checkpoint_file + ".tmp"
+    with open(temporary_file, "wb") as f:
+        np.savez(f, moved_pixels=moved_pixels, finished=finished)
+    os.replace(temporary_file, checkpoint_file)
 
-            frame = np.multiply(frame, mask)
 
-            frame_delta = cv2.absdiff(last_frame, frame)
-            thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-            moved_pixels = np.sum(thresh) / 255
-            movement_pixels += moved_pixels
+def load_checkpoint(checkpoint_file, number_of_arenas):
+    """:return: moved pixels scored so far, and whether the segment was finished"""
+    if checkpoint_file is None or not os.path.exists(checkpoint_file):
+        return np.zeros((0, number_of_arenas), dtype=np.int64), False
+    with np.load(checkpoint_file) as checkpoint:
+        return checkpoint["moved_pixels"], bool(checkpoint["finished"])
 
-            if frame_number % 1000 == 0 and moved_pixels >= 1:
-                fig, ax = plt.subplots(nrows=2, ncols=2)
-                fig.suptitle(start_record_time + EPOCH_LENGTH * (epochs_from_start - 1))
-                ax[0, 0].imshow(last_frame, cmap="gray")
-                ax[0, 1].imshow(frame, cmap="gray")
-                ax[1, 0].imshow(frame_delta, cmap="gray")
-                ax[1, 1].imshow(thresh, cmap="gray")
-                plt.show()
 
-            frame_number += 1
-            last_frame = frame
+def count_moved_pixels(video_file_path, masks, start, stop, backend="opencv", checkpoint_file=None):
+    """
+    Frame differences [start, stop) of the video (stop=None reads to the end). Frame start is read again as the
+    previous frame, so segments overlap by one frame. Run in a worker process
+    :param masks: list of full-frame masks, one per arena
+    :param backend: frame source (see FrameSources.BACKENDS)
+    :param checkpoint_file: progress is saved here every CHECKPOINT_INTERVAL differences, and resumed from it.
+        The segment is only marked finished once all of it is scored
+    :return: start, (differences, arenas) array with the number of moved pixels in each difference
+    :raises IOError: if the frames ran out before stop, or the first frame couldn't be read. The checkpoint is left
+        unfinished, so the next run resumes the segment
+    """
+    scored, finished = load_checkpoint(checkpoint_file, len(masks))
+    if finished:
+        return start, scored
+    count = len(scored)
+    source = FrameSources.open_frames(video_file_path, width=masks[0].shape[1], start=start + count, backend=backend)
+    differencer = FrameDifferencer(masks)
+    moved_pixels = np.zeros((max(stop - start if stop is not None else 1 << 16, count), len(masks)), dtype=np.int64)
+    moved_pixels[:count] = scored
+    try:
+        frame = source.read()
+        if frame is None:
+            raise IOError("Frame %i of %s could not be read" % (start + count, video_file_path))
+        differencer.start(frame)
+        while stop is None or start + count < stop:
+            frame = source.read()
+            if frame is None:
+                break
+            if count == len(moved_pixels):
+                moved_pixels = np.concatenate((moved_pixels, np.zeros_like(moved_pixels)))
+            moved_pixels[count] = differencer.moved_pixels(frame)
+            count += 1
+            if checkpoint_file is not None and count % CHECKPOINT_INTERVAL == 0:
+                save_checkpoint(checkpoint_file, moved_pixels[:count], finished=False)
+    finally:
+        source.release()
+    finished = stop is None or start + count == stop
+    if checkpoint_file is not None:
+        save_checkpoint(checkpoint_file, moved_pixels[:count], finished=finished)
+    if not finished:
+        raise IOError("%s ended after frame %i, before the end of its segment at frame %i"
+                      % (video_file_path, start + count, stop))
+    return start, moved_pixels[:count]
+
+
+def plan_segments(vf, arenas, backend, segments_per_video):
+    """
+    Segments are saved with the checkpoints, so a restarted run resumes the same segments even with a different
+    number of processes. Checkpoints for other arenas or another frame source are discarded
+    :return: checkpoint folder, number of frames in the video, list of (start, stop) segments
+    """
+    folder = os.path.join(CHECKPOINT_FOLDER, os.path.basename(vf.base_path))
+    plan_file = os.path.join(folder, "Plan.json")
+    plan = {"video": vf.video_file_path, "arenas": list(arenas), "backend": backend}
+    if os.path.exists(plan_file):
+        with open(plan_file) as f:
+            saved_plan = json.load(f)
+        if {key: saved_plan.get(key) for key in plan} == plan and "frames" in saved_plan:
+            print("Resuming %s" % vf.video_file_path)
+            return folder, saved_plan["frames"], [tuple(segment) for segment in saved_plan["segments"]]
+        shutil.rmtree(folder)
+    os.makedirs(folder, exist_ok=True)
+    plan["frames"] = FrameSources.count_frames(vf.video_file_path)
+    number_of_segments = max(segments_per_video, -(-(plan["frames"] - 1) // SEGMENT_DIFFERENCES))
+    plan["segments"] = split_frames(plan["frames"], number_of_segments)
+    with open(plan_file, "w") as f:
+        json.dump(plan, f)
+    return folder, plan["frames"], plan["segments"]
+
+
+def count_segment(args):
+    """count_moved_pixels for pool.imap, which passes a single argument"""
+    return count_moved_pixels(*args)
+
+
+def epoch_starts(ftm, number_of_differences):
+    """
+    :return: the first difference of every epoch that starts at or before the end of the video. Difference k is in
+        the epoch its frame_to_time(k) falls in, as it was when the video was read sequentially
+    """
+    start_record_time = ftm.frame_to_time(0)
+    starts = [0]
+    while starts[-1] < number_of_differences:
+        boundary = start_record_time + EPOCH_LENGTH * len(starts)
+        k = max(int(EPOCH_LENGTH.total_seconds() * len(starts) * ftm.fps), starts[-1])
+        while k > starts[-1] and ftm.frame_to_time(k - 1) >= boundary:
+            k -= 1
+        while ftm.frame_to_time(k) < boundary:
+            k += 1
+        starts.append(k)
+    starts = np.array(starts)
+    return starts[starts <= number_of_differences]
+
+
+def stitch_record(ftm, moved_pixels):
+    """
+    :param moved_pixels: moved pixels of every frame difference, in order
+    :return: list of (epoch end datetime, movement pixels) for every epoch
+    """
+    number_of_differences = len(moved_pixels)
+    starts = epoch_starts(ftm, number_of_differences)
+    ends = np.minimum(np.append(starts[1:], number_of_differences), number_of_differences)
+    cumulative = np.concatenate(([0], np.cumsum(moved_pixels)))
+    movement_pixels = cumulative[ends] - cumulative[starts]
+    ftm.set_number_of_frames(number_of_differences)
+    return [(ftm.frame_to_time(int(end)), int(pixels)) for end, pixels in zip(ends, movement_pixels)]
+
 
+class EpochWriter:
+    """
+    Writes the movement files of a video while it's being scored. The epoch boundaries are worked out up front as
+    frame difference indices, from the number of frames in the video, and every epoch is written out as soon as its
+    frame differences are in, so only the differences of the current epoch are held.
+    The files are the same as create_movement_file(stitch_record(...)) writes for the whole video at once
+    """
+    def __init__(self, ftm, number_of_differences, movement_file_paths):
+        self.number_of_differences = number_of_differences
+        self.starts = epoch_starts(ftm, number_of_differences)
+        self.ends = np.append(self.starts[1:], number_of_differences)
+        if number_of_differences == 0:
+            # Nothing to write, and no frame rate to label the epochs with
+            self.starts, self.ends = self.starts[:0], self.ends[:0]
+        # Epochs are labeled with their end, with the frame rate rescaled to the actual number of frames
+        self.ftm = copy.copy(ftm)
+        self.ftm.set_number_of_frames(number_of_differences)
+        self.movement_file_paths = movement_file_paths
+        self.files = [open(path + ".tmp", "w+") for path in movement_file_paths]
+        self.pending = np.zeros((0, len(movement_file_paths)), dtype=np.int64)
+        self.pending_start = 0  # Index of the first difference in pending
+        self.epoch = 0
+
+    def add(self, moved_pixels):
+        """
+        :param moved_pixels: (differences, arenas) array of the next frame differences of the video
         """
-        This code outputs each epoch, along with the number of movement pixels
-        if epochs_from_start % 30 == 0:
-            fourcc = cv2.VideoWriter_fourcc(*'DIVX')
-            size = frames[0].shape[1], frames[0].shape[0]  ## <<<--- NOTICE THIS
-            out = cv2.VideoWriter('Epochs/%s %06.f.avi' % (mouse_number, movement_pixels / 255)
-                                  , fourcc, 12.0, size)
-            for frame in frames:
-                out.write(frame)
-            out.release()
+        self.pending = np.concatenate((self.pending, moved_pixels))
+        self.write_epochs()
+
+    def write_epochs(self):
+        scored = self.pending_start + len(self.pending)
+        last = int(np.searchsorted(self.ends, scored, side="right"))
+        if last <= self.epoch:
+            return
+        cumulative = np.concatenate((np.zeros((1, self.pending.shape[1]), dtype=np.int64), np.cumsum(self.pending, axis=0)))
+        epochs = slice(self.epoch, last)
+        movement_pixels = (cumulative[self.ends[epochs] - self.pending_start] -
+                           cumulative[self.starts[epochs] - self.pending_start])
+        end_times = np.array([self.ftm.frame_to_time(int(end)) for end in self.ends[epochs]], dtype="datetime64[us]")
+        for i, f in enumerate(self.files):
+            f.write(ScoreExport.movement_text(end_times, movement_pixels[:, i]))
+        self.pending = self.pending[self.ends[last - 1] - self.pending_start:]
+        self.pending_start = int(self.ends[last - 1])
+        self.epoch = last
+
+    def close(self):
         """
-        record.append((frame_number, movement_pixels))
-    print("Frame Number", frame_number)
-    print("Predicted Frame Number", predicted_number_frames)
-    ftm.set_number_of_frames(frame_number)
-    modified_record = []
-    for frame_number, movement_pixels in record:
-        modified_record.append((ftm.frame_to_time(frame_number), movement_pixels))
-    create_movement_file(modified_record, vf.movement_file_path)
-    print("Time: %.2f s" % (time.time() - start))
+        :return: False, and nothing is written, if the video didn't have the expected number of frame differences,
+            or had none
+        """
+        complete = 0 < self.pending_start + len(self.pending) == self.number_of_differences
+        if complete:
+            self.write_epochs()
+        for f in self.files:
+            f.close()
+        for path in self.movement_file_paths:
+            if complete:
+                os.replace(path + ".tmp", path)
+            else:
+                os.remove(path + ".tmp")
+        return complete
+
+
+def analyze_videos(videos, processes=None, segments_per_video=None, backend="opencv"):
+    """
+    Splits every video into segments and scores the segments of all the videos in one process pool, so several
+    videos run at once. Every arena of a video is scored from the same decoded frames, and each video's movement
+    files are written epoch by epoch as its segments finish, in order (see EpochWriter)
+    :param segments_per_video: defaults to the number of processes
+    :param backend: frame source (see FrameSources.BACKENDS)
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if segments_per_video is None:
+        segments_per_video = processes
+    start = time.time()
+    with multiprocessing.Pool(processes) as pool:
+        jobs = []
+        for vf in videos:
+            arenas = vf.arenas()
+            masks = [load_mask(mask_file_path) for mask_file_path, _ in arenas.values()]
+            folder, number_of_frames, segments = plan_segments(vf, arenas, backend, segments_per_video)
+            checkpoint_files = [os.path.join(folder, "%i.npz" % a) for a, _ in segments]
+            segments = [(vf.video_file_path, masks, a, b, backend, checkpoint_file)
+                        for (a, b), checkpoint_file in zip(segments, checkpoint_files)]
+            jobs.append((vf, arenas, folder, number_of_frames, checkpoint_files, [segment[2:4] for segment in segments],
+                         pool.imap(count_segment, segments)))
+        for vf, arenas, folder, number_of_frames, checkpoint_files, frame_ranges, job in jobs:
+            mouse_number = os.path.splitext(os.path.basename(vf.video_file_path))[0]
+            print(mouse_number)
+            ftm = FrameToTime(vf.start_time, vf.end_time, vf.framerate, vf.duration)
+            print("Predicted Frame Number", ftm.framerate * ftm.duration.seconds)
+            movement_file_paths = [movement_file_path for _, movement_file_path in arenas.values()]
+            writer = EpochWriter(ftm, max(number_of_frames - 1, 0), movement_file_paths)
+            # imap returns the segments in order, so the epochs are written as the video is scored
+            for _, moved_pixels in job:
+                writer.add(moved_pixels)
+            print("Frame Number", writer.pending_start + len(writer.pending))
+            if not writer.close():
+                # The frame count was off, so the epochs are worked out again from the differences actually scored.
+                # Only the last segment is open-ended, so every other one has to be complete for the differences to
+                # follow on from each other
+                scored = [load_checkpoint(checkpoint_file, len(arenas))[0] for checkpoint_file in checkpoint_files]
+                for (a, b), segment_pixels, checkpoint_file in zip(frame_ranges[:-1], scored, checkpoint_files):
+                    if len(segment_pixels) != b - a:
+                        # Resumed by the next run
+                        save_checkpoint(checkpoint_file, segment_pixels, finished=False)
+                        raise IOError("Only %i of the %i frame differences from frame %i of %s were scored"
+                                      % (len(segment_pixels), b - a, a, vf.video_file_path))
+                moved_pixels = np.concatenate(scored)
+                if len(moved_pixels) == 0:
+                    shutil.rmtree(folder)
+                    raise IOError("No frame differences were scored in %s" % vf.video_file_path)
+                for i, movement_file_path in enumerate(movement_file_paths):
+                    # stitch_record rescales the frame rate, so each arena starts from a copy
+                    create_movement_file(stitch_record(copy.copy(ftm), moved_pixels[:, i]), movement_file_path)
+            shutil.rmtree(folder)
+            print("Time: %.2f s" % (time.time() - start))
+
+
+def analyze_video(vf, processes=None, backend="opencv"):
+    analyze_videos([vf], processes, backend=backend)
 
 
 if __name__ == "__main__":
@@ -238,6 +473,9 @@ if __name__ == "__main__":
     Black corresponds to areas that should not be analyzed, such as other cages, and white is areas that should
     be analyzed
     These masks should be saved as Mouse number Mask.jpg (Ex: 02550 Mask.jpg)
+    If the camera covers several cages, save one mask per cage instead, as Mouse number Mask Arena name.jpg
+    (Ex: 02550 Mask 02551.jpg and 02550 Mask 02552.jpg). Every cage is scored from one pass over the video, into
+    Movement Files/Arena name.tsv
     The program will pause, waiting for input. Once you have finished creating the masks, press enter, and the program
     will continue creating the csv files.
     
@@ -248,6 +486,9 @@ if __name__ == "__main__":
     """
     ap = argparse.ArgumentParser()
     ap.add_argument("-m", "--metadata", help="Path to metadata file")
+    ap.add_argument("-p", "--processes", type=int, default=multiprocessing.cpu_count(), help="Worker processes")
+    ap.add_argument("-b", "--backend", default="opencv", choices=list(FrameSources.BACKENDS),
+                    help="Frame source. ffmpeg decodes straight to small grayscale frames (see FrameSources.py)")
     args = vars(ap.parse_args())
     videos = []
     directory = os.path.dirname(args["metadata"])
@@ -257,6 +498,5 @@ if __name__ == "__main__":
     for vf in videos:
         save_video_still(vf)
     _ = input("After you have finished masking, press enter to continue: ")
-    for vf in videos:
-        if not os.path.exists(vf.movement_file_path):
-            analyze_video(vf)
\ No newline at end of file
+    analyze_videos([vf for vf in videos if not vf.is_scored()], args["processes"],
+                   backend=args["backend"])
\ No newline at end of file
@@ -4,7 +4,37 @@ import matplotlib.pyplot as plt
 import datetime
 import time
 from matplotlib.widgets import TextBox
+import argparse
+import os
+import queue
+import signal
 import threading
+import FrameSources
+
+"""
+Live movement monitor for several cameras.
+Each camera has a grab thread that reads it at a steady cadence and queues every frame with the one before it on a
+shared queue. A pool of worker threads counts the moved pixels between the frames (OpenCV releases the GIL, so they
+run in parallel), and a Recorder sums them into epochs and logs every epoch to "<camera name> <date>.txt", starting a
+new file every day.
+Run without arguments, cameras are picked by clicking on them, and the movement is plotted live. Only the GUI thread
+touches matplotlib.
+Run with --cameras, it records without any windows until it's stopped (Ctrl+C, or SIGTERM when run as a service), from
+the cameras in the given file, which has one line per camera:
+    <camera index>:<camera name>
+With --snapshots, a small JPEG of every camera, "<camera name>.jpg", is kept up to date in the given folder every
+epoch, in place of the live images.
+"""
+
+FRAME_INTERVAL = 1 / 3  # Seconds between the frames compared, for each camera
+EPOCH_LENGTH = datetime.timedelta(seconds=10)
+MOVEMENT_THRESHOLD = 25  # Change in brightness for a pixel to count as moved
+REFRESH_INTERVAL = 200  # Milliseconds between updates of the plots and the logs
+FLUSH_EPOCHS = 6  # Epochs buffered before they are written to the log
+SNAPSHOT_WIDTH = 160
+GRAB_FAILURES = 10  # Failed grabs in a row before a camera is reopened, or its grab thread stops
+REOPEN_INTERVAL = 10  # Seconds between attempts at reopening a camera
+QUEUED_FRAMES = 10  # Frames each camera can have waiting for the workers
 
 
 class Click:
@@ -35,61 +65,324 @@ class Click:
             plt.draw()
 
 
-class Drawer():
-    def __init__(self, ax, camera_ax, cap, file, camera_name):
-        self.ax = ax
-        self.camera_ax = camera_ax
-        self.cap = cap
-        self.movement = []
-        self.last_frame = None
-        self.file = file
-        self.epoch_movements = []
-        self.last_time = None
+class Grabber(threading.Thread):
+    """
+    Reads one camera, or any other FrameSources source. Frames are grabbed as fast as the camera delivers them, so its
+    buffer never holds stale frames, but only one every FRAME_INTERVAL is decoded and queued. The schedule is kept
+    against the clock, so it doesn't drift.
+    After GRAB_FAILURES failed grabs in a row (the camera was unplugged, or the source ended), the source is reopened
+    if it can be, or the thread stops
+    """
+    def __init__(self, camera_name, source, frames, stopped, reopen=None):
+        """
+        :param reopen: function returning the source opened again, or None if it can't be reopened
+        """
+        super().__init__(daemon=True)
         self.camera_name = camera_name
-        self.stopped = False
-        self.start_time = time.time()
+        self.source = source
+        self.frames = frames
+        self.stopped = stopped
+        self.reopen = reopen
+
+    def reopen_source(self):
+        """:return: False if the source can't be reopened, or the monitor was stopped while trying"""
+        self.source.release()
+        self.source = None
+        if self.reopen is None:
+            print("%s stopped sending frames" % self.camera_name)
+            return False
+        print("%s stopped sending frames, reopening it" % self.camera_name)
+        while not self.stopped.wait(REOPEN_INTERVAL):
+            try:
+                self.source = self.reopen()
+                print("%s reopened" % self.camera_name)
+                return True
+            except IOError:
+                pass
+        return False
+
+    def queue_frames(self, item):
+        """Waits for room in the queue, which is bounded so a backlog can't grow without limit"""
+        while not self.stopped.is_set():
+            try:
+                self.frames.put(item, timeout=FRAME_INTERVAL)
+                return
+            except queue.Full:
+                pass
 
     def run(self):
-        if not self.stopped:
-            threading.Timer(0.333, self.run).start()
-        if self.last_time is not None:
-            print("Lag: %.2f" % (time.time() - self.last_time))
-        self.last_time = time.time()
-        ret, frame = self.cap.read()
-        if not ret:
-            print("Invalid frame")
+        last_frame = None
+        index = 0
+        failures = 0
+        next_time = time.monotonic()
+        while not self.stopped.is_set():
+            if not self.source.grab():
+                failures += 1
+                if failures < GRAB_FAILURES:
+                    time.sleep(FRAME_INTERVAL)
+                    continue
+                if not self.reopen_source():
+                    return
+                failures = 0
+                last_frame = None
+                continue
+            failures = 0
+            now = time.monotonic()
+            if now < next_time:
+                continue
+            next_time = max(next_time + FRAME_INTERVAL, now)
+            frame = self.source.retrieve()
+            if frame is None:
+                continue
+            # Some sources (FFmpegFrames) reuse one buffer for every frame, and the frame is kept as the next last_frame
+            frame = frame.copy()
+            if last_frame is not None:
+                self.queue_frames((self.camera_name, index, datetime.datetime.now(), last_frame, frame))
+                index += 1
+            last_frame = frame
+
+
+def count_movement(frames, results):
+    """
+    Worker thread: counts the moved pixels of each queued pair of frames, until it gets None.
+    A pair that can't be differenced (Ex: the camera changed resolution) is still posted, with None moved pixels, so
+    the differences after it aren't held up waiting for it
+    """
+    while True:
+        item = frames.get()
+        if item is None:
             return
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        if self.last_frame is not None:
-            frame_delta = cv2.absdiff(self.last_frame, frame)
-            thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-            moved_pixels = np.sum(thresh) / 255
-            print("%s got frame" % self.camera_name)
-            self.movement.append(moved_pixels)
-            if len(self.movement) > 30:
-                epoch_movement = sum(self.movement)
-                self.movement = []
-                self.file.write("%s,%i\n" % (datetime.datetime.now().strftime("%m/%d/%y %H:%M:%S"), epoch_movement))
-                self.file.flush()
-                self.epoch_movements.append(epoch_movement)
-                time_since_start = (time.time() - self.start_time) / 60
-                xs = np.arange(0, time_since_start, time_since_start / len(self.epoch_movements))
-                self.ax.plot(xs, self.epoch_movements, "r-")
-                self.ax.set_ylabel(self.camera_name)
-                self.camera_ax.imshow(frame, cmap="Greys_r")
-                if len(self.epoch_movements) % 10 == 0:
-                    self.ax.clear()
-                    self.camera_ax.clear()
-        self.last_frame = frame
-        plt.draw()
-
-    def close(self, event):
-        print("Closing")
-        self.file.close()
-        self.stopped = True
+        camera_name, index, frame_time, last_frame, frame = item
+        try:
+            frame_delta = cv2.absdiff(last_frame, frame)
+            thresh = cv2.threshold(frame_delta, MOVEMENT_THRESHOLD, 255, cv2.THRESH_BINARY)[1]
+            moved_pixels = cv2.countNonZero(thresh)
+        except cv2.error as e:
+            print("%s: frame skipped, %s" % (camera_name, e))
+            moved_pixels = None
+        results.put((camera_name, index, frame_time, moved_pixels, frame))
 
 
-if __name__ == "__main__":
+class EpochCounter:
+    """
+    Sums one camera's moved pixels into epochs of EPOCH_LENGTH. The workers can finish out of order, so differences
+    wait here until all the ones grabbed before them are in
+    """
+    def __init__(self, start_time):
+        self.epoch_end = start_time + EPOCH_LENGTH
+        self.next_index = 0
+        self.waiting = {}
+        self.movement = 0
+        self.count = 0
+        self.last_frame = None
+
+    def add(self, index, frame_time, moved_pixels, frame):
+        """
+        :return: list of (epoch end datetime, moved pixels) of the epochs completed by this difference.
+            Epochs without any frames (the camera stopped) are left out, and so are skipped differences (None)
+        """
+        self.waiting[index] = (frame_time, moved_pixels, frame)
+        completed = []
+        while self.next_index in self.waiting:
+            frame_time, moved_pixels, frame = self.waiting.pop(self.next_index)
+            self.next_index += 1
+            if frame_time >= self.epoch_end:
+                if self.count:
+                    completed.append((self.epoch_end, self.movement))
+                self.epoch_end += EPOCH_LENGTH * (1 + (frame_time - self.epoch_end) // EPOCH_LENGTH)
+                self.movement = 0
+                self.count = 0
+            if moved_pixels is not None:
+                self.movement += moved_pixels
+                self.count += 1
+                self.last_frame = frame
+        return completed
+
+
+class EpochLog:
+    """
+    One camera's movement per epoch, in "<camera name> <date>.txt", with a new file every day (by the start of the
+    epoch). Lines are buffered and written every FLUSH_EPOCHS epochs, so few writes are made with many cameras
+    """
+    def __init__(self, camera_name, folder="."):
+        self.camera_name = camera_name
+        self.folder = folder
+        self.file = None
+        self.date = None
+        self.unflushed = 0
+
+    def write(self, epoch_end, movement):
+        date = (epoch_end - EPOCH_LENGTH).date()
+        if date != self.date:
+            self.close()
+            self.date = date
+            file_name = "%s %s.txt" % (self.camera_name, date.strftime("%b %d %Y"))
+            self.file = open(os.path.join(self.folder, file_name), "a+")
+        self.file.write("%s,%i\n" % (epoch_end.strftime("%m/%d/%y %H:%M:%S"), movement))
+        self.unflushed += 1
+        if self.unflushed >= FLUSH_EPOCHS:
+            self.file.flush()
+            self.unflushed = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.unflushed = 0
+
+
+def save_snapshot(frame, file_path, width=SNAPSHOT_WIDTH):
+    """
+    Writes a small JPEG of the frame. The last one is replaced in one step, so a reader never gets a partial image
+    """
+    height = int(frame.shape[0] * width / float(frame.shape[1]))
+    thumbnail = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    temporary_file = os.path.splitext(file_path)[0] + ".tmp.jpg"
+    cv2.imwrite(temporary_file, thumbnail)
+    os.replace(temporary_file, file_path)
+
+
+class Recorder:
+    """
+    Sums the workers' results into epochs, logs them and saves the snapshots. Only used from one thread, the GUI
+    thread or the main thread when headless
+    """
+    def __init__(self, camera_names, results, start_time, log_folder=".", snapshot_folder=None):
+        self.results = results
+        self.snapshot_folder = snapshot_folder
+        self.counters = {camera_name: EpochCounter(start_time) for camera_name in camera_names}
+        self.logs = {camera_name: EpochLog(camera_name, log_folder) for camera_name in camera_names}
+
+    def record(self, timeout=None):
+        """
+        Handles every result that's waiting
+        :param timeout: seconds to wait for a result if none are waiting. Doesn't wait if None
+        :return: list of (camera name, epoch end datetime, moved pixels) of the epochs completed
+        """
+        completed = []
+        block = timeout is not None
+        while True:
+            try:
+                camera_name, index, frame_time, moved_pixels, frame = self.results.get(block, timeout)
+            except queue.Empty:
+                break
+            block = False
+            counter = self.counters[camera_name]
+            for epoch_end, movement in counter.add(index, frame_time, moved_pixels, frame):
+                self.logs[camera_name].write(epoch_end, movement)
+                completed.append((camera_name, epoch_end, movement))
+                if self.snapshot_folder is not None:
+                    save_snapshot(counter.last_frame, os.path.join(self.snapshot_folder, camera_name + ".jpg"))
+        return completed
+
+    def close(self):
+        for log in self.logs.values():
+            log.close()
+
+
+class Renderer:
+    """
+    Runs on a timer of the figure's canvas, so the plots are only touched from the GUI thread.
+    The lines and images are made once and have their data replaced
+    """
+    def __init__(self, fig, axs, recorder, start_time):
+        self.fig = fig
+        self.recorder = recorder
+        self.start_time = start_time
+        self.lines, self.images, self.xs, self.ys = {}, {}, {}, {}
+        for (ax, camera_ax), camera_name in zip(axs, recorder.counters):
+            self.lines[camera_name] = ax.plot([], [], "r-")[0]
+            self.images[camera_name] = (camera_ax, None)
+            self.xs[camera_name], self.ys[camera_name] = [], []
+            ax.set_ylabel(camera_name)
+
+    def update(self):
+        changed = set()
+        for camera_name, epoch_end, movement in self.recorder.record():
+            self.xs[camera_name].append((epoch_end - self.start_time).total_seconds() / 60)
+            self.ys[camera_name].append(movement)
+            changed.add(camera_name)
+        for camera_name in changed:
+            line = self.lines[camera_name]
+            line.set_data(self.xs[camera_name], self.ys[camera_name])
+            line.axes.relim()
+            line.axes.autoscale_view()
+            camera_ax, image = self.images[camera_name]
+            frame = self.recorder.counters[camera_name].last_frame
+            if image is None:
+                self.images[camera_name] = (camera_ax, camera_ax.imshow(frame, cmap="Greys_r", vmin=0, vmax=255))
+            else:
+                image.set_data(frame)
+        if changed:
+            self.fig.canvas.draw_idle()
+
+
+class Monitor:
+    """
+    The grab threads, the worker pool and the queues between them
+    """
+    def __init__(self, sources, workers=None, reopen=None):
+        """
+        :param sources: dictionary of camera name -> FrameSources source, such as FrameSources.CameraFrames.
+            A FrameSources.SyntheticFrames with realtime=True replays the same scene every run
+        :param workers: worker threads, one per camera by default
+        :param reopen: dictionary of camera name -> function opening its source again, for the sources that can be
+        """
+        reopen = reopen or {}
+        self.frames = queue.Queue(maxsize=QUEUED_FRAMES * max(len(sources), 1))
+        self.results = queue.Queue()
+        self.stopped = threading.Event()
+        self.grabbers = [Grabber(camera_name, source, self.frames, self.stopped, reopen.get(camera_name))
+                         for camera_name, source in sources.items()]
+        self.workers = [threading.Thread(target=count_movement, args=(self.frames, self.results), daemon=True)
+                        for _ in range(workers or max(len(sources), 1))]
+
+    def start(self):
+        for thread in self.workers + self.grabbers:
+            thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        for grabber in self.grabbers:
+            grabber.join()
+            if grabber.source is not None:
+                grabber.source.release()
+        for _ in self.workers:
+            self.frames.put(None)
+        for worker in self.workers:
+            worker.join()
+
+
+def camera_reopeners(cameras):
+    """:return: dictionary of camera name -> function opening the camera again, for Monitor"""
+    return {camera_name: (lambda camera_number=camera_number: FrameSources.CameraFrames(camera_number, attempts=1))
+            for camera_number, camera_name in cameras.items()}
+
+
+def epoch_start(now):
+    """:return: now, rounded down to a whole number of epochs since midnight, so every camera's epochs line up"""
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + EPOCH_LENGTH * ((now - midnight) // EPOCH_LENGTH)
+
+
+def read_cameras_file(cameras_file):
+    """:return: dictionary of camera index -> camera name"""
+    cameras = {}
+    with open(cameras_file) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line[0] == "#":
+                continue
+            camera_index, camera_name = line.split(":", 1)
+            cameras[int(camera_index)] = camera_name.strip()
+    return cameras
+
+
+def select_cameras():
+    """
+    Shows every camera, and lets the user name the ones to record by clicking on them
+    :return: dictionary of camera index -> camera name
+    """
     cameras = {}
     for camera_idx in range(6):
         cap = cv2.VideoCapture(camera_idx)
@@ -119,25 +412,75 @@ if __name__ == "__main__":
     plt.suptitle("Click on the correct camera")
     text_box.on_submit(click.submit)
     plt.show()
-    fig, axs = plt.subplots(ncols=len(click.click_values), nrows=2, squeeze=False, gridspec_kw={'width_ratios': [3, 2]})
+    return click.click_values
+
+
+def run_interactive(cameras, log_folder=".", snapshot_folder=None):
+    fig, axs = plt.subplots(nrows=len(cameras), ncols=2, squeeze=False, gridspec_kw={'width_ratios': [3, 2]})
     plt.subplots_adjust(wspace=0, hspace=0)
-    axs[1, 0].set_xlabel("Minutes")
-    for i, (camera_number, camera_name) in enumerate(click.click_values.items()):
+    axs[-1, 0].set_xlabel("Minutes")
+    sources = {}
+    for i, (camera_number, camera_name) in enumerate(cameras.items()):
         print("Camera *%s* is called *%s**" % (camera_number, camera_name))
-        file = open("%s %s.txt" % (camera_name, datetime.datetime.now().strftime("%b %d %Y")), "a+")
-        cap = cv2.VideoCapture(camera_number)
-        while not cap.isOpened():
-            print("%s not opened" % camera_number)
-            cap.release()
-            cap = cv2.VideoCapture(camera_number, cv2.CAP_DSHOW)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 180)
-        drawer = Drawer(axs[i, 0], axs[i, 1], cap, file, camera_name)
+        sources[camera_name] = FrameSources.CameraFrames(camera_number)
         axs[i, 1].set_xticks([])
         axs[i, 1].set_yticks([])
         axs[i, 1].set_xticklabels([])
         axs[i, 1].set_yticklabels([])
-        cid = fig.canvas.mpl_connect("close_event", drawer.close)
-        drawer.run()
+    start_time = epoch_start(datetime.datetime.now())
+    monitor = Monitor(sources, reopen=camera_reopeners(cameras))
+    recorder = Recorder(list(sources), monitor.results, start_time, log_folder, snapshot_folder)
+    renderer = Renderer(fig, axs, recorder, start_time)
+    timer = fig.canvas.new_timer(interval=REFRESH_INTERVAL)
+    timer.add_callback(renderer.update)
+
+    def close(event):
+        print("Closing")
+        timer.stop()
+        monitor.stop()
+        renderer.update()
+        recorder.close()
+
+    cid = fig.canvas.mpl_connect("close_event", close)
+    monitor.start()
+    timer.start()
     plt.tight_layout()
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+
+def run_headless(cameras, log_folder=".", snapshot_folder=None):
+    """
+    Records without any windows, until Ctrl+C or SIGTERM
+    :param cameras: dictionary of camera index -> camera name
+    """
+    sources = {camera_name: FrameSources.CameraFrames(camera_number) for camera_number, camera_name in cameras.items()}
+    monitor = Monitor(sources, reopen=camera_reopeners(cameras))
+    recorder = Recorder(list(sources), monitor.results, epoch_start(datetime.datetime.now()), log_folder, snapshot_folder)
+    signal.signal(signal.SIGTERM, lambda signum, frame: monitor.stopped.set())
+    monitor.start()
+    print("Recording %s" % ", ".join(sources))
+    try:
+        while not monitor.stopped.is_set():
+            recorder.record(timeout=REFRESH_INTERVAL / 1000)
+    except KeyboardInterrupt:
+        pass
+    print("Closing")
+    monitor.stop()
+    recorder.record()
+    recorder.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--cameras", default=None, help="File of <camera index>:<camera name> lines. Records "
+                                                          "without any windows if given")
+    ap.add_argument("-o", "--output", default=".", help="Folder for the movement logs")
+    ap.add_argument("-s", "--snapshots", default=None, help="Folder to keep a JPEG of every camera in")
+    args = vars(ap.parse_args())
+    for folder in [args["output"], args["snapshots"]]:
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+    if args["cameras"]:
+        run_headless(read_cameras_file(args["cameras"]), args["output"], args["snapshots"])
+    else:
+        run_interactive(select_cameras(), args["output"], args["snapshots"])